@@ -128,6 +128,7 @@ CREATE TABLE attendance_records (
     id SERIAL PRIMARY KEY,
     employee_id INTEGER NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
     check_in_time TIMESTAMP NOT NULL,
+    check_in_date DATE NOT NULL, -- work date of check_in_time, kept for index seeks
     check_out_time TIMESTAMP,
     method VARCHAR(20) NOT NULL, -- face, fingerprint, manual, card
     device_id INTEGER REFERENCES devices(id),
@@ -142,9 +143,69 @@ CREATE TABLE attendance_records (
     is_override BOOLEAN DEFAULT FALSE,
     override_reason TEXT,
     override_by INTEGER REFERENCES users(id),
+    geofence_id INTEGER, -- fence the check-in fell inside (FK added after geofences)
+    geofence_status VARCHAR(20), -- inside, outside, no_location, unrestricted
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Attendance Daily Rollup (one row per employee per work date, maintained on every punch)
+CREATE TABLE attendance_daily (
+    id SERIAL PRIMARY KEY,
+    employee_id INTEGER NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+    work_date DATE NOT NULL,
+    first_in TIMESTAMP NOT NULL,
+    last_out TIMESTAMP, -- latest check-out of the day
+    worked_minutes INTEGER DEFAULT 0, -- closed sessions only
+    late_minutes INTEGER DEFAULT 0, -- of the day's first check-in
+    early_minutes INTEGER DEFAULT 0, -- of the day's last check-out
+    status VARCHAR(20), -- of the day's first check-in: on_time, late
+    sessions INTEGER DEFAULT 0,
+    open_sessions INTEGER DEFAULT 0, -- still clocked in
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(employee_id, work_date)
+);
+
+-- Attendance Cube (additive measures per department x position x work date, for reports)
+CREATE TABLE attendance_cube (
+    id SERIAL PRIMARY KEY,
+    work_date DATE NOT NULL,
+    department_id INTEGER NOT NULL DEFAULT 0, -- 0 = no department (derived table, no FK)
+    position_id INTEGER NOT NULL DEFAULT 0, -- 0 = no position
+    headcount INTEGER DEFAULT 0, -- active employees
+    expected INTEGER DEFAULT 0, -- scheduled to work and not on leave
+    attended INTEGER DEFAULT 0, -- expected and present
+    present INTEGER DEFAULT 0, -- checked in at all (rest days included)
+    late INTEGER DEFAULT 0,
+    late_minutes INTEGER DEFAULT 0,
+    worked_minutes INTEGER DEFAULT 0,
+    overtime_minutes INTEGER DEFAULT 0, -- beyond the scheduled shift (all of it on rest days)
+    leave_days DECIMAL(8,2) DEFAULT 0, -- approved leave
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(work_date, department_id, position_id)
+);
+
+-- Work dates whose cube cells must be recomputed (queued by attendance and leave writes)
+CREATE TABLE attendance_cube_dirty_days (
+    id SERIAL PRIMARY KEY,
+    work_date DATE NOT NULL UNIQUE,
+    revision INTEGER NOT NULL DEFAULT 1 -- bumped each time a write queues the date again
+);
+
+-- Device Punches Table (idempotency log of punches synced from devices)
+CREATE TABLE device_punches (
+    id SERIAL PRIMARY KEY,
+    idempotency_key VARCHAR(64) NOT NULL UNIQUE, -- generated by the device
+    device_id INTEGER REFERENCES devices(id),
+    employee_id INTEGER REFERENCES employees(id) ON DELETE CASCADE,
+    event_type VARCHAR(20) NOT NULL, -- check_in, check_out
+    punched_at TIMESTAMP NOT NULL, -- device clock (UTC)
+    method VARCHAR(20),
+    status VARCHAR(20) NOT NULL, -- accepted, rejected
+    detail VARCHAR(255),
+    attendance_record_id INTEGER REFERENCES attendance_records(id),
+    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Leave Types Table
 CREATE TABLE leave_types (
     id SERIAL PRIMARY KEY,
@@ -308,6 +369,7 @@ CREATE TABLE geofences (
     center_lat DECIMAL(10,8) NOT NULL,
     center_lng DECIMAL(11,8) NOT NULL,
     radius_meters INTEGER NOT NULL,
+    polygon JSONB, -- optional [[lat, lng], ...] outline inside the radius
     department_id INTEGER REFERENCES departments(id),
     is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
@@ -322,6 +384,8 @@ CREATE TABLE employee_geofences (
     UNIQUE(employee_id, geofence_id)
 );
 
+ALTER TABLE attendance_records ADD CONSTRAINT fk_attendance_geofence FOREIGN KEY (geofence_id) REFERENCES geofences(id);
+
 -- Authentication Policies Table
 CREATE TABLE auth_policies (
     id SERIAL PRIMARY KEY,
@@ -337,7 +401,7 @@ CREATE TABLE auth_policies (
 -- Anomaly Detections Table
 CREATE TABLE anomaly_detections (
     id SERIAL PRIMARY KEY,
-    type VARCHAR(50) NOT NULL, -- duplicate_checkin, impossible_travel, cross_device, etc.
+    type VARCHAR(50) NOT NULL, -- buddy_punching, impossible_travel, unusual_hours, low_confidence
     employee_id INTEGER REFERENCES employees(id),
     attendance_record_id INTEGER REFERENCES attendance_records(id),
     severity VARCHAR(20), -- low, medium, high, critical
@@ -354,10 +418,14 @@ CREATE INDEX idx_employees_department ON employees(department_id);
 CREATE INDEX idx_employees_status ON employees(status);
 CREATE INDEX idx_employees_employee_id ON employees(employee_id);
 
-CREATE INDEX idx_attendance_employee_date ON attendance_records(employee_id, DATE(check_in_time));
+CREATE INDEX idx_attendance_employee_check_in_date ON attendance_records(employee_id, check_in_date);
+CREATE INDEX idx_attendance_check_in_date ON attendance_records(check_in_date);
 CREATE INDEX idx_attendance_check_in_time ON attendance_records(check_in_time);
+CREATE INDEX idx_attendance_check_in_time_id ON attendance_records(check_in_time, id);
+CREATE INDEX idx_attendance_employee_check_in_time_id ON attendance_records(employee_id, check_in_time, id);
 CREATE INDEX idx_attendance_method ON attendance_records(method);
 CREATE INDEX idx_attendance_status ON attendance_records(status);
+CREATE INDEX idx_attendance_daily_work_date ON attendance_daily(work_date);
 
 CREATE INDEX idx_biometric_employee_type ON biometric_templates(employee_id, template_type);
 CREATE INDEX idx_biometric_hash ON biometric_templates(template_hash);
@@ -366,11 +434,16 @@ CREATE INDEX idx_biometric_active ON biometric_templates(is_active);
 CREATE INDEX idx_payroll_employee_period ON payroll_records(employee_id, period_start, period_end);
 CREATE INDEX idx_payroll_period ON payroll_records(payroll_period_id);
 CREATE INDEX idx_payroll_status ON payroll_records(status);
+CREATE INDEX idx_payroll_period_start_id ON payroll_records(period_start, id);
+CREATE INDEX idx_payroll_employee_period_start_id ON payroll_records(employee_id, period_start, id);
 
 CREATE INDEX idx_leave_employee_status ON leave_requests(employee_id, status);
 CREATE INDEX idx_leave_dates ON leave_requests(start_date, end_date);
 CREATE INDEX idx_leave_status ON leave_requests(status);
 
+CREATE INDEX idx_anomaly_status_created ON anomaly_detections(status, created_at);
+CREATE INDEX idx_anomaly_employee_created ON anomaly_detections(employee_id, created_at);
+
 CREATE INDEX idx_schedule_employee_date ON schedules(employee_id, date);
 CREATE INDEX idx_schedule_date ON schedules(date);
 
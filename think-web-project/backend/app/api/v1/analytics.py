@@ -1,14 +1,18 @@
 """
 Analytics endpoints
 """
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import case, func
+from typing import Optional
 from datetime import date, timedelta
 
-from app.database.connection import get_db
-from app.database.models import AttendanceRecord, Employee, User
+from app.database.connection import get_db, run_db
+from app.database.models import AttendanceDaily, AttendanceRecord, Employee, User
 from app.core.security import get_current_user, require_role
+from app.core.analytics.cube import GRANULARITIES, GROUPS, METRICS, cube_cache, refresh_pending, timeseries
+from app.core.analytics.dashboard import cached_dashboard_counts
+from app.core.analytics.heatmap import arrival_heatmap
 
 router = APIRouter()
 
@@ -18,45 +22,102 @@ async def get_dashboard_stats(
     current_user: User = Depends(require_role(["super_admin", "hr_admin", "manager"]))
 ):
     """Get dashboard statistics"""
-    today = date.today()
-    
-    # Total employees
-    total_employees = db.query(Employee).filter(Employee.status == "active").count()
+    # One aggregate query, cached until attendance or leave data changes
+    return cached_dashboard_counts(db)
+
+@router.get("/attendance-summary")
+async def get_attendance_summary(
+    start_date: date = Query(...),
+    end_date: date = Query(...),
+    group_by: str = Query("employee", description="employee or department"),
+    department_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin", "manager"]))
+):
+    """Days present, late days and minutes, and hours worked per employee or department"""
+    if group_by not in ("employee", "department"):
+        raise HTTPException(status_code=400, detail="group_by must be employee or department")
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
     
-    # Today's attendance
-    today_checked_in = db.query(AttendanceRecord).filter(
-        func.date(AttendanceRecord.check_in_time) == today
-    ).count()
+    # Read from the daily rollup: one compact row per employee per day
+    key = AttendanceDaily.employee_id if group_by == "employee" else Employee.department_id
+    query = db.query(
+        key.label("key"),
+        func.count(AttendanceDaily.id).label("days_present"),
+        func.sum(case((AttendanceDaily.status == "late", 1), else_=0)).label("late_days"),
+        func.coalesce(func.sum(AttendanceDaily.late_minutes), 0).label("late_minutes"),
+        func.coalesce(func.sum(AttendanceDaily.early_minutes), 0).label("early_minutes"),
+        func.coalesce(func.sum(AttendanceDaily.worked_minutes), 0).label("worked_minutes")
+    ).join(
+        Employee, Employee.id == AttendanceDaily.employee_id
+    ).filter(
+        AttendanceDaily.work_date >= start_date,
+        AttendanceDaily.work_date <= end_date
+    )
+    if department_id:
+        query = query.filter(Employee.department_id == department_id)
     
-    # Late arrivals today
-    late_today = db.query(AttendanceRecord).filter(
-        func.date(AttendanceRecord.check_in_time) == today,
-        AttendanceRecord.status == "late"
-    ).count()
+    return [
+        {
+            f"{group_by}_id": row.key,
+            "days_present": row.days_present,
+            "late_days": row.late_days,
+            "late_minutes": row.late_minutes,
+            "early_minutes": row.early_minutes,
+            "hours_worked": round(row.worked_minutes / 60, 2)
+        }
+        for row in query.group_by(key).order_by(key)
+    ]
+
+@router.get("/timeseries")
+async def get_timeseries(
+    start_date: date = Query(...),
+    end_date: date = Query(...),
+    metric: str = Query("attendance_rate", description="attendance_rate, late_rate, present_days, late_minutes, worked_hours, overtime_hours or leave_days"),
+    granularity: str = Query("day", description="day, week or month"),
+    group_by: str = Query("none", description="none, department or position"),
+    department_id: Optional[int] = Query(None),
+    position_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin", "manager"]))
+):
+    """Attendance, lateness, overtime and leave trends per day, week or month from the analytics cube"""
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric; use one of: {', '.join(METRICS)}")
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail="granularity must be day, week or month")
+    if group_by not in GROUPS:
+        raise HTTPException(status_code=400, detail="group_by must be none, department or position")
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
     
-    # On leave (mock - would need leave requests table)
-    on_leave = 0
+    def load():
+        # Recompute dates queued by attendance and leave writes, then answer from the cube
+        refresh_pending(db)
+        key = ("timeseries", metric, start_date, end_date, granularity, group_by, department_id, position_id)
+        return cube_cache.get_or_load(key, lambda: timeseries(
+            db, metric, start_date, end_date, granularity=granularity, group_by=group_by,
+            department_id=department_id, position_id=position_id
+        ))
     
-    # Absent
-    absent = total_employees - today_checked_in - on_leave
+    # The refresh can recompute up to a year of dates; keep it off the event loop where the pool allows
+    return await run_db(load)
+
+@router.get("/arrival-heatmap")
+async def get_arrival_heatmap(
+    start_date: date = Query(...),
+    end_date: date = Query(...),
+    department_id: Optional[int] = Query(None),
+    location: Optional[str] = Query(None, description="Device location (site)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin", "manager"]))
+):
+    """Check-in counts and late rates by weekday and hour, arrival percentiles and late-rate curves"""
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
     
-    return {
-        "total_employees": total_employees,
-        "present": today_checked_in,
-        "late": late_today,
-        "on_leave": on_leave,
-        "absent": absent
-    }
-
-
-
-
-
-
-
-
-
-
-
-
-
+    # Months missing from the cache are read and binned off the event loop where the pool allows
+    return await run_db(
+        arrival_heatmap, db, start_date, end_date, department_id=department_id, location=location
+    )
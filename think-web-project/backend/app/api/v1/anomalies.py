@@ -0,0 +1,100 @@
+"""
+Attendance anomaly endpoints
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+from app.database.connection import get_db
+from app.database.models import AnomalyDetection, User
+from app.core.security import require_role
+
+router = APIRouter()
+
+REVIEW_STATUSES = ("reviewed", "resolved", "false_positive")
+
+class AnomalyReview(BaseModel):
+    status: str  # reviewed, resolved, false_positive
+    resolution_notes: Optional[str] = None
+
+class AnomalyResponse(BaseModel):
+    id: int
+    type: str
+    employee_id: Optional[int]
+    attendance_record_id: Optional[int]
+    severity: Optional[str]
+    description: Optional[str]
+    status: Optional[str]
+    reviewed_by: Optional[int]
+    reviewed_at: Optional[datetime]
+    resolution_notes: Optional[str]
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+@router.get("/", response_model=List[AnomalyResponse])
+async def get_anomalies(
+    status: Optional[str] = Query(None, description="pending, reviewed, resolved or false_positive"),
+    type: Optional[str] = Query(None, description="buddy_punching, impossible_travel, unusual_hours or low_confidence"),
+    severity: Optional[str] = Query(None),
+    employee_id: Optional[int] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin", "manager"]))
+):
+    """Get anomaly findings, newest first"""
+    query = db.query(AnomalyDetection)
+    if status:
+        query = query.filter(AnomalyDetection.status == status)
+    if type:
+        query = query.filter(AnomalyDetection.type == type)
+    if severity:
+        query = query.filter(AnomalyDetection.severity == severity)
+    if employee_id:
+        query = query.filter(AnomalyDetection.employee_id == employee_id)
+    
+    return query.order_by(AnomalyDetection.created_at.desc(), AnomalyDetection.id.desc()).offset(skip).limit(limit).all()
+
+@router.get("/summary")
+async def get_anomaly_summary(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin", "manager"]))
+):
+    """Finding counts by type and severity, and by status"""
+    by_type = {}
+    for kind, severity, count in db.query(
+        AnomalyDetection.type, AnomalyDetection.severity, func.count(AnomalyDetection.id)
+    ).filter(AnomalyDetection.status == "pending").group_by(AnomalyDetection.type, AnomalyDetection.severity):
+        by_type.setdefault(kind, {})[severity] = count
+    
+    by_status = dict(db.query(AnomalyDetection.status, func.count(AnomalyDetection.id)).group_by(AnomalyDetection.status).all())
+    return {"pending_by_type": by_type, "by_status": by_status}
+
+@router.put("/{anomaly_id}/review", response_model=AnomalyResponse)
+async def review_anomaly(
+    anomaly_id: int,
+    review: AnomalyReview,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Record the outcome of reviewing a finding"""
+    if review.status not in REVIEW_STATUSES:
+        raise HTTPException(status_code=400, detail="status must be reviewed, resolved or false_positive")
+    
+    anomaly = db.get(AnomalyDetection, anomaly_id)
+    if not anomaly:
+        raise HTTPException(status_code=404, detail="Anomaly not found")
+    
+    anomaly.status = review.status
+    anomaly.resolution_notes = review.resolution_notes
+    anomaly.reviewed_by = current_user.id
+    anomaly.reviewed_at = datetime.utcnow()
+    db.commit()
+    db.refresh(anomaly)
+    
+    return anomaly
@@ -1,16 +1,38 @@
 """
 Attendance management endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, UploadFile, File, Form
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import and_
 from pydantic import BaseModel
 from typing import Optional, List
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, timedelta, timezone
+import json
+import uuid
 
-from app.database.connection import get_db
-from app.database.models import AttendanceRecord, Employee, Schedule, User
+from app.database.connection import get_db, run_db
+from app.database.models import AttendanceRecord, Device, DevicePunch, Employee, User
 from app.core.security import get_current_user, require_role
+from app.core.config import settings
+from app.core.analytics.anomaly_detection import PunchObservation, anomaly_engine
+from app.core.biometrics.batching import face_batcher
+from app.core.biometrics.fingerprint import MAX_MINUTIAE, match_scores, minutiae_from_points
+from app.core.biometrics.matching import employee_face_templates, employee_fingerprint_templates
+from app.core.attendance.archive import attendance_archive, hot_window_start
+from app.core.attendance.export import FORMATS, archived_export_rows, export_statement, stream_export
+from app.core.attendance.geofence import geofence_index
+from app.core.attendance.presence import presence
+from app.core.attendance.rollup import refresh_days
+from app.core.attendance.rules import STATUSES, check_in_status, departure_minutes_early, is_overnight
+from app.core.attendance.schedules import schedule_snapshot
+from app.core.attendance.sync import Punch, ingest_punches
+from app.core.attendance.write_behind import write_behind
+from app.core.devices import device_event
+from app.core.events import broadcaster, punch_event
+from app.core.pagination import decode_cursor, encode_cursor, keyset_page, set_next_cursor
+from app.core.uploads import read_upload
 
 router = APIRouter()
 
@@ -39,6 +61,60 @@ class AttendanceResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class AttendanceOverride(BaseModel):
+    check_in_time: Optional[datetime] = None  # Naive values are taken as UTC
+    check_out_time: Optional[datetime] = None
+    status: Optional[str] = None  # Replaces the computed status
+    reason: str
+
+class DevicePunchIn(BaseModel):
+    idempotency_key: str  # Generated by the device, unique per punch
+    employee_id: int
+    event_type: str  # check_in, check_out
+    timestamp: datetime  # Device clock; naive values are taken as UTC
+    method: str = "face"
+    confidence_score: Optional[float] = None
+    location_lat: Optional[float] = None
+    location_lng: Optional[float] = None
+
+class DeviceSyncRequest(BaseModel):
+    device_id: Optional[int] = None
+    punches: List[DevicePunchIn]
+
+class DevicePunchResult(BaseModel):
+    idempotency_key: str
+    status: str  # accepted, rejected
+    replayed: bool
+    attendance_id: Optional[int] = None
+    detail: Optional[str] = None
+
+class PunchStatus(BaseModel):
+    idempotency_key: str
+    status: str  # queued, accepted, rejected, failed
+    attendance_id: Optional[int] = None
+    detail: Optional[str] = None
+
+class DeviceSyncResponse(BaseModel):
+    accepted: int
+    rejected: int
+    replayed: int
+    results: List[DevicePunchResult]
+
+def _utc_naive(value: datetime) -> datetime:
+    """Timestamps are stored as naive UTC"""
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+def _queued_response(punch: Punch, **fields) -> JSONResponse:
+    """202 for a punch accepted into the write-behind queue"""
+    return JSONResponse(status_code=202, content={
+        "queued": True,
+        "idempotency_key": punch.idempotency_key,
+        "employee_id": punch.employee_id,
+        "event_type": punch.event_type,
+        "punched_at": punch.punched_at.isoformat(),
+        **fields
+    })
+
 @router.post("/check-in", response_model=AttendanceResponse)
 async def check_in(
     employee_id: int = Form(...),
@@ -47,6 +123,7 @@ async def check_in(
     location_lat: Optional[float] = Form(None),
     location_lng: Optional[float] = Form(None),
     image: Optional[UploadFile] = File(None),
+    minutiae: Optional[str] = Form(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -56,46 +133,80 @@ async def check_in(
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
-    # Check if already checked in today
+    # Check if already checked in today (O(1) presence lookup, plus punches still queued)
     today = date.today()
-    existing = db.query(AttendanceRecord).filter(
-        and_(
-            AttendanceRecord.employee_id == employee_id,
-            func.date(AttendanceRecord.check_in_time) == today,
-            AttendanceRecord.check_out_time.is_(None)
-        )
-    ).first()
-    
-    if existing:
+    if presence.open_record(db, employee_id) or write_behind.pending_event(employee_id) == "check_in":
         raise HTTPException(status_code=400, detail="Already checked in today")
     
-    # TODO: Verify biometric if method is face or fingerprint
+    # Check the location against the employee's geofences (in-memory index)
+    geofence_index.ensure_loaded(db)
+    geofence = geofence_index.check(employee_id, employee.department_id, location_lat, location_lng)
+    if settings.GEOFENCE_ENFORCE:
+        if geofence.status == "no_location":
+            raise HTTPException(status_code=400, detail="Location is required to check in")
+        if geofence.status == "outside":
+            raise HTTPException(status_code=403, detail="Check-in location is outside your assigned geofences")
+    
     confidence_score = None
     liveness_score = None
     
+    if method == "fingerprint" and minutiae:
+        # Scanner sends its extracted minutiae as a JSON list of points
+        try:
+            probe = minutiae_from_points(json.loads(minutiae))
+        except (ValueError, TypeError, KeyError):
+            raise HTTPException(status_code=400, detail="Invalid minutiae")
+        if len(probe) < settings.FINGERPRINT_MIN_MINUTIAE:
+            raise HTTPException(status_code=400, detail="Not enough minutiae, please rescan the finger")
+        if len(probe) > MAX_MINUTIAE:
+            raise HTTPException(status_code=400, detail="Too many minutiae")
+        
+        stored = employee_fingerprint_templates(db, employee_id)
+        if stored is None:
+            raise HTTPException(status_code=404, detail="No fingerprint template enrolled for this employee")
+        # Scoring every enrolled finger is CPU-bound; keep it off the event loop
+        confidence_score = float((await run_in_threadpool(match_scores, probe, *stored)).max())
+        if confidence_score < settings.FINGERPRINT_MATCH_THRESHOLD:
+            raise HTTPException(status_code=401, detail="Fingerprint verification failed")
+    
     if method == "face" and image:
-        # In production, call face verification service
-        confidence_score = 0.95  # Mock
-        liveness_score = 0.90  # Mock
-    
-    # Get today's schedule
-    schedule = db.query(Schedule).filter(
-        and_(
-            Schedule.employee_id == employee_id,
-            Schedule.date == today
+        # Face analysis is batched with concurrent punches and runs off the event loop
+        stored_embeddings = employee_face_templates(db, employee_id)
+        if stored_embeddings is None:
+            raise HTTPException(status_code=404, detail="No face template enrolled for this employee")
+        analysis = await face_batcher.submit(await read_upload(image), stored_embeddings)
+        if analysis.embedding is None:
+            raise HTTPException(status_code=400, detail="No face detected")
+        if not analysis.is_live:
+            raise HTTPException(status_code=400, detail="Liveness check failed")
+        
+        liveness_score = analysis.liveness_score
+        confidence_score = analysis.similarity
+        if confidence_score is not None and confidence_score < settings.FACE_MATCH_THRESHOLD:
+            raise HTTPException(status_code=401, detail="Face verification failed")
+    
+    if write_behind.running:
+        # Acknowledge now; status and lateness are settled when the next group commits
+        punch = Punch(
+            idempotency_key=uuid.uuid4().hex,
+            employee_id=employee_id,
+            event_type="check_in",
+            punched_at=datetime.utcnow(),
+            method=method,
+            confidence_score=confidence_score,
+            location_lat=location_lat,
+            location_lng=location_lng,
+            liveness_score=liveness_score
         )
-    ).first()
+        await write_behind.submit(punch, device_id)
+        return _queued_response(punch)
+    
+    # Get today's schedule (per-day snapshot, falls back to the department shift)
+    schedule = schedule_snapshot.get(db, employee_id, today)
     
     # Determine status
     check_in_time = datetime.utcnow()
-    status = "on_time"
-    minutes_late = 0
-    
-    if schedule and schedule.start_time:
-        scheduled_start = datetime.combine(today, schedule.start_time)
-        if check_in_time > scheduled_start:
-            minutes_late = int((check_in_time - scheduled_start).total_seconds() / 60)
-            status = "late" if minutes_late > 5 else "on_time"
+    status, minutes_late = check_in_status(check_in_time, today, schedule)
     
     # Create attendance record
     attendance = AttendanceRecord(
@@ -108,13 +219,26 @@ async def check_in(
         confidence_score=confidence_score,
         liveness_score=liveness_score,
         status=status,
-        minutes_late=minutes_late
+        minutes_late=minutes_late,
+        geofence_id=geofence.geofence_id,
+        geofence_status=geofence.status
     )
     
     db.add(attendance)
+    refresh_days(db, [(employee_id, attendance.check_in_date)])
     db.commit()
     db.refresh(attendance)
     
+    presence.check_in(employee_id, attendance.id, attendance.check_in_date, status == "late")
+    broadcaster.publish("punch", punch_event(
+        "check_in", employee_id, attendance.id, check_in_time, method=method, device_id=device_id, status=status
+    ))
+    anomaly_engine.observe(PunchObservation(
+        attendance.id, employee_id, "check_in", check_in_time, method=method, device_id=device_id,
+        location_lat=location_lat, location_lng=location_lng,
+        confidence_score=confidence_score, liveness_score=liveness_score
+    ))
+    
     return attendance
 
 @router.post("/check-out", response_model=AttendanceResponse)
@@ -127,6 +251,26 @@ async def check_out(
     current_user: User = Depends(get_current_user)
 ):
     """Record employee check-out"""
+    if write_behind.running and not attendance_id:
+        # Open check-in is either committed (presence), still queued, or yesterday's overnight shift
+        pending = write_behind.pending_event(employee_id)
+        if pending == "check_out" or (
+            pending is None
+            and not presence.open_record(db, employee_id)
+            and not is_overnight(schedule_snapshot.get(db, employee_id, date.today() - timedelta(days=1)))
+        ):
+            raise HTTPException(status_code=404, detail="No active check-in found")
+        
+        punch = Punch(
+            idempotency_key=uuid.uuid4().hex,
+            employee_id=employee_id,
+            event_type="check_out",
+            punched_at=datetime.utcnow(),
+            method=method
+        )
+        await write_behind.submit(punch)
+        return _queued_response(punch)
+    
     # Find attendance record
     if attendance_id:
         attendance = db.query(AttendanceRecord).filter(
@@ -136,15 +280,18 @@ async def check_out(
             )
         ).first()
     else:
-        # Find today's check-in
-        today = date.today()
-        attendance = db.query(AttendanceRecord).filter(
-            and_(
+        # Find today's open check-in through the presence registry
+        record_id = presence.open_record(db, employee_id)
+        attendance = db.get(AttendanceRecord, record_id) if record_id else None
+        
+        # An overnight shift started yesterday is still open after midnight
+        yesterday = date.today() - timedelta(days=1)
+        if not attendance and is_overnight(schedule_snapshot.get(db, employee_id, yesterday)):
+            attendance = db.query(AttendanceRecord).filter(
                 AttendanceRecord.employee_id == employee_id,
-                func.date(AttendanceRecord.check_in_time) == today,
+                AttendanceRecord.check_in_date == yesterday,
                 AttendanceRecord.check_out_time.is_(None)
-            )
-        ).first()
+            ).order_by(AttendanceRecord.check_in_time.desc()).first()
     
     if not attendance:
         raise HTTPException(status_code=404, detail="No active check-in found")
@@ -152,62 +299,243 @@ async def check_out(
     # Update attendance record
     attendance.check_out_time = datetime.utcnow()
     
-    # Calculate work duration
+    # Calculate work duration and early departure against the work date's schedule
     if attendance.check_in_time and attendance.check_out_time:
         duration = attendance.check_out_time - attendance.check_in_time
         attendance.work_duration_minutes = int(duration.total_seconds() / 60)
+    attendance.minutes_early = departure_minutes_early(
+        attendance.check_out_time,
+        attendance.check_in_date,
+        schedule_snapshot.get(db, employee_id, attendance.check_in_date)
+    )
     
+    refresh_days(db, [(attendance.employee_id, attendance.check_in_date)])
     db.commit()
     db.refresh(attendance)
     
+    presence.check_out(employee_id, attendance.id, attendance.check_in_date)
+    broadcaster.publish("punch", punch_event(
+        "check_out", employee_id, attendance.id, attendance.check_out_time, method=method, device_id=attendance.device_id
+    ))
+    anomaly_engine.observe(PunchObservation(attendance.id, employee_id, "check_out", attendance.check_out_time, method=method))
+    
+    return attendance
+
+@router.post("/sync", response_model=DeviceSyncResponse)
+async def sync_device_punches(
+    request: DeviceSyncRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Ingest punches buffered by a device while offline (idempotent, safe to resend)"""
+    if len(request.punches) > settings.ATTENDANCE_SYNC_MAX_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.ATTENDANCE_SYNC_MAX_BATCH} punches per sync request"
+        )
+    
+    device = None
+    if request.device_id is not None:
+        device = db.get(Device, request.device_id)
+        if not device:
+            raise HTTPException(status_code=404, detail="Device not found")
+        was_online = device.status == "online"
+    
+    for punch in request.punches:
+        if not punch.idempotency_key or len(punch.idempotency_key) > 64:
+            raise HTTPException(status_code=400, detail="idempotency_key must be 1-64 characters")
+    
+    punches = [
+        Punch(
+            idempotency_key=punch.idempotency_key,
+            employee_id=punch.employee_id,
+            event_type=punch.event_type,
+            punched_at=_utc_naive(punch.timestamp),
+            method=punch.method,
+            confidence_score=punch.confidence_score,
+            location_lat=punch.location_lat,
+            location_lng=punch.location_lng
+        )
+        for punch in request.punches
+    ]
+    
+    # Bulk lookups and writes run off the event loop (on it for SQLite)
+    results = await run_db(ingest_punches, db, punches, request.device_id)
+    
+    # Syncing counts as a heartbeat (ingestion marked the device online)
+    if device is not None and not was_online:
+        db.refresh(device)
+        broadcaster.publish("device", device_event(device))
+    
+    return {
+        "accepted": sum(1 for result in results if result["status"] == "accepted" and not result["replayed"]),
+        "rejected": sum(1 for result in results if result["status"] == "rejected" and not result["replayed"]),
+        "replayed": sum(1 for result in results if result["replayed"]),
+        "results": results
+    }
+
+@router.get("/punches/{idempotency_key}", response_model=PunchStatus)
+async def get_punch_status(
+    idempotency_key: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Outcome of a queued (202) or synced punch, by its idempotency key"""
+    pending = write_behind.punch_status(idempotency_key)
+    if pending:
+        return {"idempotency_key": idempotency_key, **pending}
+    
+    punch = db.query(DevicePunch).filter(DevicePunch.idempotency_key == idempotency_key).first()
+    if not punch:
+        raise HTTPException(status_code=404, detail="Punch not found")
+    return {
+        "idempotency_key": idempotency_key,
+        "status": punch.status,
+        "attendance_id": punch.attendance_record_id,
+        "detail": punch.detail
+    }
+
+@router.put("/{attendance_id}/override", response_model=AttendanceResponse)
+async def override_attendance(
+    attendance_id: int,
+    override: AttendanceOverride,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Correct an attendance record's times or status (HR override)"""
+    attendance = db.get(AttendanceRecord, attendance_id)
+    if not attendance:
+        raise HTTPException(status_code=404, detail="Attendance record not found")
+    if not override.reason.strip():
+        raise HTTPException(status_code=400, detail="An override reason is required")
+    if override.status and override.status not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of: {', '.join(STATUSES)}")
+    
+    previous_day = attendance.check_in_date
+    check_in_time = _utc_naive(override.check_in_time) if override.check_in_time else attendance.check_in_time
+    check_out_time = _utc_naive(override.check_out_time) if override.check_out_time else attendance.check_out_time
+    if check_out_time and check_out_time < check_in_time:
+        raise HTTPException(status_code=400, detail="check_out_time must not be before check_in_time")
+    if check_in_time.date() < hot_window_start():
+        raise HTTPException(status_code=400, detail="check_in_time falls in an archived month")
+    
+    # Lateness, early departure and duration follow the corrected times
+    attendance.check_in_time = check_in_time
+    schedule = schedule_snapshot.get(db, attendance.employee_id, attendance.check_in_date)
+    attendance.status, attendance.minutes_late = check_in_status(check_in_time, attendance.check_in_date, schedule)
+    if check_out_time:
+        attendance.check_out_time = check_out_time
+        attendance.work_duration_minutes = int((check_out_time - check_in_time).total_seconds() / 60)
+        attendance.minutes_early = departure_minutes_early(check_out_time, attendance.check_in_date, schedule)
+    if override.status:
+        attendance.status = override.status
+    
+    attendance.is_override = True
+    attendance.override_reason = override.reason
+    attendance.override_by = current_user.id
+    
+    refresh_days(db, [(attendance.employee_id, previous_day), (attendance.employee_id, attendance.check_in_date)])
+    db.commit()
+    db.refresh(attendance)
+    
+    # Corrections to today's records change who is clocked in or late
+    if date.today() in (previous_day, attendance.check_in_date):
+        presence.load(db)
+    
     return attendance
 
 @router.get("/", response_model=List[AttendanceResponse])
 async def get_attendance(
+    response: Response,
     employee_id: Optional[int] = Query(None),
     start_date: Optional[date] = Query(None),
     end_date: Optional[date] = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page; replaces skip"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get attendance records"""
+    """Get attendance records (newest first; follow X-Next-Cursor to page)"""
     query = db.query(AttendanceRecord)
     
     if employee_id:
         query = query.filter(AttendanceRecord.employee_id == employee_id)
     
     if start_date:
-        query = query.filter(func.date(AttendanceRecord.check_in_time) >= start_date)
+        query = query.filter(AttendanceRecord.check_in_date >= start_date)
     
     if end_date:
-        query = query.filter(func.date(AttendanceRecord.check_in_time) <= end_date)
+        query = query.filter(AttendanceRecord.check_in_date <= end_date)
     
-    records = query.order_by(AttendanceRecord.check_in_time.desc()).offset(skip).limit(limit).all()
+    # Archived months are older than every hot row, so they continue the listing
+    reaches_archive = start_date is None or start_date < hot_window_start()
+    
+    # Offset paging is kept for existing clients; cursors seek on (check_in_time, id)
+    if skip and not cursor:
+        records = query.order_by(AttendanceRecord.check_in_time.desc(), AttendanceRecord.id.desc()).offset(skip).limit(limit).all()
+        if reaches_archive and len(records) < limit:
+            archive_offset = max(0, skip - query.count())
+            archived, _ = await run_in_threadpool(
+                attendance_archive.page, employee_id, start_date, end_date, None, limit - len(records), archive_offset
+            )
+            records += archived
+        return records
+    
+    records, next_cursor = keyset_page(query, AttendanceRecord.check_in_time, AttendanceRecord.id, cursor, limit)
+    if reaches_archive and next_cursor is None:
+        before = decode_cursor(cursor, datetime) if cursor else None
+        archived, more = await run_in_threadpool(
+            attendance_archive.page, employee_id, start_date, end_date, before, limit - len(records)
+        )
+        records += archived
+        if more:
+            next_cursor = encode_cursor((records[-1].check_in_time, records[-1].id))
+    set_next_cursor(response, next_cursor)
     return records
 
+@router.get("/export")
+async def export_attendance(
+    format: str = Query("csv", description="csv or ndjson"),
+    employee_id: Optional[int] = Query(None),
+    department_id: Optional[int] = Query(None),
+    start_date: Optional[date] = Query(None),
+    end_date: Optional[date] = Query(None),
+    gzip: bool = Query(False, description="gzip-compress the stream"),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Stream attendance records for any date range as CSV or NDJSON"""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format; use one of: {', '.join(FORMATS)}")
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    
+    stmt = export_statement(employee_id=employee_id, department_id=department_id, start_date=start_date, end_date=end_date)
+    archived = None
+    if start_date is None or start_date < hot_window_start():
+        archived = archived_export_rows(employee_id=employee_id, department_id=department_id, start_date=start_date, end_date=end_date)
+    filename = f"attendance_{start_date or 'all'}_{end_date or 'all'}.{format}" + (".gz" if gzip else "")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    media_type = "application/gzip" if gzip else FORMATS[format]
+    
+    # Rows are fetched and serialized batch by batch in a worker thread while streaming
+    return StreamingResponse(stream_export(stmt, format, compress=gzip, archived=archived), media_type=media_type, headers=headers)
+
 @router.get("/today")
 async def get_today_attendance(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get today's attendance summary"""
-    today = date.today()
-    
     # Get current user's employee record
     if not current_user.employee:
         raise HTTPException(status_code=404, detail="Employee record not found")
     
     employee_id = current_user.employee.id
     
-    # Get today's attendance
-    attendance = db.query(AttendanceRecord).filter(
-        and_(
-            AttendanceRecord.employee_id == employee_id,
-            func.date(AttendanceRecord.check_in_time) == today
-        )
-    ).first()
+    # Get today's attendance (first record of the day, from the presence registry)
+    record_id = presence.first_record(db, employee_id)
+    attendance = db.get(AttendanceRecord, record_id) if record_id else None
     
     if not attendance:
         return {
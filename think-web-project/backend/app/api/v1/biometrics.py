@@ -1,39 +1,97 @@
 """
 Biometric endpoints (Face Recognition & Fingerprint)
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
 import hashlib
-from cryptography.fernet import Fernet
 import numpy as np
 
 from app.database.connection import get_db
 from app.database.models import BiometricTemplate, Employee, Device, User
 from app.core.security import get_current_user, require_role
 from app.core.config import settings
+from app.core.biometrics.templates import cipher, encode_template
+from app.core.biometrics.batching import face_batcher
+from app.core.biometrics.face_index import face_index
+from app.core.biometrics.face_recognition import analyze_faces, normalize
+from app.core.biometrics.fingerprint import MAX_MINUTIAE, encode_minutiae, fingerprint_index, match_scores, minutiae_from_points
+from app.core.biometrics.matching import employee_face_templates, employee_fingerprint_templates
+from app.core.biometrics.template_cache import template_cache
+from app.core.biometrics.workers import biometric_pool
+from app.core.uploads import read_upload
 
 router = APIRouter()
 
-# Initialize encryption (in production, load from secure key management)
-try:
-    cipher = Fernet(settings.BIOMETRIC_ENCRYPTION_KEY.encode()[:44].ljust(44, b'0'))
-except:
-    # Generate key if not set (for development only)
-    key = Fernet.generate_key()
-    cipher = Fernet(key)
-
 class BiometricEnrollResponse(BaseModel):
     message: str
     template_id: int
     liveness_score: Optional[float] = None
 
+class BatchEnrollItem(BaseModel):
+    index: int
+    employee_id: int
+    enrolled: bool
+    template_id: Optional[int] = None
+    liveness_score: Optional[float] = None
+    detail: Optional[str] = None
+
+class BatchEnrollResponse(BaseModel):
+    enrolled: int
+    failed: int
+    results: List[BatchEnrollItem]
+
 class BiometricVerifyResponse(BaseModel):
     verified: bool
     confidence: float
     liveness_score: Optional[float] = None
 
+class FaceIdentifyMatch(BaseModel):
+    employee_id: int
+    template_id: int
+    confidence: float
+
+class FaceIdentifyResponse(BaseModel):
+    identified: bool
+    employee_id: int
+    confidence: float
+    liveness_score: Optional[float] = None
+    matches: List[FaceIdentifyMatch]
+
+class Minutia(BaseModel):
+    x: float
+    y: float
+    angle: float  # Ridge direction in degrees
+    type: str = "ending"  # ending, bifurcation
+    quality: int = 100
+
+class FingerprintEnrollRequest(BaseModel):
+    employee_id: int
+    minutiae: List[Minutia]
+    device_id: Optional[int] = None
+
+class FingerprintVerifyRequest(BaseModel):
+    employee_id: int
+    minutiae: List[Minutia]
+
+class FingerprintIdentifyRequest(BaseModel):
+    minutiae: List[Minutia]
+    top_k: int = settings.FINGERPRINT_IDENTIFY_TOP_K
+
+class FingerprintIdentifyMatch(BaseModel):
+    employee_id: int
+    template_id: int
+    confidence: float
+
+class FingerprintIdentifyResponse(BaseModel):
+    identified: bool
+    employee_id: int
+    confidence: float
+    matches: List[FingerprintIdentifyMatch]
+
 class BiometricTemplateResponse(BaseModel):
     id: int
     template_type: str
@@ -54,48 +112,47 @@ async def enroll_face(
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
-    # Read image bytes
-    image_bytes = await image.read()
-    
-    # TODO: Extract face embedding using face recognition service
-    # For now, we'll create a mock embedding
-    # In production, use: embedding = face_service.extract_embedding(image_bytes)
-    embedding = np.random.rand(512).astype(np.float32)  # Mock embedding
+    # Decoding (downscaled to FACE_INPUT_SIZE), detection, liveness and
+    # embedding extraction run batched in the worker pool
+    analysis = await face_batcher.submit(await read_upload(image))
+    embedding = analysis.embedding
+    liveness_score = analysis.liveness_score
     
     if embedding is None:
         raise HTTPException(status_code=400, detail="No face detected or multiple faces detected")
     
-    # TODO: Check liveness
-    # is_live, liveness_score = face_service.detect_liveness(image_bytes)
-    liveness_score = 0.90  # Mock
-    is_live = True  # Mock
-    
-    if not is_live:
+    if not analysis.is_live:
         raise HTTPException(status_code=400, detail="Liveness check failed")
     
-    # Convert embedding to bytes
-    embedding_bytes = embedding.tobytes()
+    # Serialize embedding in the versioned (optionally quantized) template format
+    template_bytes = encode_template(embedding)
     
     # Encrypt template
-    encrypted_template = cipher.encrypt(embedding_bytes)
+    encrypted_template = cipher.encrypt(template_bytes)
     
-    # Generate hash for duplicate detection
-    template_hash = hashlib.sha256(embedding_bytes).hexdigest()
+    # Generate hash of the stored template (integrity / exact-match lookups)
+    template_hash = hashlib.sha256(template_bytes).hexdigest()
     
-    # Check for duplicates
-    existing = db.query(BiometricTemplate).filter(
-        BiometricTemplate.template_hash == template_hash,
-        BiometricTemplate.employee_id != employee_id
-    ).first()
+    # Check for duplicates: the same face enrolled under another employee.
+    # Two captures never hash the same, so compare embeddings via the index.
+    face_index.ensure_loaded(db)
+    duplicates = face_index.find_similar(
+        embedding,
+        settings.FACE_DUPLICATE_THRESHOLD,
+        exclude_employee_id=employee_id,
+        k=1
+    )
     
-    if existing:
+    if duplicates:
         raise HTTPException(status_code=400, detail="Duplicate biometric template detected")
     
     # Deactivate old templates
-    db.query(BiometricTemplate).filter(
+    old_templates = db.query(BiometricTemplate).filter(
         BiometricTemplate.employee_id == employee_id,
         BiometricTemplate.template_type == "face"
-    ).update({"is_active": False})
+    )
+    old_template_ids = [template_id for (template_id,) in old_templates.with_entities(BiometricTemplate.id).all()]
+    old_templates.update({"is_active": False})
     
     # Create new template
     template = BiometricTemplate(
@@ -111,12 +168,156 @@ async def enroll_face(
     db.commit()
     db.refresh(template)
     
+    template_cache.invalidate(*old_template_ids)
+    
+    # Keep the identification index in sync with the active templates
+    face_index.remove_employee(employee_id)
+    face_index.add(template.id, employee_id, embedding)
+    
     return {
         "message": "Face enrolled successfully",
         "template_id": template.id,
         "liveness_score": float(liveness_score)
     }
 
+@router.post("/face/enroll/batch", response_model=BatchEnrollResponse)
+async def enroll_faces_batch(
+    employee_ids: List[int] = Form(...),
+    images: List[UploadFile] = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Enroll many employees at once (onboarding waves); images[i] belongs to employee_ids[i]"""
+    if len(employee_ids) != len(images):
+        raise HTTPException(status_code=400, detail="employee_ids and images must have the same length")
+    
+    results = [{"index": i, "employee_id": employee_id, "enrolled": False} for i, employee_id in enumerate(employee_ids)]
+    
+    # Validate employees with one query and reject repeats within the batch
+    known = {
+        employee_id for (employee_id,) in
+        db.query(Employee.id).filter(Employee.id.in_(set(employee_ids))).all()
+    }
+    seen = set()
+    for item in results:
+        if item["employee_id"] not in known:
+            item["detail"] = "Employee not found"
+        elif item["employee_id"] in seen:
+            item["detail"] = "Employee appears more than once in the batch"
+        seen.add(item["employee_id"])
+    
+    # Stream uploads into worker-pool chunks; extraction runs in parallel across
+    # workers while later files are still being read
+    chunk_size = settings.FACE_BATCH_MAX_SIZE
+    in_flight = asyncio.Semaphore(biometric_pool.max_workers * 2)
+    
+    async def analyze_chunk(chunk):
+        try:
+            return await biometric_pool.run(analyze_faces, chunk)
+        finally:
+            in_flight.release()
+    
+    tasks, indices, chunk = [], [], []
+    for item, image in zip(results, images):
+        if item.get("detail"):
+            continue
+        try:
+            image_bytes = await read_upload(image)
+        except HTTPException as exc:
+            item["detail"] = exc.detail
+            continue
+        indices.append(item["index"])
+        chunk.append(image_bytes)
+        if len(chunk) == chunk_size:
+            await in_flight.acquire()
+            tasks.append((indices, asyncio.create_task(analyze_chunk(chunk))))
+            indices, chunk = [], []
+    if chunk:
+        await in_flight.acquire()
+        tasks.append((indices, asyncio.create_task(analyze_chunk(chunk))))
+    
+    # A chunk the pool refused (e.g. 503 when saturated) fails only its own items
+    embeddings = {}
+    outcomes = await asyncio.gather(*(task for _, task in tasks), return_exceptions=True)
+    for (chunk_indices, _), analyses in zip(tasks, outcomes):
+        if isinstance(analyses, BaseException):
+            detail = analyses.detail if isinstance(analyses, HTTPException) else "Face analysis failed"
+            for i in chunk_indices:
+                results[i]["detail"] = detail
+            continue
+        for i, analysis in zip(chunk_indices, analyses):
+            if analysis.embedding is None:
+                results[i]["detail"] = "No face detected or multiple faces detected"
+            elif not analysis.is_live:
+                results[i]["detail"] = "Liveness check failed"
+            else:
+                results[i]["liveness_score"] = float(analysis.liveness_score)
+                embeddings[i] = analysis.embedding
+    
+    # One set-based duplicate check against the index and within the batch
+    candidates = sorted(embeddings)
+    if candidates:
+        face_index.ensure_loaded(db)
+        probes = np.stack([embeddings[i] for i in candidates])
+        owners = [results[i]["employee_id"] for i in candidates]
+        duplicates = face_index.find_similar_batch(probes, owners, settings.FACE_DUPLICATE_THRESHOLD)
+        
+        normalized = normalize(probes)
+        within = normalized @ normalized.T
+        np.fill_diagonal(within, -np.inf)
+        for pos, i in enumerate(candidates):
+            if duplicates[pos] is not None or np.any(within[pos, :pos] >= settings.FACE_DUPLICATE_THRESHOLD):
+                results[i]["detail"] = "Duplicate biometric template detected"
+                del embeddings[i]
+    
+    accepted = sorted(embeddings)
+    if accepted:
+        accepted_employees = [results[i]["employee_id"] for i in accepted]
+        
+        # Deactivate all previous templates of the accepted employees in one UPDATE
+        old_templates = db.query(BiometricTemplate).filter(
+            BiometricTemplate.employee_id.in_(accepted_employees),
+            BiometricTemplate.template_type == "face"
+        )
+        old_template_ids = [template_id for (template_id,) in old_templates.with_entities(BiometricTemplate.id).all()]
+        old_templates.update({"is_active": False}, synchronize_session=False)
+        
+        # Bulk insert the new templates in the same transaction
+        templates = []
+        for i in accepted:
+            template_bytes = encode_template(embeddings[i])
+            templates.append(BiometricTemplate(
+                employee_id=results[i]["employee_id"],
+                template_type="face",
+                encrypted_template=cipher.encrypt(template_bytes),
+                template_hash=hashlib.sha256(template_bytes).hexdigest(),
+                confidence_score=results[i]["liveness_score"],
+                is_active=True
+            ))
+        db.add_all(templates)
+        db.flush()
+        # Read the ids before commit expires the objects (one refresh SELECT each otherwise)
+        template_ids = [template.id for template in templates]
+        db.commit()
+        
+        template_cache.invalidate(*old_template_ids)
+        face_index.remove_employees(accepted_employees)
+        face_index.add_many([
+            (template_id, employee_id, embeddings[i])
+            for i, template_id, employee_id in zip(accepted, template_ids, accepted_employees)
+        ])
+        
+        for i, template_id in zip(accepted, template_ids):
+            results[i]["enrolled"] = True
+            results[i]["template_id"] = template_id
+    
+    enrolled = sum(1 for item in results if item["enrolled"])
+    return {
+        "enrolled": enrolled,
+        "failed": len(results) - enrolled,
+        "results": results
+    }
+
 @router.post("/face/verify", response_model=BiometricVerifyResponse)
 async def verify_face(
     employee_id: int = Form(...),
@@ -124,51 +325,25 @@ async def verify_face(
     db: Session = Depends(get_db)
 ):
     """Verify employee identity using face recognition"""
-    # Get employee's enrolled templates
-    templates = db.query(BiometricTemplate).filter(
-        BiometricTemplate.employee_id == employee_id,
-        BiometricTemplate.template_type == "face",
-        BiometricTemplate.is_active == True
-    ).all()
-    
-    if not templates:
+    # Get employee's enrolled embeddings (decrypted templates come from the cache)
+    stored_embeddings = employee_face_templates(db, employee_id)
+    if stored_embeddings is None:
         raise HTTPException(status_code=404, detail="No face template enrolled for this employee")
     
-    # Read image bytes
-    image_bytes = await image.read()
-    
-    # TODO: Extract face embedding from input
-    # input_embedding = face_service.extract_embedding(image_bytes)
-    input_embedding = np.random.rand(512).astype(np.float32)  # Mock
+    # Extraction and similarity scoring are coalesced with concurrent requests
+    analysis = await face_batcher.submit(await read_upload(image), stored_embeddings)
+    input_embedding = analysis.embedding
+    liveness_score = analysis.liveness_score
     
     if input_embedding is None:
         raise HTTPException(status_code=400, detail="No face detected")
     
-    # TODO: Check liveness
-    liveness_score = 0.90  # Mock
-    is_live = True  # Mock
-    
-    if not is_live:
+    if not analysis.is_live:
         raise HTTPException(status_code=400, detail="Liveness check failed")
     
-    # Compare with stored templates
-    best_match = False
-    best_score = 0.0
-    
-    for template in templates:
-        # Decrypt template
-        decrypted_bytes = cipher.decrypt(template.encrypted_template)
-        stored_embedding = np.frombuffer(decrypted_bytes, dtype=np.float32)
-        
-        # TODO: Compare embeddings using cosine similarity
-        # For now, mock comparison
-        similarity = 0.85  # Mock similarity score
-        
-        if similarity > best_score:
-            best_score = similarity
-            best_match = similarity >= settings.FACE_MATCH_THRESHOLD
-    
-    if not best_match or best_score < settings.FACE_MATCH_THRESHOLD:
+    # Best cosine similarity against the stored templates
+    best_score = analysis.similarity
+    if best_score < settings.FACE_MATCH_THRESHOLD:
         raise HTTPException(status_code=401, detail="Face verification failed")
     
     return {
@@ -177,6 +352,210 @@ async def verify_face(
         "liveness_score": float(liveness_score)
     }
 
+@router.post("/face/identify", response_model=FaceIdentifyResponse)
+async def identify_face(
+    image: UploadFile = File(...),
+    top_k: int = Form(settings.FACE_IDENTIFY_TOP_K),
+    db: Session = Depends(get_db)
+):
+    """Identify an employee from a face image without an employee ID (1:N)"""
+    face_index.ensure_loaded(db)
+    
+    if len(face_index) == 0:
+        raise HTTPException(status_code=404, detail="No face templates enrolled")
+    
+    # Decoding (downscaled to FACE_INPUT_SIZE), detection, liveness and
+    # embedding extraction run batched in the worker pool
+    analysis = await face_batcher.submit(await read_upload(image))
+    input_embedding = analysis.embedding
+    liveness_score = analysis.liveness_score
+    
+    if input_embedding is None:
+        raise HTTPException(status_code=400, detail="No face detected")
+    
+    if not analysis.is_live:
+        raise HTTPException(status_code=400, detail="Liveness check failed")
+    
+    # Score the probe against every enrolled template in one matrix product
+    top_k = max(1, min(top_k, 20))
+    matches = [
+        {"employee_id": employee_id, "template_id": template_id, "confidence": score}
+        for employee_id, template_id, score in face_index.search(input_embedding, k=top_k)
+        if score >= settings.FACE_MATCH_THRESHOLD
+    ]
+    
+    if not matches:
+        raise HTTPException(status_code=401, detail="Face not recognized")
+    
+    return {
+        "identified": True,
+        "employee_id": matches[0]["employee_id"],
+        "confidence": matches[0]["confidence"],
+        "liveness_score": float(liveness_score),
+        "matches": matches
+    }
+
+@router.get("/face/duplicates")
+async def audit_face_duplicates(
+    threshold: Optional[float] = Query(None, ge=0.5, le=1.0),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Find the closest cross-employee near-duplicate face templates in one vectorized pass"""
+    face_index.ensure_loaded(db)
+    threshold = threshold if threshold is not None else settings.FACE_DUPLICATE_THRESHOLD
+    
+    pairs, truncated = await run_in_threadpool(face_index.find_duplicate_pairs, threshold, limit)
+    
+    return {
+        "threshold": threshold,
+        "templates_scanned": len(face_index),
+        "duplicates": pairs,
+        "truncated": truncated
+    }
+
+def parse_minutiae(points: List[Minutia]):
+    """Convert request minutiae to an array, rejecting captures too poor to match"""
+    try:
+        minutiae = minutiae_from_points(point.dict() for point in points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(minutiae) < settings.FINGERPRINT_MIN_MINUTIAE:
+        raise HTTPException(status_code=400, detail="Not enough minutiae, please rescan the finger")
+    if len(minutiae) > MAX_MINUTIAE:
+        raise HTTPException(status_code=400, detail="Too many minutiae")
+    return minutiae
+
+@router.post("/fingerprint/enroll", response_model=BiometricEnrollResponse)
+async def enroll_fingerprint(
+    request: FingerprintEnrollRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Enroll a fingerprint (minutiae extracted by the scanner) for an employee"""
+    employee = db.query(Employee).filter(Employee.id == request.employee_id).first()
+    if not employee:
+        raise HTTPException(status_code=404, detail="Employee not found")
+    
+    if request.device_id is not None:
+        device = db.query(Device).filter(Device.id == request.device_id).first()
+        if not device or device.device_type not in ("fingerprint_scanner", "hybrid"):
+            raise HTTPException(status_code=400, detail="Device is not a fingerprint scanner")
+    
+    minutiae = parse_minutiae(request.minutiae)
+    
+    enrolled = db.query(BiometricTemplate).filter(
+        BiometricTemplate.employee_id == request.employee_id,
+        BiometricTemplate.template_type == "fingerprint",
+        BiometricTemplate.is_active == True
+    ).count()
+    if enrolled >= settings.FINGERPRINT_MAX_TEMPLATES:
+        raise HTTPException(status_code=400, detail="Maximum number of enrolled fingerprints reached")
+    
+    # Reject a finger that already matches another employee
+    fingerprint_index.ensure_loaded(db)
+    duplicates = await run_in_threadpool(
+        fingerprint_index.search, minutiae, 1, request.employee_id
+    )
+    if duplicates and duplicates[0][2] >= settings.FINGERPRINT_MATCH_THRESHOLD:
+        raise HTTPException(status_code=400, detail="Duplicate biometric template detected")
+    
+    template_bytes = encode_minutiae(minutiae)
+    template = BiometricTemplate(
+        employee_id=request.employee_id,
+        template_type="fingerprint",
+        encrypted_template=cipher.encrypt(template_bytes),
+        template_hash=hashlib.sha256(template_bytes).hexdigest(),
+        device_id=request.device_id,
+        confidence_score=float(minutiae[:, 4].mean()) / 100.0,
+        is_active=True
+    )
+    db.add(template)
+    db.commit()
+    db.refresh(template)
+    
+    fingerprint_index.add(template.id, template.employee_id, minutiae, template.created_at)
+    
+    return {
+        "message": "Fingerprint enrolled successfully",
+        "template_id": template.id
+    }
+
+@router.post("/fingerprint/verify", response_model=BiometricVerifyResponse)
+async def verify_fingerprint(
+    request: FingerprintVerifyRequest,
+    db: Session = Depends(get_db)
+):
+    """Verify employee identity against their enrolled fingerprints (1:1)"""
+    stored = employee_fingerprint_templates(db, request.employee_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="No fingerprint template enrolled for this employee")
+    
+    minutiae = parse_minutiae(request.minutiae)
+    
+    # All enrolled fingers are scored in one vectorized call, off the event loop
+    best_score = float((await run_in_threadpool(match_scores, minutiae, *stored)).max())
+    if best_score < settings.FINGERPRINT_MATCH_THRESHOLD:
+        raise HTTPException(status_code=401, detail="Fingerprint verification failed")
+    
+    return {
+        "verified": True,
+        "confidence": best_score
+    }
+
+@router.post("/fingerprint/identify", response_model=FingerprintIdentifyResponse)
+async def identify_fingerprint(
+    request: FingerprintIdentifyRequest,
+    db: Session = Depends(get_db)
+):
+    """Identify an employee from a fingerprint without an employee ID (1:N)"""
+    fingerprint_index.ensure_loaded(db)
+    
+    if len(fingerprint_index) == 0:
+        raise HTTPException(status_code=404, detail="No fingerprint templates enrolled")
+    
+    minutiae = parse_minutiae(request.minutiae)
+    
+    top_k = max(1, min(request.top_k, 20))
+    results = await run_in_threadpool(fingerprint_index.search, minutiae, top_k)
+    matches = [
+        {"employee_id": employee_id, "template_id": template_id, "confidence": score}
+        for employee_id, template_id, score in results
+        if score >= settings.FINGERPRINT_MATCH_THRESHOLD
+    ]
+    
+    if not matches:
+        raise HTTPException(status_code=401, detail="Fingerprint not recognized")
+    
+    return {
+        "identified": True,
+        "employee_id": matches[0]["employee_id"],
+        "confidence": matches[0]["confidence"],
+        "matches": matches
+    }
+
+@router.get("/cache/stats")
+async def get_cache_stats(
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Get decrypted template cache statistics"""
+    return template_cache.stats()
+
+@router.get("/workers/stats")
+async def get_worker_stats(
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Get biometric worker pool statistics (queue depth, rejections)"""
+    return biometric_pool.stats()
+
+@router.get("/face/batch-stats")
+async def get_batch_stats(
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Get face micro-batching latency statistics per batch size"""
+    return face_batcher.stats()
+
 @router.get("/{employee_id}/templates", response_model=List[BiometricTemplateResponse])
 async def get_templates(
     employee_id: int,
@@ -216,6 +595,10 @@ async def delete_template(
     db.delete(template)
     db.commit()
     
+    template_cache.invalidate(template_id)
+    face_index.remove(template_id)
+    fingerprint_index.remove(template_id)
+    
     return {"message": "Template deleted successfully"}
 
 
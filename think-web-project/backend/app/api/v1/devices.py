@@ -0,0 +1,58 @@
+"""
+Device endpoints
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+from app.database.connection import get_db
+from app.database.models import Device, User
+from app.core.security import get_current_user, require_role
+from app.core.devices import record_heartbeat
+
+router = APIRouter()
+
+class DeviceHeartbeat(BaseModel):
+    firmware_version: Optional[str] = None
+
+class DeviceResponse(BaseModel):
+    id: int
+    device_name: str
+    device_type: str
+    location: Optional[str]
+    status: Optional[str]
+    last_seen: Optional[datetime]
+    firmware_version: Optional[str]
+    
+    class Config:
+        from_attributes = True
+
+@router.get("/", response_model=List[DeviceResponse])
+async def get_devices(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin", "manager"]))
+):
+    """Get devices and their last known status"""
+    return db.query(Device).order_by(Device.id).all()
+
+@router.post("/{device_id}/heartbeat", response_model=DeviceResponse)
+async def device_heartbeat(
+    device_id: int,
+    heartbeat: DeviceHeartbeat,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Report a device as alive; it goes offline after DEVICE_OFFLINE_AFTER_SECONDS of silence"""
+    device = db.get(Device, device_id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    
+    record_heartbeat(
+        db, device,
+        firmware_version=heartbeat.firmware_version,
+        ip_address=request.client.host if request.client else None
+    )
+    return device
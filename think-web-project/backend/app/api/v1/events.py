@@ -0,0 +1,44 @@
+"""
+Live event stream endpoints
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from app.database.connection import get_db
+from app.core.security import user_from_token
+from app.core.events import broadcaster
+
+router = APIRouter()
+
+optional_bearer = HTTPBearer(auto_error=False)
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    token: Optional[str] = Query(None, description="Access token (EventSource cannot send headers)"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer),
+    db: Session = Depends(get_db)
+):
+    """Server-Sent Events: counter changes, punches and device status for live dashboards"""
+    access_token = credentials.credentials if credentials else token
+    if not access_token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    user = user_from_token(db, access_token)
+    if user.role not in ("super_admin", "hr_admin", "manager"):
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    
+    subscription = broadcaster.subscribe()
+    if subscription is None:
+        raise HTTPException(status_code=503, detail="Too many live connections, please retry")
+    
+    # The stream outlives this request's session; nothing below uses it
+    db.close()
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(
+        broadcaster.stream(subscription, request.is_disconnected),
+        media_type="text/event-stream",
+        headers=headers
+    )
@@ -0,0 +1,137 @@
+"""
+Geofence management endpoints
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import date
+
+from app.database.connection import get_db, run_db
+from app.database.models import Department, Employee, EmployeeGeofence, Geofence, User
+from app.core.security import require_role
+from app.core.attendance.geofence import geofence_index, haversine_meters, revalidate_records
+
+router = APIRouter()
+
+class GeofenceCreate(BaseModel):
+    name: str
+    center_lat: float
+    center_lng: float
+    radius_meters: int
+    polygon: Optional[List[List[float]]] = None  # [[lat, lng], ...] inside the radius
+    department_id: Optional[int] = None
+
+class GeofenceResponse(BaseModel):
+    id: int
+    name: str
+    center_lat: float
+    center_lng: float
+    radius_meters: int
+    polygon: Optional[List[List[float]]]
+    department_id: Optional[int]
+    is_active: bool
+    
+    class Config:
+        from_attributes = True
+
+class GeofenceAssignment(BaseModel):
+    employee_ids: List[int]
+
+class GeofenceRevalidation(BaseModel):
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+
+@router.get("/", response_model=List[GeofenceResponse])
+async def get_geofences(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Get geofences"""
+    return db.query(Geofence).order_by(Geofence.id).all()
+
+@router.post("/", response_model=GeofenceResponse)
+async def create_geofence(
+    geofence_data: GeofenceCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Create geofence (a circle, optionally narrowed to a polygon inside it)"""
+    if not -90 <= geofence_data.center_lat <= 90 or not -180 <= geofence_data.center_lng <= 180:
+        raise HTTPException(status_code=400, detail="Invalid center coordinates")
+    if geofence_data.radius_meters <= 0:
+        raise HTTPException(status_code=400, detail="radius_meters must be positive")
+    
+    if geofence_data.polygon is not None:
+        if len(geofence_data.polygon) < 3 or any(len(vertex) != 2 for vertex in geofence_data.polygon):
+            raise HTTPException(status_code=400, detail="polygon needs at least 3 [lat, lng] vertices")
+        # The radius is the prefilter, so the outline must fit inside it
+        distances = haversine_meters(
+            [vertex[0] for vertex in geofence_data.polygon], [vertex[1] for vertex in geofence_data.polygon],
+            geofence_data.center_lat, geofence_data.center_lng
+        )
+        if distances.max() > geofence_data.radius_meters:
+            raise HTTPException(status_code=400, detail="polygon must lie within radius_meters of the center")
+    
+    if geofence_data.department_id is not None:
+        if not db.query(Department.id).filter(Department.id == geofence_data.department_id).first():
+            raise HTTPException(status_code=404, detail="Department not found")
+    
+    geofence = Geofence(**geofence_data.dict())
+    db.add(geofence)
+    db.commit()
+    db.refresh(geofence)
+    
+    return geofence
+
+@router.put("/{geofence_id}/employees")
+async def assign_geofence(
+    geofence_id: int,
+    assignment: GeofenceAssignment,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Replace the employees assigned to a geofence"""
+    if not db.query(Geofence.id).filter(Geofence.id == geofence_id).first():
+        raise HTTPException(status_code=404, detail="Geofence not found")
+    
+    employee_ids = set(assignment.employee_ids)
+    found = {employee_id for (employee_id,) in db.query(Employee.id).filter(Employee.id.in_(employee_ids))} if employee_ids else set()
+    if found != employee_ids:
+        raise HTTPException(status_code=404, detail=f"Employees not found: {sorted(employee_ids - found)}")
+    
+    db.query(EmployeeGeofence).filter(EmployeeGeofence.geofence_id == geofence_id).delete(synchronize_session=False)
+    db.add_all([EmployeeGeofence(employee_id=employee_id, geofence_id=geofence_id) for employee_id in employee_ids])
+    db.commit()
+    geofence_index.invalidate()  # Bulk delete above bypasses the ORM change events
+    
+    return {"geofence_id": geofence_id, "employees": len(employee_ids)}
+
+@router.delete("/{geofence_id}")
+async def deactivate_geofence(
+    geofence_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Deactivate geofence"""
+    geofence = db.query(Geofence).filter(Geofence.id == geofence_id).first()
+    if not geofence:
+        raise HTTPException(status_code=404, detail="Geofence not found")
+    
+    geofence.is_active = False
+    db.commit()
+    
+    return {"message": "Geofence deactivated successfully"}
+
+@router.post("/revalidate")
+async def revalidate_geofences(
+    request: GeofenceRevalidation,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["super_admin", "hr_admin"]))
+):
+    """Re-check stored check-in locations in a date range against the current geofences"""
+    if request.start_date and request.end_date and request.start_date > request.end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    
+    # Batched reads and bulk updates run off the event loop where the pool allows
+    return await run_db(revalidate_records, db, geofence_index, request.start_date, request.end_date)
@@ -1,7 +1,7 @@
 """
 Payroll management endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
@@ -10,6 +10,7 @@ from datetime import date
 from app.database.connection import get_db
 from app.database.models import PayrollRecord, PayrollPeriod, Employee, User
 from app.core.security import get_current_user, require_role
+from app.core.pagination import keyset_page, set_next_cursor
 
 router = APIRouter()
 
@@ -27,15 +28,17 @@ class PayrollRecordResponse(BaseModel):
 
 @router.get("/", response_model=List[PayrollRecordResponse])
 async def get_payroll_records(
+    response: Response,
     employee_id: Optional[int] = Query(None),
     period_start: Optional[date] = Query(None),
     period_end: Optional[date] = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page; replaces skip"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get payroll records"""
+    """Get payroll records (newest period first; follow X-Next-Cursor to page)"""
     query = db.query(PayrollRecord)
     
     # If employee, only show their own records
@@ -50,7 +53,12 @@ async def get_payroll_records(
     if period_end:
         query = query.filter(PayrollRecord.period_end <= period_end)
     
-    records = query.order_by(PayrollRecord.period_start.desc()).offset(skip).limit(limit).all()
+    # Offset paging is kept for existing clients; cursors seek on (period_start, id)
+    if skip and not cursor:
+        return query.order_by(PayrollRecord.period_start.desc(), PayrollRecord.id.desc()).offset(skip).limit(limit).all()
+    
+    records, next_cursor = keyset_page(query, PayrollRecord.period_start, PayrollRecord.id, cursor, limit, value_type=date)
+    set_next_cursor(response, next_cursor)
     return records
 
 @router.get("/{payroll_id}", response_model=PayrollRecordResponse)
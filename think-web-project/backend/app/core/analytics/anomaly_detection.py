@@ -0,0 +1,394 @@
+"""
+Streaming attendance anomaly detection
+
+AnomalyEngine sees every committed punch once (check-in and check-out
+endpoints, device sync and write-behind groups) and checks it against
+in-memory state only, so a burst of punches never re-reads history:
+
+- per-employee rolling statistics in compact NumPy arrays, one slot per
+  employee: an EWMA of the check-in minute of the day and its variance, and
+  the time, device and coordinates of the last punch
+- per device, the last few check-ins, and per employee pair the days on
+  which both checked in on one device within ANOMALY_BUDDY_SECONDS
+
+Findings:
+
+- unusual_hours: a check-in far outside the employee's usual time (more than
+  ANOMALY_HOURS_Z deviations and ANOMALY_HOURS_MIN_MINUTES away)
+- impossible_travel: two punches further apart than ANOMALY_MAX_SPEED_KMH
+  allows, or at two different sites (Device.location) within
+  ANOMALY_SITE_TRAVEL_MINUTES
+- buddy_punching: the same two employees punching back to back on one device
+  on ANOMALY_BUDDY_DAYS days within ANOMALY_BUDDY_WINDOW_DAYS
+- low_confidence: an accepted face or fingerprint match, or liveness score,
+  within ANOMALY_CONFIDENCE_MARGIN of its threshold
+
+Findings are written to anomaly_detections in one batch every
+ANOMALY_FLUSH_SECONDS (or ANOMALY_BATCH_SIZE findings), and announced on the
+live event stream. A batch is kept for the next flush only while the database
+is unreachable; one it refuses is split until the findings at fault are
+isolated and dropped (logged). The statistics are seeded from the last
+ANOMALY_WARMUP_DAYS of check-ins at startup.
+"""
+import asyncio
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta
+import logging
+import math
+import threading
+import time
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import String, cast, insert, text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database.connection import SessionLocal, run_db
+from app.database.models import AnomalyDetection, AttendanceRecord, Device
+from app.core.attendance.geofence import haversine_meters
+from app.core.events import broadcaster
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 1440
+EWMA_ALPHA = 0.1  # Weight of the newest check-in in the usual-hours average
+RECENT_PER_DEVICE = 8  # Check-ins remembered per device for buddy punching
+SITE_REFRESH_SECONDS = 60.0  # Age of the device -> site map
+MAX_PENDING = 50000  # Findings kept while the database is unavailable
+EPOCH = datetime(1970, 1, 1)
+
+class PunchObservation(NamedTuple):
+    attendance_id: Optional[int]
+    employee_id: int
+    event_type: str  # check_in, check_out
+    punched_at: datetime  # UTC, naive
+    method: Optional[str] = None
+    device_id: Optional[int] = None
+    location_lat: Optional[float] = None
+    location_lng: Optional[float] = None
+    confidence_score: Optional[float] = None
+    liveness_score: Optional[float] = None
+
+def _minute_of_day(value: datetime) -> int:
+    return value.hour * 60 + value.minute
+
+def _circular(difference: float) -> float:
+    # Shortest signed distance between two minutes of the day
+    return (difference + MINUTES_PER_DAY / 2) % MINUTES_PER_DAY - MINUTES_PER_DAY / 2
+
+def _clock(minute: float) -> str:
+    minute = int(round(minute)) % MINUTES_PER_DAY
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+class EmployeeStats:
+    """Rolling per-employee state, one array slot per employee"""
+    
+    def __init__(self, capacity: int = 1024):
+        self.slots: Dict[int, int] = {}
+        self.count = np.zeros(capacity, dtype=np.int32)
+        self.mean = np.zeros(capacity, dtype=np.float32)  # EWMA of the check-in minute of the day
+        self.var = np.zeros(capacity, dtype=np.float32)
+        self.last_at = np.zeros(capacity, dtype=np.int64)  # Epoch seconds of the last punch, 0 if none
+        self.last_device = np.full(capacity, -1, dtype=np.int32)
+        self.last_lat = np.full(capacity, np.nan, dtype=np.float64)
+        self.last_lng = np.full(capacity, np.nan, dtype=np.float64)
+    
+    def slot(self, employee_id: int) -> int:
+        slot = self.slots.get(employee_id)
+        if slot is None:
+            slot = self.slots[employee_id] = len(self.slots)
+            if slot >= len(self.count):
+                self._grow(2 * len(self.count))
+        return slot
+    
+    def _grow(self, capacity: int):
+        for name, fill in (("count", 0), ("mean", 0), ("var", 0), ("last_at", 0), ("last_device", -1), ("last_lat", np.nan), ("last_lng", np.nan)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+class AnomalyEngine:
+    """Incremental anomaly checks on committed punches, with batched writes"""
+    
+    def __init__(self, flush_seconds: float, batch_size: int):
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.stats = EmployeeStats()
+        self._recent: Dict[int, Deque[Tuple[int, int]]] = defaultdict(lambda: deque(maxlen=RECENT_PER_DEVICE))  # device -> (epoch, employee)
+        self._pair_days: Dict[Tuple[int, int], List[int]] = {}  # (employee, employee) -> day ordinals
+        self._sites: Dict[int, str] = {}
+        self._sites_loaded = 0.0
+        self._pending: List[Dict] = []
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+    
+    def load(self, db: Session, now: Optional[datetime] = None):
+        """Seed the per-employee statistics from recent check-ins, in one query"""
+        since = (now or datetime.utcnow()) - timedelta(days=settings.ANOMALY_WARMUP_DAYS)
+        rows = db.query(
+            AttendanceRecord.employee_id, cast(AttendanceRecord.check_in_time, String), AttendanceRecord.device_id,
+            AttendanceRecord.location_lat, AttendanceRecord.location_lng
+        ).filter(AttendanceRecord.check_in_time >= since).order_by(AttendanceRecord.check_in_time).all()
+        self._load_sites(db)
+        if not rows:
+            return
+        
+        employee_ids, times, device_ids, lats, lngs = zip(*rows)
+        employee_ids = np.array(employee_ids, dtype=np.int64)
+        at = np.array(times, dtype="datetime64[us]").astype("datetime64[s]")
+        minute = ((at - at.astype("datetime64[D]")) // np.timedelta64(1, "m")).astype(np.float64)
+        
+        with self._lock:
+            stats = self.stats
+            unique_ids, index = np.unique(employee_ids, return_inverse=True)
+            slots = np.array([stats.slot(int(employee_id)) for employee_id in unique_ids], dtype=np.int64)
+            
+            # Circular mean and variance of the check-in minute per employee
+            angle = minute * (2 * np.pi / MINUTES_PER_DAY)
+            count = np.bincount(index)
+            mean_angle = np.arctan2(np.bincount(index, weights=np.sin(angle)), np.bincount(index, weights=np.cos(angle)))
+            mean = (mean_angle * MINUTES_PER_DAY / (2 * np.pi)) % MINUTES_PER_DAY
+            deviation = (minute - mean[index] + MINUTES_PER_DAY / 2) % MINUTES_PER_DAY - MINUTES_PER_DAY / 2
+            stats.count[slots] = count
+            stats.mean[slots] = mean
+            stats.var[slots] = np.bincount(index, weights=deviation ** 2) / count
+            
+            # Rows are in time order: the last occurrence is the latest punch
+            last = len(index) - 1 - np.unique(index[::-1], return_index=True)[1]
+            stats.last_at[slots] = at[last].astype(np.int64)
+            stats.last_device[slots] = [-1 if device_ids[i] is None else device_ids[i] for i in last]
+            stats.last_lat[slots] = [np.nan if lats[i] is None else float(lats[i]) for i in last]
+            stats.last_lng[slots] = [np.nan if lngs[i] is None else float(lngs[i]) for i in last]
+    
+    def _load_sites(self, db: Session):
+        self._sites = {row.id: row.location for row in db.query(Device.id, Device.location) if row.location}
+        self._sites_loaded = time.monotonic()
+    
+    def observe(self, observation: PunchObservation):
+        """Check one committed punch and update the statistics (thread-safe)"""
+        if self._loop is None:
+            return
+        with self._lock:
+            findings = self._check(observation)
+            if findings:
+                self._pending.extend(findings)
+                del self._pending[:-MAX_PENDING]
+                full = len(self._pending) >= self.batch_size
+            else:
+                full = False
+        if full:
+            self._loop.call_soon_threadsafe(self._wake.set)
+    
+    def _finding(self, kind: str, severity: str, observation: PunchObservation, description: str) -> Dict:
+        return {
+            "type": kind,
+            "employee_id": observation.employee_id,
+            "attendance_record_id": observation.attendance_id,
+            "severity": severity,
+            "description": description,
+            "status": "pending",
+            "created_at": datetime.utcnow()
+        }
+    
+    def _check(self, observation: PunchObservation) -> List[Dict]:
+        stats = self.stats
+        slot = stats.slot(observation.employee_id)
+        epoch = int((observation.punched_at - EPOCH).total_seconds())
+        findings = []
+        
+        if observation.event_type == "check_in":
+            findings += self._check_hours(observation, slot)
+            findings += self._check_buddy(observation, epoch)
+        findings += self._check_confidence(observation)
+        findings += self._check_travel(observation, slot, epoch)
+        return findings
+    
+    def _check_hours(self, observation: PunchObservation, slot: int) -> List[Dict]:
+        stats = self.stats
+        minute = _minute_of_day(observation.punched_at)
+        count, mean, var = int(stats.count[slot]), float(stats.mean[slot]), float(stats.var[slot])
+        findings = []
+        if count == 0:
+            stats.mean[slot], stats.var[slot] = minute, 0.0
+        else:
+            deviation = _circular(minute - mean)
+            threshold = max(settings.ANOMALY_HOURS_Z * math.sqrt(var), settings.ANOMALY_HOURS_MIN_MINUTES)
+            if count >= settings.ANOMALY_MIN_HISTORY and abs(deviation) >= threshold:
+                severity = "medium" if abs(deviation) >= 2 * threshold else "low"
+                findings.append(self._finding(
+                    "unusual_hours", severity, observation,
+                    f"Checked in at {_clock(minute)}, usually around {_clock(mean)} ({abs(deviation):.0f} minutes off)"
+                ))
+            stats.mean[slot] = (mean + EWMA_ALPHA * deviation) % MINUTES_PER_DAY
+            stats.var[slot] = (1 - EWMA_ALPHA) * (var + EWMA_ALPHA * deviation ** 2)
+        stats.count[slot] = count + 1
+        return findings
+    
+    def _check_buddy(self, observation: PunchObservation, epoch: int) -> List[Dict]:
+        if observation.device_id is None:
+            return []
+        recent = self._recent[observation.device_id]
+        day = observation.punched_at.toordinal()
+        findings = []
+        for punched, other in recent:
+            if other == observation.employee_id or abs(epoch - punched) > settings.ANOMALY_BUDDY_SECONDS:
+                continue
+            pair = (min(other, observation.employee_id), max(other, observation.employee_id))
+            days = [seen for seen in self._pair_days.get(pair, []) if day - seen < settings.ANOMALY_BUDDY_WINDOW_DAYS]
+            if day not in days:
+                days.append(day)
+            if len(days) >= settings.ANOMALY_BUDDY_DAYS:
+                findings.append(self._finding(
+                    "buddy_punching", "high", observation,
+                    f"Punched within {settings.ANOMALY_BUDDY_SECONDS}s of employee {other} on device {observation.device_id} "
+                    f"on {len(days)} days in {settings.ANOMALY_BUDDY_WINDOW_DAYS}"
+                ))
+                days = []  # The next finding needs a fresh run of days
+            self._pair_days[pair] = days
+        recent.append((epoch, observation.employee_id))
+        return findings
+    
+    def _check_confidence(self, observation: PunchObservation) -> List[Dict]:
+        margin = settings.ANOMALY_CONFIDENCE_MARGIN
+        thresholds = {"face": settings.FACE_MATCH_THRESHOLD, "fingerprint": settings.FINGERPRINT_MATCH_THRESHOLD}
+        weak = []
+        threshold = thresholds.get(observation.method)
+        if observation.confidence_score is not None and threshold is not None and float(observation.confidence_score) < threshold + margin:
+            weak.append(f"{observation.method} match {float(observation.confidence_score):.2f} (threshold {threshold:.2f})")
+        if observation.liveness_score is not None and float(observation.liveness_score) < settings.LIVENESS_THRESHOLD + margin:
+            weak.append(f"liveness {float(observation.liveness_score):.2f} (threshold {settings.LIVENESS_THRESHOLD:.2f})")
+        if not weak:
+            return []
+        return [self._finding("low_confidence", "high" if len(weak) > 1 else "medium", observation, "Accepted with " + " and ".join(weak))]
+    
+    def _check_travel(self, observation: PunchObservation, slot: int, epoch: int) -> List[Dict]:
+        stats = self.stats
+        has_location = observation.location_lat is not None and observation.location_lng is not None
+        if observation.device_id is None and not has_location:
+            return []
+        last_at = int(stats.last_at[slot])
+        if epoch < last_at:
+            return []  # Late-synced punch; only newer punches move the employee
+        
+        findings = []
+        elapsed = epoch - last_at
+        if last_at:
+            last_device = int(stats.last_device[slot])
+            last_lat, last_lng = float(stats.last_lat[slot]), float(stats.last_lng[slot])
+            if has_location and not math.isnan(last_lat):
+                kilometers = float(haversine_meters(last_lat, last_lng, float(observation.location_lat), float(observation.location_lng))) / 1000
+                speed = kilometers / (max(elapsed, 1) / 3600)
+                if kilometers >= 1 and speed > settings.ANOMALY_MAX_SPEED_KMH:
+                    findings.append(self._finding(
+                        "impossible_travel", "high", observation,
+                        f"{kilometers:.1f} km from the previous punch in {elapsed // 60} minutes ({speed:.0f} km/h)"
+                    ))
+            elif observation.device_id is not None and last_device >= 0 and elapsed < settings.ANOMALY_SITE_TRAVEL_MINUTES * 60:
+                site, last_site = self._sites.get(observation.device_id), self._sites.get(last_device)
+                if site and last_site and site != last_site:
+                    findings.append(self._finding(
+                        "impossible_travel", "medium", observation,
+                        f"Punched at {site} {elapsed // 60} minutes after a punch at {last_site}"
+                    ))
+        
+        stats.last_at[slot] = epoch
+        stats.last_device[slot] = -1 if observation.device_id is None else observation.device_id
+        stats.last_lat[slot] = float(observation.location_lat) if has_location else np.nan
+        stats.last_lng[slot] = float(observation.location_lng) if has_location else np.nan
+        return findings
+    
+    def _prune(self, today: int):
+        # Pairs with no back-to-back punches within the window
+        with self._lock:
+            stale = [pair for pair, days in self._pair_days.items() if not days or today - days[-1] >= settings.ANOMALY_BUDDY_WINDOW_DAYS]
+            for pair in stale:
+                del self._pair_days[pair]
+    
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+    
+    async def stop(self):
+        """Stop the flush task and write what is pending"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        await self.flush()
+        self._loop = None
+    
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+    
+    async def flush(self) -> int:
+        """Write pending findings in one batch; returns how many were written"""
+        with self._lock:
+            findings, self._pending = self._pending, []
+        refresh_sites = time.monotonic() - self._sites_loaded > SITE_REFRESH_SECONDS
+        if not findings and not refresh_sites:
+            return 0
+        try:
+            findings = await run_db(self._write, findings, refresh_sites)
+        except Exception:
+            logger.exception("Writing %d anomaly findings failed; retrying with the next batch", len(findings))
+            with self._lock:
+                self._pending[:0] = findings
+                del self._pending[:-MAX_PENDING]
+            return 0
+        
+        self.written += len(findings)
+        if findings:
+            broadcaster.publish("anomalies", {"count": len(findings), "by_type": dict(Counter(finding["type"] for finding in findings))})
+        return len(findings)
+    
+    def _write(self, findings: List[Dict], refresh_sites: bool) -> List[Dict]:
+        """Insert findings and return those written; raises only while the database is unreachable"""
+        db = SessionLocal()
+        try:
+            if findings:
+                try:
+                    db.execute(insert(AnomalyDetection), findings)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    db.execute(text("SELECT 1"))  # Unreachable: re-queue the whole batch
+                    findings = self._insert_isolating(db, findings)
+            if refresh_sites:
+                self._load_sites(db)
+                self._prune(datetime.utcnow().toordinal())
+            return findings
+        finally:
+            db.close()
+    
+    def _insert_isolating(self, db: Session, findings: List[Dict]) -> List[Dict]:
+        # Halve a refused batch until the findings at fault are isolated, and drop those
+        try:
+            db.execute(insert(AnomalyDetection), findings)
+            db.commit()
+            return findings
+        except Exception:
+            db.rollback()
+            if len(findings) == 1:
+                logger.exception("Dropping an anomaly finding the database refuses: %s", findings[0])
+                return []
+        middle = len(findings) // 2
+        return self._insert_isolating(db, findings[:middle]) + self._insert_isolating(db, findings[middle:])
+
+# Process-wide engine fed by the attendance write paths, started and stopped with the app
+anomaly_engine = AnomalyEngine(settings.ANOMALY_FLUSH_SECONDS, batch_size=settings.ANOMALY_BATCH_SIZE)
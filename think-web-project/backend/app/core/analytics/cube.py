@@ -0,0 +1,255 @@
+"""
+Attendance analytics cube
+
+attendance_cube holds additive measures per department x position x work
+date: headcount, employees expected at work, attended, present, late
+arrivals and minutes, worked and overtime minutes, and approved leave days.
+Reports roll the cells up to weeks or months and to departments, positions
+or the whole company with SUM, and derive rates (attendance rate = attended /
+expected) afterwards, so a 12-month department trend reads a few thousand
+small rows instead of every punch.
+
+Rollup refreshes and leave changes queue the work dates they touch in
+attendance_cube_dirty_days inside the writer's transaction, one row per date:
+queuing a date again only bumps its revision. refresh_pending() recomputes
+those dates and drains the rows whose revision it saw; the time-series
+endpoint calls it before reading, so the cube is never behind the rollup.
+Answers are then cached per worker in cube_cache, which only the refreshing
+worker invalidates: another worker can serve an answer up to
+ANALYTICS_CACHE_TTL_SECONDS old. rebuild_cube_range() backfills any range. Employees are counted under their department and
+position at the time a date is computed; 0 stands for "none" in both keys,
+so the unique (work_date, department_id, position_id) key also stops two
+workers from writing the same date twice.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import delete, event, func, insert, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.database.models import AttendanceCube, AttendanceCubeDirtyDay, AttendanceDaily, Employee, LeaveRequest
+from app.core.attendance.rules import scheduled_window
+from app.core.attendance.schedules import build_day
+
+STANDARD_WORKDAY_MINUTES = 480  # Overtime threshold for employees without a timed schedule
+REFRESH_MAX_DAYS = 366  # Dirty dates recomputed per refresh_pending() call
+
+MEASURES = ("headcount", "expected", "attended", "present", "late", "late_minutes", "worked_minutes", "overtime_minutes", "leave_days")
+
+# metric -> (numerator measure, denominator measure or None, scale)
+METRICS = {
+    "attendance_rate": ("attended", "expected", 1),
+    "late_rate": ("late", "present", 1),
+    "present_days": ("present", None, 1),
+    "late_minutes": ("late_minutes", None, 1),
+    "worked_hours": ("worked_minutes", None, 1 / 60),
+    "overtime_hours": ("overtime_minutes", None, 1 / 60),
+    "leave_days": ("leave_days", None, 1)
+}
+GRANULARITIES = ("day", "week", "month")
+GROUPS = {"none": None, "department": "department_id", "position": "position_id"}
+
+def mark_days_dirty(db: Session, days: Iterable[date]):
+    """Queue work dates for the next cube refresh, in the caller's transaction"""
+    # Sorted so concurrent writers lock the queued rows in the same order
+    rows = [{"work_date": day} for day in sorted({day for day in days if day is not None})]
+    if not rows:
+        return
+    dialect = {"postgresql": postgresql, "sqlite": sqlite}.get(db.get_bind().dialect.name)
+    if dialect is None:
+        db.execute(insert(AttendanceCubeDirtyDay), rows)
+        return
+    statement = dialect.insert(AttendanceCubeDirtyDay).on_conflict_do_update(
+        index_elements=["work_date"],
+        set_={"revision": AttendanceCubeDirtyDay.revision + 1}
+    )
+    db.execute(statement, rows)
+
+def _scheduled_minutes(day: date, schedule) -> int:
+    if schedule is None or not schedule.start_time or not schedule.end_time:
+        return STANDARD_WORKDAY_MINUTES
+    start, end = scheduled_window(day, schedule.start_time, schedule.end_time)
+    return max(0, int((end - start).total_seconds() / 60) - (schedule.break_duration_minutes or 0))
+
+def build_cells(db: Session, day: date, now: datetime) -> List[Dict]:
+    """Cube cells of one work date, from the rollup, approved leave and schedules"""
+    employees = {
+        row.id: (row.department_id or 0, row.position_id or 0)
+        for row in db.query(Employee.id, Employee.department_id, Employee.position_id).filter(Employee.status == "active")
+    }
+    daily = db.query(
+        AttendanceDaily.employee_id, AttendanceDaily.worked_minutes, AttendanceDaily.late_minutes, AttendanceDaily.status
+    ).filter(AttendanceDaily.work_date == day).all()
+    
+    # Former employees still count for the days they worked
+    former = {row.employee_id for row in daily} - employees.keys()
+    if former:
+        employees.update(
+            (row.id, (row.department_id or 0, row.position_id or 0))
+            for row in db.query(Employee.id, Employee.department_id, Employee.position_id).filter(Employee.id.in_(former))
+        )
+    
+    leave: Dict[int, float] = {}
+    for employee_id, start_date, end_date, days_requested in db.query(
+        LeaveRequest.employee_id, LeaveRequest.start_date, LeaveRequest.end_date, LeaveRequest.days_requested
+    ).filter(LeaveRequest.status == "approved", LeaveRequest.start_date <= day, LeaveRequest.end_date >= day):
+        # A single-day request may be a half day
+        share = min(1.0, float(days_requested)) if start_date == end_date and days_requested else 1.0
+        leave[employee_id] = max(leave.get(employee_id, 0.0), share)
+    
+    schedules = build_day(db, day)
+    cells: Dict[tuple, Dict] = defaultdict(lambda: dict.fromkeys(MEASURES, 0))
+    expected: Set[int] = set()
+    for employee_id, key in employees.items():
+        if employee_id in former:
+            continue
+        schedule = schedules.get(employee_id)
+        day_off = (schedule.is_rest_day or schedule.is_holiday) if schedule else day.weekday() >= 5
+        cell = cells[key]
+        cell["headcount"] += 1
+        if employee_id in leave:
+            cell["leave_days"] += leave[employee_id]
+        elif not day_off:
+            cell["expected"] += 1
+            expected.add(employee_id)
+    
+    for row in daily:
+        cell = cells[employees[row.employee_id]]
+        schedule = schedules.get(row.employee_id)
+        worked = row.worked_minutes or 0
+        day_off = (schedule.is_rest_day or schedule.is_holiday) if schedule else day.weekday() >= 5
+        cell["present"] += 1
+        cell["attended"] += row.employee_id in expected
+        cell["late"] += row.status == "late"
+        cell["late_minutes"] += row.late_minutes or 0
+        cell["worked_minutes"] += worked
+        cell["overtime_minutes"] += worked if day_off else max(0, worked - _scheduled_minutes(day, schedule))
+    
+    return [
+        {"department_id": department_id, "position_id": position_id, "work_date": day, "updated_at": now, **measures}
+        for (department_id, position_id), measures in cells.items()
+    ]
+
+def refresh_day(db: Session, day: date) -> int:
+    """Replace one work date's cells, in the caller's transaction"""
+    cells = build_cells(db, day, datetime.utcnow())
+    db.execute(delete(AttendanceCube).where(AttendanceCube.work_date == day))
+    if cells:
+        db.execute(insert(AttendanceCube), cells)
+    return len(cells)
+
+def refresh_pending(db: Session) -> int:
+    """Recompute the queued work dates and commit; returns the dates refreshed"""
+    queued = [tuple(row) for row in db.query(AttendanceCubeDirtyDay.work_date, AttendanceCubeDirtyDay.revision).order_by(
+        AttendanceCubeDirtyDay.work_date
+    ).limit(REFRESH_MAX_DAYS)]
+    if not queued:
+        return 0
+    
+    try:
+        for day, _ in queued:
+            refresh_day(db, day)
+        # A date queued again meanwhile has a newer revision and stays for the next pass
+        db.execute(delete(AttendanceCubeDirtyDay).where(
+            tuple_(AttendanceCubeDirtyDay.work_date, AttendanceCubeDirtyDay.revision).in_(queued)
+        ))
+        db.commit()
+    except IntegrityError:
+        # Another worker is refreshing the same dates; its commit covers them
+        db.rollback()
+        return 0
+    cube_cache.invalidate()
+    return len(queued)
+
+def rebuild_cube_range(db: Session, start_date: date, end_date: date) -> Dict[str, int]:
+    """Recompute every work date between start_date and end_date, committing per date"""
+    stats = {"days": 0, "cells": 0}
+    day = start_date
+    while day <= end_date:
+        stats["cells"] += refresh_day(db, day)
+        db.commit()
+        stats["days"] += 1
+        day += timedelta(days=1)
+    cube_cache.invalidate()
+    return stats
+
+def _period(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+def timeseries(db: Session, metric: str, start_date: date, end_date: date, granularity: str = "day",
+               group_by: str = "none", department_id: Optional[int] = None, position_id: Optional[int] = None) -> Dict:
+    """A metric per period (day, ISO week or month), per department/position or company-wide"""
+    numerator, denominator, scale = METRICS[metric]
+    measures = [numerator] + ([denominator] if denominator else [])
+    group_column = getattr(AttendanceCube, GROUPS[group_by]) if GROUPS[group_by] else None
+    
+    columns = [AttendanceCube.work_date] + ([group_column] if group_column is not None else [])
+    query = db.query(
+        *columns, *(func.sum(getattr(AttendanceCube, measure)).label(measure) for measure in measures)
+    ).filter(AttendanceCube.work_date >= start_date, AttendanceCube.work_date <= end_date)
+    if department_id:
+        query = query.filter(AttendanceCube.department_id == department_id)
+    if position_id:
+        query = query.filter(AttendanceCube.position_id == position_id)
+    
+    # Days are summed in SQL; weeks and months from the per-day sums
+    totals: Dict = defaultdict(lambda: defaultdict(lambda: dict.fromkeys(measures, 0.0)))
+    for row in query.group_by(*columns):
+        key = getattr(row, group_column.key) if group_column is not None else None
+        bucket = totals[key][_period(row.work_date, granularity)]
+        for measure in measures:
+            bucket[measure] += float(getattr(row, measure) or 0)
+    
+    def value(bucket):
+        if denominator:
+            return round(bucket[numerator] / bucket[denominator], 4) if bucket[denominator] else None
+        return round(bucket[numerator] * scale, 2)
+    
+    return {
+        "metric": metric,
+        "granularity": granularity,
+        "group_by": group_by,
+        "series": [
+            {
+                **({GROUPS[group_by]: key or None} if group_column is not None else {}),
+                "points": [{"period": period, "value": value(bucket)} for period, bucket in sorted(buckets.items())]
+            }
+            for key, buckets in sorted(totals.items(), key=lambda item: (not item[0], item[0] or 0))
+        ]
+    }
+
+# Process-wide cache of time-series answers shared by the analytics endpoints; this worker's refreshes clear it
+cube_cache = TTLCache(settings.ANALYTICS_CACHE_TTL_SECONDS)
+
+@event.listens_for(Session, "before_flush")
+def _queue_leave_days(session, flush_context, instances):
+    # Approved leave moves days between expected and on leave
+    ranges = []
+    stored_ids = []
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(instance, LeaveRequest):
+            continue
+        if instance not in session.deleted:
+            ranges.append((instance.start_date, instance.end_date))
+        if instance.id is not None:
+            stored_ids.append(instance.id)
+    if stored_ids:
+        # The stored range changes too (edited dates or status, deleted requests)
+        ranges.extend(session.connection().execute(
+            select(LeaveRequest.start_date, LeaveRequest.end_date).where(LeaveRequest.id.in_(stored_ids))
+        ).all())
+    
+    days: Set[date] = set()
+    for start_date, end_date in ranges:
+        if start_date and end_date:
+            days.update(start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1))
+    mark_days_dirty(session, days)
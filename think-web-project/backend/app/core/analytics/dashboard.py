@@ -0,0 +1,88 @@
+"""
+Dashboard counts
+
+Today's headcount, presence, lateness and approved leave come from one
+aggregate query: active employees left-joined to today's attendance_daily
+rows, with conditional counts and an EXISTS on approved leave covering
+today. The result sits in dashboard_cache until a committed write to
+attendance or leave data invalidates it, so polling dashboards cost one
+query per change rather than one per request. DASHBOARD_CACHE_TTL_SECONDS
+bounds how stale another worker's copy can be.
+"""
+from datetime import date
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import and_, case, event, exists, func
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.database.models import AttendanceDaily, AttendanceRecord, Employee, LeaveRequest
+
+# Writes to these tables change the dashboard
+WATCHED = (AttendanceRecord, AttendanceDaily, LeaveRequest, Employee)
+
+def dashboard_counts(db: Session, day: Optional[date] = None) -> Dict[str, int]:
+    """Headcount, present, clocked in, late, on leave and absent for a day, in one query"""
+    day = day or date.today()
+    present = AttendanceDaily.id.isnot(None)
+    on_leave = exists().where(
+        LeaveRequest.employee_id == Employee.id,
+        LeaveRequest.status == "approved",
+        LeaveRequest.start_date <= day,
+        LeaveRequest.end_date >= day
+    )
+    row = db.query(
+        func.count(Employee.id).label("total"),
+        func.coalesce(func.sum(case((present, 1), else_=0)), 0).label("present"),
+        func.coalesce(func.sum(case((AttendanceDaily.open_sessions > 0, 1), else_=0)), 0).label("clocked_in"),
+        func.coalesce(func.sum(case((AttendanceDaily.status == "late", 1), else_=0)), 0).label("late"),
+        # Someone on approved leave who clocked in anyway counts as present
+        func.coalesce(func.sum(case((and_(~present, on_leave), 1), else_=0)), 0).label("on_leave")
+    ).outerjoin(
+        AttendanceDaily, and_(AttendanceDaily.employee_id == Employee.id, AttendanceDaily.work_date == day)
+    ).filter(Employee.status == "active").one()
+    
+    return {
+        "total_employees": row.total,
+        "present": row.present,
+        "clocked_in": row.clocked_in,
+        "late": row.late,
+        "on_leave": row.on_leave,
+        "absent": row.total - row.present - row.on_leave
+    }
+
+def cached_dashboard_counts(db: Session) -> Dict[str, int]:
+    """dashboard_counts() for today, shared by every caller until the data changes"""
+    today = date.today()
+    return dashboard_cache.get_or_load(("dashboard", today), lambda: dashboard_counts(db, today))
+
+# Process-wide cache shared by the dashboard endpoint and the write-path invalidation below
+dashboard_cache = TTLCache(settings.DASHBOARD_CACHE_TTL_SECONDS)
+
+# Called (possibly from worker threads) after each commit that changed the counts
+dashboard_listeners: List[Callable[[], None]] = []
+
+@event.listens_for(Session, "after_flush")
+def _collect_dashboard_changes(session, flush_context):
+    if any(isinstance(instance, WATCHED) for instance in list(session.new) + list(session.dirty) + list(session.deleted)):
+        session.info["dashboard_changed"] = True
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_dashboard_changes(orm_execute_state):
+    # Bulk inserts/updates/deletes (device sync, rollup refresh, archiving) skip the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in WATCHED:
+            orm_execute_state.session.info["dashboard_changed"] = True
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_dashboard(session):
+    if session.info.pop("dashboard_changed", False):
+        dashboard_cache.invalidate()
+        for listener in dashboard_listeners:
+            listener()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_dashboard_changes(session):
+    session.info.pop("dashboard_changed", None)
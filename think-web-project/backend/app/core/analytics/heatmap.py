@@ -0,0 +1,218 @@
+"""
+Check-in time distributions
+
+A scope's check-ins (everyone, one department, one device location) are
+pulled month by month as three compact columns: day of the month, minute of
+the week and minutes late. Hot months come from attendance_records with the
+timestamp read as text, which NumPy parses far faster than datetime objects
+convert; archived months come straight from their column arrays. Each
+month's columns are cached per scope, so any range over them is a mask and
+one np.bincount per measure into a profile: three 7 x 1440 matrices of
+arrivals, late arrivals and late minutes per weekday and minute of the day.
+Heatmaps (weekday x hour), arrival percentiles (exact to the minute, from the
+cumulative counts) and late-rate curves are derived from the profile, and
+each answer is cached per (scope, range). Past months' columns change rarely
+and are kept for ANALYTICS_CLOSED_MONTH_TTL_SECONDS; heatmap_warmer reloads
+the company-wide columns of the last ANALYTICS_HEATMAP_WARM_MONTHS of them in
+the background, so ranges over past months never read them on a request.
+"""
+import asyncio
+from datetime import date, timedelta
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import String, cast
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.database.connection import SessionLocal, run_db
+from app.database.models import AttendanceRecord, Device, Employee
+from app.core.attendance.archive import attendance_archive
+from app.core.attendance.rules import LATE_GRACE_MINUTES
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 1440
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+PERCENTILES = (10, 25, 50, 75, 90)
+ARRIVALS, LATE, LATE_MINUTES = range(3)  # Profile layers
+
+def _next_month(month_start: date) -> date:
+    return date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+
+def _columns(check_in_time: np.ndarray, minutes_late: np.ndarray, month_start: date) -> Dict[str, np.ndarray]:
+    days = check_in_time.astype("datetime64[D]")
+    minute = (check_in_time - days) // np.timedelta64(1, "m")
+    weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    return {
+        "day": ((days - np.datetime64(month_start, "D")).astype(np.int64) + 1).astype(np.uint8),
+        "minute": (weekday * MINUTES_PER_DAY + minute.astype(np.int64)).astype(np.int16),
+        "minutes_late": np.clip(minutes_late, 0, np.iinfo(np.uint16).max).astype(np.uint16)
+    }
+
+def _hot_columns(db: Session, month_start: date, department_id: Optional[int], location: Optional[str]) -> Dict[str, np.ndarray]:
+    query = db.query(cast(AttendanceRecord.check_in_time, String), AttendanceRecord.minutes_late).filter(
+        AttendanceRecord.check_in_date >= month_start,
+        AttendanceRecord.check_in_date < _next_month(month_start)
+    )
+    if department_id:
+        query = query.join(Employee, Employee.id == AttendanceRecord.employee_id).filter(Employee.department_id == department_id)
+    if location:
+        query = query.join(Device, Device.id == AttendanceRecord.device_id).filter(Device.location == location)
+    
+    rows = query.all()
+    check_in_time, minutes_late = zip(*rows) if rows else ((), ())
+    return _columns(
+        np.array(check_in_time, dtype="datetime64[us]"),
+        np.array([minutes or 0 for minutes in minutes_late], dtype=np.int64),
+        month_start
+    )
+
+def _archived_columns(db: Session, month_start: date, department_id: Optional[int], location: Optional[str]) -> Optional[Dict[str, np.ndarray]]:
+    arrays = attendance_archive.load(month_start.year, month_start.month)
+    if arrays is None:
+        return None
+    
+    # Archived rows only carry employee and device ids
+    mask = np.ones(len(arrays["id"]), dtype=bool)
+    if department_id:
+        employee_ids = [row.id for row in db.query(Employee.id).filter(Employee.department_id == department_id)]
+        mask &= np.isin(arrays["employee_id"], np.array(employee_ids, dtype=np.int64))
+    if location:
+        device_ids = [row.id for row in db.query(Device.id).filter(Device.location == location)]
+        mask &= np.isin(arrays["device_id"], np.array(device_ids, dtype=np.int64))
+        if "device_id__null" in arrays:
+            mask &= ~arrays["device_id__null"]
+    # Null minutes_late is stored as 0
+    return _columns(arrays["check_in_time"][mask], arrays["minutes_late"][mask], month_start)
+
+def month_columns(db: Session, month_start: date, department_id: Optional[int] = None, location: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Cached day, minute-of-week and minutes-late columns of a month's check-ins in scope"""
+    def load():
+        # Hot rows and archived rows, as the other attendance readers combine them
+        columns = _hot_columns(db, month_start, department_id, location)
+        archived = _archived_columns(db, month_start, department_id, location)
+        if archived is not None:
+            columns = {name: np.concatenate([values, archived[name]]) for name, values in columns.items()}
+        return columns
+    cache = closed_month_cache if month_start < date.today().replace(day=1) else month_cache
+    return cache.get_or_load(("columns", department_id, location, month_start), load)
+
+def warm_closed_months(db: Session, months: int) -> int:
+    """Load the company-wide columns of the last `months` past months; returns the months loaded"""
+    month_start = date.today().replace(day=1)
+    for _ in range(months):
+        month_start = (month_start - timedelta(days=1)).replace(day=1)
+        month_columns(db, month_start)
+    return months
+
+def arrival_profile(db: Session, start_date: date, end_date: date, department_id: Optional[int] = None, location: Optional[str] = None) -> np.ndarray:
+    """Arrivals, late arrivals and late minutes per weekday and minute of the day: a 3 x 7 x 1440 array"""
+    size = 7 * MINUTES_PER_DAY
+    profile = np.zeros((3, size), dtype=np.float64)
+    month_start = start_date.replace(day=1)
+    while month_start <= end_date:
+        columns = month_columns(db, month_start, department_id, location)
+        first = max(start_date, month_start).day
+        last = min(end_date, _next_month(month_start) - timedelta(days=1)).day
+        mask = (columns["day"] >= first) & (columns["day"] <= last)
+        minute, minutes_late = columns["minute"][mask], columns["minutes_late"][mask]
+        profile[ARRIVALS] += np.bincount(minute, minlength=size)
+        # Late as in record status: past the grace period
+        profile[LATE] += np.bincount(minute, weights=minutes_late > LATE_GRACE_MINUTES, minlength=size)
+        profile[LATE_MINUTES] += np.bincount(minute, weights=minutes_late, minlength=size)
+        month_start = _next_month(month_start)
+    return profile.reshape(3, 7, MINUTES_PER_DAY)
+
+def _clock(minute: Optional[int]) -> Optional[str]:
+    return None if minute is None else f"{minute // 60:02d}:{minute % 60:02d}"
+
+def _percentiles(counts: np.ndarray) -> Dict[str, Optional[str]]:
+    # Smallest minute whose cumulative count reaches p% of the arrivals
+    total = counts.sum()
+    cumulative = np.cumsum(counts)
+    minutes = np.searchsorted(cumulative, total * np.array(PERCENTILES) / 100.0, side="left") if total else [None] * len(PERCENTILES)
+    return {f"p{p}": _clock(None if minute is None else int(minute)) for p, minute in zip(PERCENTILES, minutes)}
+
+def _rates(numerator: np.ndarray, denominator: np.ndarray, digits: int = 4) -> List:
+    # None where nothing was counted
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = np.round(numerator / denominator, digits)
+    return np.where(denominator > 0, rates, None).tolist()
+
+def summarize(profile: np.ndarray) -> Dict:
+    """Heatmaps, percentiles and late-rate curves of a profile"""
+    by_hour = profile.reshape(3, 7, 24, 60).sum(axis=3)  # layer x weekday x hour
+    arrivals, late = by_hour[ARRIVALS], by_hour[LATE]
+    per_weekday = profile.sum(axis=2)
+    per_hour = by_hour.sum(axis=1)
+    
+    return {
+        "total_arrivals": int(profile[ARRIVALS].sum()),
+        "weekdays": list(WEEKDAYS),
+        "heatmap": {
+            "arrivals": arrivals.astype(np.int64).tolist(),
+            "late": late.astype(np.int64).tolist(),
+            "late_rate": _rates(late, arrivals)
+        },
+        "percentiles": {
+            "all": _percentiles(profile[ARRIVALS].sum(axis=0)),
+            **{name: _percentiles(profile[ARRIVALS, weekday]) for weekday, name in enumerate(WEEKDAYS)}
+        },
+        "late_rate_by_weekday": _rates(per_weekday[LATE], per_weekday[ARRIVALS]),
+        "late_rate_by_hour": _rates(per_hour[LATE], per_hour[ARRIVALS]),
+        "average_late_minutes_by_weekday": _rates(per_weekday[LATE_MINUTES], per_weekday[LATE], digits=1)
+    }
+
+def arrival_heatmap(db: Session, start_date: date, end_date: date, department_id: Optional[int] = None, location: Optional[str] = None) -> Dict:
+    """Cached arrival heatmap and punctuality figures for a scope and date range"""
+    key = ("heatmap", department_id, location, start_date, end_date)
+    return heatmap_cache.get_or_load(key, lambda: {
+        "start_date": start_date,
+        "end_date": end_date,
+        "department_id": department_id,
+        "location": location,
+        **summarize(arrival_profile(db, start_date, end_date, department_id, location))
+    })
+
+class HeatmapWarmer:
+    """Background reload of past months' columns just after they expire"""
+    
+    def __init__(self, months: int, interval_seconds: float):
+        self.months = months
+        self.interval = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        if self.months > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    def _warm(self):
+        db = SessionLocal()
+        try:
+            warm_closed_months(db, self.months)
+        finally:
+            db.close()
+    
+    async def _run(self):
+        while True:
+            try:
+                await run_db(self._warm)
+            except Exception:
+                logger.exception("Warming arrival heatmap months failed")
+            await asyncio.sleep(self.interval)
+
+# Process-wide caches shared by the analytics endpoints: month columns (a few MB each) and answers
+month_cache = TTLCache(settings.ANALYTICS_CACHE_TTL_SECONDS, max_entries=48)
+closed_month_cache = TTLCache(settings.ANALYTICS_CLOSED_MONTH_TTL_SECONDS, max_entries=48)
+heatmap_cache = TTLCache(settings.ANALYTICS_CACHE_TTL_SECONDS)
+
+# Process-wide warmer started and stopped with the app
+heatmap_warmer = HeatmapWarmer(settings.ANALYTICS_HEATMAP_WARM_MONTHS, settings.ANALYTICS_CLOSED_MONTH_TTL_SECONDS)
@@ -0,0 +1 @@
+# Attendance modules
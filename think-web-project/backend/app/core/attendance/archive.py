@@ -0,0 +1,293 @@
+"""
+Cold storage for closed attendance months
+
+attendance_records only holds the hot window: the current month and the
+ATTENDANCE_HOT_MONTHS - 1 months before it. archive_months() moves older
+months into one compressed, columnar file per month
+(ATTENDANCE_ARCHIVE_DIR/attendance-YYYY-MM.npz: one NumPy array per column,
+rows sorted by (check_in_time, id)). The table and its indexes therefore stay
+at a fixed size, while listings, exports and rollup rebuilds whose date range
+reaches past the hot window read the archived months through
+attendance_archive.
+
+A month file is written and read back before its rows are deleted (in
+batches), and re-archiving a month merges with its existing file by id, so an
+interrupted run can simply be repeated. attendance_daily keeps its rows for
+archived days.
+"""
+from collections import OrderedDict, namedtuple
+from datetime import date, datetime
+import os
+from pathlib import Path
+import re
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Boolean, Date, DateTime, Integer, Numeric, delete, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database.models import AnomalyDetection, AttendanceRecord, DevicePunch
+
+IN_CHUNK = 500  # Bound parameters per IN (...) lookup
+NULL_SUFFIX = "__null"  # Companion mask for nullable columns without a native missing value
+FILE_PATTERN = re.compile(r"attendance-(\d{4})-(\d{2})\.npz$")
+
+COLUMNS = list(AttendanceRecord.__table__.columns)
+FIELDS = [column.name for column in COLUMNS]
+
+# Archived rows expose the same attributes as AttendanceRecord
+ArchivedRecord = namedtuple("ArchivedRecord", FIELDS)
+
+def _kind(column) -> str:
+    if isinstance(column.type, Boolean):
+        return "bool"
+    if isinstance(column.type, Integer):
+        return "int"
+    if isinstance(column.type, DateTime):
+        return "datetime"
+    if isinstance(column.type, Date):
+        return "date"
+    if isinstance(column.type, Numeric):
+        return "float"
+    return "str"
+
+KINDS = [_kind(column) for column in COLUMNS]
+DTYPES = {"int": np.int64, "float": np.float64, "bool": np.bool_, "str": np.str_, "datetime": "datetime64[us]", "date": "datetime64[D]"}
+FILL = {"int": 0, "float": np.nan, "bool": False, "str": ""}  # Stored under the null mask; datetimes use NaT
+
+def _chunks(values: List, size: int = IN_CHUNK):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _month_bounds(year: int, month: int) -> Tuple[date, date]:
+    """First day of the month and of the next one"""
+    return date(year, month, 1), date(year + month // 12, month % 12 + 1, 1)
+
+def hot_window_start(today: Optional[date] = None) -> date:
+    """First day kept in attendance_records; earlier months are archived"""
+    today = today or date.today()
+    months = today.year * 12 + today.month - 1 - (max(1, settings.ATTENDANCE_HOT_MONTHS) - 1)
+    return date(months // 12, months % 12 + 1, 1)
+
+def _encode(rows: Sequence[Sequence]) -> Dict[str, np.ndarray]:
+    arrays = {}
+    for position, (name, kind) in enumerate(zip(FIELDS, KINDS)):
+        values = [row[position] for row in rows]
+        if kind in FILL:
+            nulls = np.array([value is None for value in values], dtype=bool)
+            if nulls.any():
+                arrays[name + NULL_SUFFIX] = nulls
+                values = [FILL[kind] if value is None else value for value in values]
+        arrays[name] = np.array(values, dtype=DTYPES[kind])
+    return arrays
+
+def _fill_missing(arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Month files written before a column existed read it as all null"""
+    count = len(arrays["id"])
+    for name, kind in zip(FIELDS, KINDS):
+        if name in arrays:
+            continue
+        if kind in FILL:
+            arrays[name] = np.full(count, FILL[kind], dtype=DTYPES[kind])
+            arrays[name + NULL_SUFFIX] = np.ones(count, dtype=bool)
+        else:
+            arrays[name] = np.full(count, np.datetime64("NaT"), dtype=DTYPES[kind])
+    return arrays
+
+def _decode(arrays: Dict[str, np.ndarray], index: np.ndarray) -> List[ArchivedRecord]:
+    columns = []
+    for name in FIELDS:
+        values = arrays[name][index].tolist()  # NaT comes back as None
+        nulls = arrays.get(name + NULL_SUFFIX)
+        if nulls is not None:
+            values = [None if null else value for value, null in zip(values, nulls[index].tolist())]
+        columns.append(values)
+    return [ArchivedRecord(*row) for row in zip(*columns)]
+
+class AttendanceArchive:
+    """Per-month columnar files of archived attendance records"""
+    
+    def __init__(self, directory: Path, max_cached_months: int = 3):
+        self.directory = Path(directory)
+        self.max_cached_months = max_cached_months
+        self._cache: "OrderedDict[Tuple[int, int], tuple]" = OrderedDict()  # month -> (mtime_ns, arrays)
+        self._lock = threading.Lock()
+    
+    def path(self, year: int, month: int) -> Path:
+        return self.directory / f"attendance-{year:04d}-{month:02d}.npz"
+    
+    def months(self) -> List[Tuple[int, int]]:
+        """Archived (year, month) pairs, oldest first"""
+        if not self.directory.is_dir():
+            return []
+        found = (FILE_PATTERN.match(path.name) for path in self.directory.iterdir())
+        return sorted((int(match.group(1)), int(match.group(2))) for match in found if match)
+    
+    def months_between(self, start_date: Optional[date], end_date: Optional[date]) -> List[Tuple[int, int]]:
+        """Archived months overlapping [start_date, end_date] (None is unbounded)"""
+        return [
+            (year, month) for year, month in self.months()
+            if (start_date is None or _month_bounds(year, month)[1] > start_date)
+            and (end_date is None or date(year, month, 1) <= end_date)
+        ]
+    
+    def load(self, year: int, month: int) -> Optional[Dict[str, np.ndarray]]:
+        """A month's column arrays, or None if it is not archived"""
+        path = self.path(year, month)
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._cache.get((year, month))
+            if cached and cached[0] == mtime:
+                self._cache.move_to_end((year, month))
+                return cached[1]
+        
+        with np.load(path, allow_pickle=False) as archive:
+            arrays = _fill_missing({name: archive[name] for name in archive.files})
+        with self._lock:
+            self._cache[(year, month)] = (mtime, arrays)
+            self._cache.move_to_end((year, month))
+            while len(self._cache) > self.max_cached_months:
+                self._cache.popitem(last=False)
+        return arrays
+    
+    def write(self, year: int, month: int, rows: Sequence[Sequence]) -> int:
+        """Atomically replace a month's file with rows (tuples in FIELDS order)"""
+        rows = sorted(rows, key=lambda row: (row[FIELDS.index("check_in_time")], row[FIELDS.index("id")]))
+        arrays = _encode(rows)
+        path = self.path(year, month)
+        temporary = path.with_name(path.name + ".tmp")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(temporary, "wb") as handle:
+            np.savez_compressed(handle, **arrays)
+            handle.flush()
+            os.fsync(handle.fileno())
+        
+        # Read back before anything is deleted from the hot table
+        with np.load(temporary, allow_pickle=False) as written:
+            if not np.array_equal(written["id"], arrays["id"]):
+                temporary.unlink()
+                raise IOError(f"Archive {path.name} failed verification")
+        os.replace(temporary, path)
+        with self._lock:
+            self._cache.pop((year, month), None)
+        return len(rows)
+    
+    def _select(self, arrays: Dict[str, np.ndarray], start_date: Optional[date], end_date: Optional[date],
+                employee_ids: Optional[Sequence[int]], before: Optional[Tuple[datetime, int]] = None) -> np.ndarray:
+        mask = np.ones(len(arrays["id"]), dtype=bool)
+        if start_date:
+            mask &= arrays["check_in_date"] >= np.datetime64(start_date, "D")
+        if end_date:
+            mask &= arrays["check_in_date"] <= np.datetime64(end_date, "D")
+        if employee_ids is not None:
+            mask &= np.isin(arrays["employee_id"], np.asarray(employee_ids, dtype=np.int64))
+        if before:
+            check_in_time, row_id = np.datetime64(before[0], "us"), before[1]
+            mask &= (arrays["check_in_time"] < check_in_time) | ((arrays["check_in_time"] == check_in_time) & (arrays["id"] < row_id))
+        return np.flatnonzero(mask)
+    
+    def rows(self, start_date: Optional[date] = None, end_date: Optional[date] = None,
+             employee_ids: Optional[Sequence[int]] = None, batch_size: int = 2000) -> Iterator[List[ArchivedRecord]]:
+        """Matching archived records in check-in order, in batches"""
+        for year, month in self.months_between(start_date, end_date):
+            arrays = self.load(year, month)
+            index = self._select(arrays, start_date, end_date, employee_ids)
+            for start in range(0, len(index), batch_size):
+                yield _decode(arrays, index[start:start + batch_size])
+    
+    def page(self, employee_id: Optional[int] = None, start_date: Optional[date] = None, end_date: Optional[date] = None,
+             before: Optional[Tuple[datetime, int]] = None, limit: int = 100, offset: int = 0) -> Tuple[List[ArchivedRecord], bool]:
+        """
+        Archived records newest first, after the (check_in_time, id) key
+        `before` if given. Returns the page and whether more rows follow.
+        """
+        employee_ids = [employee_id] if employee_id else None
+        wanted = offset + limit + 1
+        picked, found = [], 0
+        for year, month in reversed(self.months_between(start_date, end_date)):
+            arrays = self.load(year, month)
+            index = self._select(arrays, start_date, end_date, employee_ids, before)[::-1][:wanted - found]
+            if len(index):
+                picked.append((arrays, index))
+                found += len(index)
+            if found >= wanted:
+                break
+        
+        # Only the rows of this page are turned into Python objects
+        rows, position = [], 0
+        for arrays, index in picked:
+            low, high = max(0, offset - position), max(0, offset + limit - position)
+            if low < high:
+                rows.extend(_decode(arrays, index[low:high]))
+            position += len(index)
+        return rows, found > offset + limit
+    
+    def invalidate(self):
+        """Drop every cached month"""
+        with self._lock:
+            self._cache.clear()
+
+def archive_month(db: Session, archive: AttendanceArchive, year: int, month: int, batch_size: int = 5000) -> int:
+    """
+    Move one closed month out of attendance_records into its archive file,
+    returning the number of records archived.
+    """
+    start, end = _month_bounds(year, month)
+    if end > hot_window_start():
+        raise ValueError(f"{year}-{month:02d} is inside the hot window")
+    
+    table = AttendanceRecord.__table__
+    rows = [tuple(row) for row in db.execute(
+        select(table).where(table.c.check_in_date >= start, table.c.check_in_date < end)
+    )]
+    if not rows:
+        return 0
+    
+    # A previous, interrupted run may already have archived part of the month
+    existing = archive.load(year, month)
+    if existing is not None:
+        fresh_ids = {row[0] for row in rows}
+        kept = _decode(existing, np.arange(len(existing["id"])))
+        rows.extend(tuple(row) for row in kept if row.id not in fresh_ids)
+    archive.write(year, month, rows)
+    
+    # Delete in batches; device punches and anomaly findings stay but lose the link
+    archived_ids = sorted(row[0] for row in rows)
+    for batch in _chunks(archived_ids, batch_size):
+        for chunk in _chunks(batch):
+            db.execute(update(DevicePunch).where(DevicePunch.attendance_record_id.in_(chunk)).values(attendance_record_id=None))
+            db.execute(update(AnomalyDetection).where(AnomalyDetection.attendance_record_id.in_(chunk)).values(attendance_record_id=None))
+            db.execute(delete(AttendanceRecord).where(AttendanceRecord.id.in_(chunk)))
+        db.commit()
+    return len(archived_ids)
+
+def archive_months(db: Session, archive: AttendanceArchive, before: Optional[date] = None, batch_size: int = 5000) -> Dict[str, int]:
+    """Archive every month with records before the hot window (or before `before`, if earlier)"""
+    cutoff = hot_window_start()
+    if before and before < cutoff:
+        cutoff = before.replace(day=1)
+    
+    stats = {"months": 0, "records": 0}
+    oldest = db.query(AttendanceRecord.check_in_date).filter(
+        AttendanceRecord.check_in_date.isnot(None),
+        AttendanceRecord.check_in_date < cutoff
+    ).order_by(AttendanceRecord.check_in_date).first()
+    if oldest is None:
+        return stats
+    
+    year, month = oldest[0].year, oldest[0].month
+    while date(year, month, 1) < cutoff:
+        archived = archive_month(db, archive, year, month, batch_size=batch_size)
+        if archived:
+            stats["months"] += 1
+            stats["records"] += archived
+        year, month = year + month // 12, month % 12 + 1
+    return stats
+
+# Process-wide archive reader shared by the attendance endpoints, export and rollup rebuilds
+attendance_archive = AttendanceArchive(settings.ATTENDANCE_ARCHIVE_DIR)
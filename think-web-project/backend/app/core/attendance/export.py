@@ -0,0 +1,138 @@
+"""
+Streaming attendance export
+
+Rows are read through a server-side cursor (yield_per) as plain tuples, never
+hydrated as ORM objects, and each batch is serialized to CSV or NDJSON (and
+optionally gzip-compressed) before the next one is fetched. Memory therefore
+stays at one batch whatever the date range, so a full year can be pulled in
+a single request. Months moved to the cold archive are streamed first, in
+the same batches, when the range reaches past the hot window.
+
+StreamingResponse iterates the export in the threadpool, so it reads through
+StreamingSessionLocal: on SQLite that is a connection of its own rather than
+the StaticPool one the request handlers share.
+"""
+import csv
+from datetime import date, datetime
+from decimal import Decimal
+import io
+import json
+from typing import Iterator, List, Optional
+import zlib
+
+from sqlalchemy import select
+
+from app.database.connection import StreamingSessionLocal
+from app.database.models import AttendanceRecord, Employee
+from app.core.attendance.archive import attendance_archive
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+EXPORT_BATCH = 2000  # Rows fetched from the cursor and serialized per chunk
+
+COLUMNS = (
+    AttendanceRecord.id,
+    AttendanceRecord.employee_id,
+    Employee.employee_id.label("employee_code"),
+    Employee.department_id,
+    AttendanceRecord.check_in_date,
+    AttendanceRecord.check_in_time,
+    AttendanceRecord.check_out_time,
+    AttendanceRecord.method,
+    AttendanceRecord.status,
+    AttendanceRecord.minutes_late,
+    AttendanceRecord.minutes_early,
+    AttendanceRecord.work_duration_minutes,
+    AttendanceRecord.device_id,
+    AttendanceRecord.confidence_score,
+    AttendanceRecord.is_override
+)
+FIELDS = [column.key for column in COLUMNS]
+
+def export_statement(employee_id: Optional[int] = None, department_id: Optional[int] = None, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """Select of the export columns for the filters, in check-in order"""
+    stmt = select(*COLUMNS).join(Employee, Employee.id == AttendanceRecord.employee_id)
+    if employee_id:
+        stmt = stmt.where(AttendanceRecord.employee_id == employee_id)
+    if department_id:
+        stmt = stmt.where(Employee.department_id == department_id)
+    if start_date:
+        stmt = stmt.where(AttendanceRecord.check_in_date >= start_date)
+    if end_date:
+        stmt = stmt.where(AttendanceRecord.check_in_date <= end_date)
+    return stmt.order_by(AttendanceRecord.check_in_time, AttendanceRecord.id)
+
+def archived_export_rows(employee_id: Optional[int] = None, department_id: Optional[int] = None, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Iterator[List[tuple]]:
+    """Batches of export rows from archived months for the filters, in check-in order"""
+    db = StreamingSessionLocal()
+    try:
+        employees = {row.id: (row.employee_id, row.department_id) for row in db.query(Employee.id, Employee.employee_id, Employee.department_id)}
+    finally:
+        db.close()
+    
+    # Same filters and inner join to employees as export_statement
+    employee_ids = [
+        row_id for row_id, (_, row_department) in employees.items()
+        if (not employee_id or row_id == employee_id) and (not department_id or row_department == department_id)
+    ]
+    for records in attendance_archive.rows(start_date, end_date, employee_ids, batch_size=EXPORT_BATCH):
+        yield [
+            tuple(
+                employees[record.employee_id][0] if field == "employee_code"
+                else employees[record.employee_id][1] if field == "department_id"
+                else getattr(record, field)
+                for field in FIELDS
+            )
+            for record in records
+        ]
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _csv_chunk(rows, header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(FIELDS)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+def _ndjson_chunk(rows) -> str:
+    return "".join(
+        json.dumps(dict(zip(FIELDS, row)), default=_json_value, separators=(",", ":")) + "\n"
+        for row in rows
+    )
+
+def _serialized(stmt, fmt: str, archived: Optional[Iterator[List[tuple]]]) -> Iterator[bytes]:
+    db = StreamingSessionLocal()
+    try:
+        header = fmt == "csv"
+        if header:
+            yield _csv_chunk([], header=True).encode()
+        for rows in archived or ():
+            chunk = _csv_chunk(rows, header=False) if header else _ndjson_chunk(rows)
+            yield chunk.encode()
+        
+        result = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH))
+        for rows in result.partitions():
+            chunk = _csv_chunk(rows, header=False) if header else _ndjson_chunk(rows)
+            yield chunk.encode()
+    finally:
+        # Also runs when the client disconnects mid-stream
+        db.close()
+
+def _gzipped(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def stream_export(stmt, fmt: str = "csv", compress: bool = False, archived: Optional[Iterator[List[tuple]]] = None) -> Iterator[bytes]:
+    """Byte chunks of the export (archived batches first), read in batches over a dedicated connection"""
+    chunks = _serialized(stmt, fmt, archived)
+    return _gzipped(chunks) if compress else chunks
@@ -0,0 +1,278 @@
+"""
+Geofence validation for check-in locations
+
+Active fences are held as NumPy arrays (centre, radius, and an optional
+polygon outline padded to a common vertex count) plus a uniform lat/lng grid
+mapping each cell to the fences overlapping it. An employee may punch inside
+any fence assigned to them directly or to their department; an employee with
+no fences is unrestricted.
+
+A check tests the allowed fences in the point's grid cell with one vectorized
+haversine distance and, for polygon fences, one vectorized ray cast, so the
+punch path costs microseconds however many sites exist. The same pairwise
+test validates whole batches of historical records.
+"""
+from collections import defaultdict
+import threading
+import time as clock
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database.models import AttendanceRecord, Employee, EmployeeGeofence, Geofence
+
+EARTH_RADIUS_METERS = 6371008.8
+GRID_DEGREES = 0.01  # Grid cell size (about 1.1km north-south)
+MAX_CELLS_PER_FENCE = 400  # Fences covering more cells are tested everywhere instead
+DIRECT_TEST_LIMIT = 32  # Employees with at most this many fences skip the grid lookup
+
+STATUSES = ("inside", "outside", "no_location", "unrestricted")
+_NO_FENCES = np.zeros(0, dtype=np.int64)
+
+class GeofenceResult(NamedTuple):
+    status: str  # inside, outside, no_location, unrestricted
+    geofence_id: Optional[int]  # Fence containing the point, when inside
+
+def haversine_meters(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Great-circle distance between coordinate arrays, in meters"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def points_in_polygons(lat: np.ndarray, lng: np.ndarray, vertices: np.ndarray) -> np.ndarray:
+    """
+    Even-odd ray cast of point i against polygon i for every i at once.
+    vertices is (n, V, 2) lat/lng, each outline padded by repeating its first
+    vertex (zero-length edges never cross the ray).
+    """
+    y0, x0 = vertices[:, :, 0], vertices[:, :, 1]
+    y1, x1 = np.roll(y0, -1, axis=1), np.roll(x0, -1, axis=1)
+    y, x = lat[:, None], lng[:, None]
+    straddles = (y0 > y) != (y1 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing_x = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    crossings = straddles & (x < crossing_x)
+    return (np.count_nonzero(crossings, axis=1) % 2) == 1
+
+def _cell(lat: float, lng: float) -> Tuple[int, int]:
+    return int(np.floor(lat / GRID_DEGREES)), int(np.floor(lng / GRID_DEGREES))
+
+class GeofenceIndex:
+    """Active fences, their grid and employee/department assignments, rebuilt when they change"""
+    
+    def __init__(self, ttl_seconds: float):
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+        self._stale = True
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.centers = np.zeros((0, 2), dtype=np.float64)
+        self.radii = np.zeros(0, dtype=np.float64)
+        self.has_polygon = np.zeros(0, dtype=bool)
+        self.vertices = np.zeros((0, 1, 2), dtype=np.float64)
+        self._grid: Dict[Tuple[int, int], np.ndarray] = {}
+        self._everywhere = np.zeros(0, dtype=np.int64)
+        self._by_employee: Dict[int, np.ndarray] = {}
+        self._by_department: Dict[int, np.ndarray] = {}
+    
+    def invalidate(self):
+        self._stale = True
+    
+    def ensure_loaded(self, db: Session):
+        """Rebuild on first use, after a fence or assignment change, and after the TTL"""
+        if not self._stale and clock.monotonic() - self._loaded_at < self.ttl:
+            return
+        with self._lock:
+            if not self._stale and clock.monotonic() - self._loaded_at < self.ttl:
+                return
+            self._stale = False  # Set first so a change committed mid-load marks it stale again
+            try:
+                self.load(db)
+            except Exception:
+                self._stale = True
+                raise
+    
+    def load(self, db: Session):
+        """Build the arrays, grid and assignment maps (two queries)"""
+        fences = db.query(
+            Geofence.id, Geofence.center_lat, Geofence.center_lng, Geofence.radius_meters,
+            Geofence.polygon, Geofence.department_id
+        ).filter(Geofence.is_active == True).order_by(Geofence.id).all()
+        
+        ids = np.array([fence.id for fence in fences], dtype=np.int64)
+        centers = np.array([(float(fence.center_lat), float(fence.center_lng)) for fence in fences], dtype=np.float64).reshape(-1, 2)
+        radii = np.array([fence.radius_meters for fence in fences], dtype=np.float64)
+        
+        # Polygons padded to a common vertex count with their first vertex
+        outlines = [np.asarray(fence.polygon, dtype=np.float64) if fence.polygon else None for fence in fences]
+        width = max([len(outline) for outline in outlines if outline is not None] + [1])
+        vertices = np.zeros((len(fences), width, 2), dtype=np.float64)
+        has_polygon = np.zeros(len(fences), dtype=bool)
+        for position, outline in enumerate(outlines):
+            if outline is not None and len(outline) >= 3:
+                vertices[position, :len(outline)] = outline
+                vertices[position, len(outline):] = outline[0]
+                has_polygon[position] = True
+        
+        # Grid cells overlapped by each fence's bounding box
+        cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        everywhere = []
+        for position, ((lat, lng), radius) in enumerate(zip(centers, radii)):
+            lat_span = np.degrees(radius / EARTH_RADIUS_METERS)
+            lng_span = lat_span / max(np.cos(np.radians(lat)), 1e-6)
+            low = _cell(lat - lat_span, lng - lng_span)
+            high = _cell(lat + lat_span, lng + lng_span)
+            if (high[0] - low[0] + 1) * (high[1] - low[1] + 1) > MAX_CELLS_PER_FENCE:
+                everywhere.append(position)
+                continue
+            for row in range(low[0], high[0] + 1):
+                for column in range(low[1], high[1] + 1):
+                    cells[(row, column)].append(position)
+        
+        position_of = {fence_id: position for position, fence_id in enumerate(ids.tolist())}
+        by_employee: Dict[int, List[int]] = defaultdict(list)
+        for employee_id, geofence_id in db.query(EmployeeGeofence.employee_id, EmployeeGeofence.geofence_id):
+            if geofence_id in position_of:
+                by_employee[employee_id].append(position_of[geofence_id])
+        by_department: Dict[int, List[int]] = defaultdict(list)
+        for fence in fences:
+            if fence.department_id is not None:
+                by_department[fence.department_id].append(position_of[fence.id])
+        
+        self.ids, self.centers, self.radii = ids, centers, radii
+        self.vertices, self.has_polygon = vertices, has_polygon
+        self._grid = {cell: np.array(positions, dtype=np.int64) for cell, positions in cells.items()}
+        self._everywhere = np.array(everywhere, dtype=np.int64)
+        self._by_employee = {key: np.unique(value) for key, value in by_employee.items()}
+        self._by_department = {key: np.unique(value) for key, value in by_department.items()}
+        self._loaded_at = clock.monotonic()
+    
+    def allowed(self, employee_id: int, department_id: Optional[int]) -> np.ndarray:
+        """Sorted fence positions the employee may punch inside"""
+        direct = self._by_employee.get(employee_id)
+        shared = self._by_department.get(department_id) if department_id is not None else None
+        if direct is None:
+            return shared if shared is not None else _NO_FENCES
+        if shared is None:
+            return direct
+        return np.union1d(direct, shared)
+    
+    def contains(self, positions: np.ndarray, lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+        """Whether point i lies inside fence positions[i], for every i at once"""
+        inside = haversine_meters(lat, lng, self.centers[positions, 0], self.centers[positions, 1]) <= self.radii[positions]
+        outlined = inside & self.has_polygon[positions]
+        if outlined.any():
+            inside[outlined] = points_in_polygons(lat[outlined], lng[outlined], self.vertices[positions[outlined]])
+        return inside
+    
+    def candidates(self, allowed: np.ndarray, lat: float, lng: float) -> np.ndarray:
+        """Allowed fences that can contain the point: all of them when few, else those in its grid cell"""
+        if len(allowed) <= DIRECT_TEST_LIMIT:
+            return allowed
+        nearby = self._grid.get(_cell(lat, lng))
+        if len(self._everywhere):
+            nearby = self._everywhere if nearby is None else np.concatenate([nearby, self._everywhere])
+        if nearby is None:
+            return _NO_FENCES
+        # Membership of the few nearby fences in the sorted allowed set
+        slots = np.minimum(np.searchsorted(allowed, nearby), len(allowed) - 1)
+        return nearby[allowed[slots] == nearby]
+    
+    def check(self, employee_id: int, department_id: Optional[int], lat: Optional[float], lng: Optional[float]) -> GeofenceResult:
+        """Validate one punch location against the employee's fences"""
+        return self.check_many([employee_id], [department_id], [lat], [lng])[0]
+    
+    def check_many(self, employee_ids: List[int], department_ids: List[Optional[int]], lats: List[Optional[float]], lngs: List[Optional[float]]) -> List[GeofenceResult]:
+        """Validate a batch of locations with one pairwise test over every (record, candidate fence)"""
+        results: List[Optional[GeofenceResult]] = [None] * len(employee_ids)
+        owners, positions, points = [], [], []
+        for i, (employee_id, department_id, lat, lng) in enumerate(zip(employee_ids, department_ids, lats, lngs)):
+            allowed = self.allowed(employee_id, department_id)
+            if len(allowed) == 0:
+                results[i] = GeofenceResult("unrestricted", None)
+                continue
+            if lat is None or lng is None:
+                results[i] = GeofenceResult("no_location", None)
+                continue
+            
+            results[i] = GeofenceResult("outside", None)
+            lat, lng = float(lat), float(lng)
+            candidates = self.candidates(allowed, lat, lng)
+            if len(candidates):
+                owners.append(np.full(len(candidates), i, dtype=np.int64))
+                positions.append(candidates)
+                points.append(np.broadcast_to((lat, lng), (len(candidates), 2)))
+        
+        if owners:
+            owner = np.concatenate(owners)
+            position = np.concatenate(positions)
+            point = np.concatenate(points)
+            inside = self.contains(position, point[:, 0], point[:, 1])
+            
+            # First containing fence per record
+            for i, fence in zip(owner[inside].tolist(), position[inside].tolist()):
+                if results[i].status == "outside":
+                    results[i] = GeofenceResult("inside", int(self.ids[fence]))
+        return results
+
+def revalidate_records(db: Session, index: GeofenceIndex, start_date=None, end_date=None, batch_size: int = 5000) -> Dict[str, int]:
+    """
+    Re-check stored check-in locations against the current fences in
+    id-ordered batches, committing each batch so the job can be resumed.
+    """
+    index.ensure_loaded(db)
+    stats = {"checked": 0, **{status: 0 for status in STATUSES}}
+    last_id = 0
+    
+    while True:
+        query = db.query(
+            AttendanceRecord.id, AttendanceRecord.employee_id, Employee.department_id,
+            AttendanceRecord.location_lat, AttendanceRecord.location_lng
+        ).join(Employee, Employee.id == AttendanceRecord.employee_id).filter(AttendanceRecord.id > last_id)
+        if start_date:
+            query = query.filter(AttendanceRecord.check_in_date >= start_date)
+        if end_date:
+            query = query.filter(AttendanceRecord.check_in_date <= end_date)
+        batch = query.order_by(AttendanceRecord.id).limit(batch_size).all()
+        if not batch:
+            break
+        
+        results = index.check_many(
+            [row.employee_id for row in batch],
+            [row.department_id for row in batch],
+            [row.location_lat for row in batch],
+            [row.location_lng for row in batch]
+        )
+        db.execute(update(AttendanceRecord), [
+            {"id": row.id, "geofence_status": result.status, "geofence_id": result.geofence_id}
+            for row, result in zip(batch, results)
+        ])
+        db.commit()
+        
+        last_id = batch[-1].id
+        stats["checked"] += len(batch)
+        for result in results:
+            stats[result.status] += 1
+    return stats
+
+# Process-wide index shared by check-in, device sync and re-validation
+geofence_index = GeofenceIndex(settings.GEOFENCE_INDEX_TTL_SECONDS)
+
+@event.listens_for(Session, "after_flush")
+def _collect_geofence_changes(session, flush_context):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, (Geofence, EmployeeGeofence)):
+            session.info["geofences_changed"] = True
+            return
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_geofence_changes(session):
+    if session.info.pop("geofences_changed", False):
+        geofence_index.invalidate()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_geofence_changes(session):
+    session.info.pop("geofences_changed", None)
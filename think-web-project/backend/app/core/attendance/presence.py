@@ -0,0 +1,205 @@
+"""
+Live presence registry: who is clocked in on the current work day
+
+Holds, per employee, the open attendance record and the day's first record,
+plus the set of late arrivals, so duplicate check-in detection, /today and
+the dashboard counts are O(1) lookups instead of queries. It is rebuilt from
+the database with one query at startup and whenever the work day rolls over.
+
+The in-process backend is the default; PRESENCE_BACKEND=redis shares the
+registry through REDIS_URL when the API runs several workers.
+"""
+from datetime import date
+import threading
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database.models import AttendanceRecord
+
+try:
+    import redis
+except ImportError:  # Only needed for PRESENCE_BACKEND=redis
+    redis = None
+
+# (employee_id, record_id, is_open, is_late), in check-in order
+PresenceRow = Tuple[int, int, bool, bool]
+
+def _collect(rows: Iterable[PresenceRow]) -> Tuple[Dict[int, int], Dict[int, int], Set[int]]:
+    """Split rows into open record per employee, first record per employee, and late employees"""
+    opened, first, late = {}, {}, set()
+    for employee_id, record_id, is_open, is_late in rows:
+        first.setdefault(employee_id, record_id)
+        if is_open:
+            opened[employee_id] = record_id
+        if is_late:
+            late.add(employee_id)
+    return opened, first, late
+
+class MemoryPresenceBackend:
+    """Presence held in this process (single worker deployments)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day: Optional[date] = None
+        self._open: Dict[int, int] = {}
+        self._first: Dict[int, int] = {}
+        self._late = set()
+    
+    def work_day(self) -> Optional[date]:
+        return self._day
+    
+    def reset(self, day: date, rows: Iterable[PresenceRow]):
+        opened, first, late = _collect(rows)
+        with self._lock:
+            self._day, self._open, self._first, self._late = day, opened, first, late
+    
+    def open_record(self, employee_id: int) -> Optional[int]:
+        return self._open.get(employee_id)
+    
+    def first_record(self, employee_id: int) -> Optional[int]:
+        return self._first.get(employee_id)
+    
+    def check_in(self, employee_id: int, record_id: int, is_late: bool):
+        with self._lock:
+            self._open[employee_id] = record_id
+            self._first.setdefault(employee_id, record_id)
+            if is_late:
+                self._late.add(employee_id)
+    
+    def check_out(self, employee_id: int, record_id: int):
+        with self._lock:
+            if self._open.get(employee_id) == record_id:
+                del self._open[employee_id]
+    
+    def counts(self) -> Dict[str, int]:
+        return {"present": len(self._first), "clocked_in": len(self._open), "late": len(self._late)}
+
+class RedisPresenceBackend:
+    """Presence shared by all workers through Redis hashes keyed by work day"""
+    
+    KEY_TTL_SECONDS = 2 * 24 * 3600
+    
+    def __init__(self, url: str, prefix: str = "presence"):
+        if redis is None:
+            raise RuntimeError("PRESENCE_BACKEND=redis requires the redis package")
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+    
+    def _key(self, name: str) -> str:
+        return f"{self._prefix}:{name}"
+    
+    def work_day(self) -> Optional[date]:
+        day = self._client.get(self._key("day"))
+        return date.fromisoformat(day) if day else None
+    
+    def reset(self, day: date, rows: Iterable[PresenceRow]):
+        opened, first, late = _collect(rows)
+        
+        pipe = self._client.pipeline(transaction=True)
+        pipe.delete(self._key("open"), self._key("first"), self._key("late"))
+        if opened:
+            pipe.hset(self._key("open"), mapping=opened)
+        if first:
+            pipe.hset(self._key("first"), mapping=first)
+        if late:
+            pipe.sadd(self._key("late"), *late)
+        for name in ("open", "first", "late"):
+            pipe.expire(self._key(name), self.KEY_TTL_SECONDS)
+        pipe.set(self._key("day"), day.isoformat(), ex=self.KEY_TTL_SECONDS)
+        pipe.execute()
+    
+    def open_record(self, employee_id: int) -> Optional[int]:
+        record_id = self._client.hget(self._key("open"), employee_id)
+        return int(record_id) if record_id else None
+    
+    def first_record(self, employee_id: int) -> Optional[int]:
+        record_id = self._client.hget(self._key("first"), employee_id)
+        return int(record_id) if record_id else None
+    
+    def check_in(self, employee_id: int, record_id: int, is_late: bool):
+        pipe = self._client.pipeline(transaction=True)
+        pipe.hset(self._key("open"), employee_id, record_id)
+        pipe.hsetnx(self._key("first"), employee_id, record_id)
+        if is_late:
+            pipe.sadd(self._key("late"), employee_id)
+        pipe.execute()
+    
+    def check_out(self, employee_id: int, record_id: int):
+        if self.open_record(employee_id) == record_id:
+            self._client.hdel(self._key("open"), employee_id)
+    
+    def counts(self) -> Dict[str, int]:
+        pipe = self._client.pipeline(transaction=False)
+        pipe.hlen(self._key("first"))
+        pipe.hlen(self._key("open"))
+        pipe.scard(self._key("late"))
+        present, clocked_in, late = pipe.execute()
+        return {"present": present, "clocked_in": clocked_in, "late": late}
+
+class PresenceRegistry:
+    """Keeps the backend on the current work day and applies punches to it"""
+    
+    def __init__(self, backend):
+        self.backend = backend
+        self._load_lock = threading.Lock()
+    
+    def load(self, db: Session, day: Optional[date] = None):
+        """Rebuild presence for the work day from its attendance records (one query)"""
+        day = day or date.today()
+        rows = db.query(
+            AttendanceRecord.employee_id,
+            AttendanceRecord.id,
+            AttendanceRecord.check_out_time,
+            AttendanceRecord.status
+        ).filter(
+            AttendanceRecord.check_in_date == day
+        ).order_by(AttendanceRecord.check_in_time).all()
+        self.backend.reset(day, (
+            (employee_id, record_id, check_out_time is None, status == "late")
+            for employee_id, record_id, check_out_time, status in rows
+        ))
+    
+    def ensure_current(self, db: Session) -> date:
+        """Load on first use and again when the work day rolls over"""
+        today = date.today()
+        if self.backend.work_day() != today:
+            with self._load_lock:
+                if self.backend.work_day() != today:
+                    self.load(db, today)
+        return today
+    
+    def open_record(self, db: Session, employee_id: int) -> Optional[int]:
+        """Id of the employee's open record today, if clocked in"""
+        self.ensure_current(db)
+        return self.backend.open_record(employee_id)
+    
+    def first_record(self, db: Session, employee_id: int) -> Optional[int]:
+        """Id of the employee's first record today, if any"""
+        self.ensure_current(db)
+        return self.backend.first_record(employee_id)
+    
+    def counts(self, db: Session) -> Dict[str, int]:
+        """Employees present today, currently clocked in, and late today"""
+        self.ensure_current(db)
+        return self.backend.counts()
+    
+    def check_in(self, employee_id: int, record_id: int, work_date: date, is_late: bool):
+        """Record a committed check-in (ignored if it belongs to another work day)"""
+        if self.backend.work_day() == work_date:
+            self.backend.check_in(employee_id, record_id, is_late)
+    
+    def check_out(self, employee_id: int, record_id: int, work_date: date):
+        """Record a committed check-out (ignored if it belongs to another work day)"""
+        if self.backend.work_day() == work_date:
+            self.backend.check_out(employee_id, record_id)
+
+def default_backend():
+    """Backend selected by PRESENCE_BACKEND"""
+    if settings.PRESENCE_BACKEND == "redis":
+        return RedisPresenceBackend(settings.REDIS_URL)
+    return MemoryPresenceBackend()
+
+# Process-wide registry shared by the attendance and analytics endpoints
+presence = PresenceRegistry(default_backend())
@@ -0,0 +1,159 @@
+"""
+Daily attendance rollup
+
+attendance_daily holds one row per employee per work date: first check-in,
+last check-out, worked, late and early minutes, the first check-in's status
+and session counts. Check-in, check-out, overrides and device sync refresh
+the days they touch in the same transaction, so analytics and payroll read
+O(employees x days) compact rows instead of re-scanning raw punches.
+rebuild_range() recomputes any range from attendance_records and, for
+archived months, the cold archive. Rows are written with an upsert on
+(employee_id, work_date), so two writers that both found a day missing do
+not fail each other's transaction.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.database.models import AttendanceDaily, AttendanceRecord
+from app.core.attendance.archive import attendance_archive, hot_window_start
+from app.core.analytics.cube import mark_days_dirty
+
+IN_CHUNK = 500  # Bound parameters per IN (...) lookup
+
+DayKey = Tuple[int, date]  # (employee_id, work_date)
+
+RECORD_COLUMNS = (
+    AttendanceRecord.employee_id,
+    AttendanceRecord.check_in_date,
+    AttendanceRecord.check_in_time,
+    AttendanceRecord.check_out_time,
+    AttendanceRecord.work_duration_minutes,
+    AttendanceRecord.minutes_late,
+    AttendanceRecord.minutes_early,
+    AttendanceRecord.status
+)
+
+def _chunks(values: List, size: int = IN_CHUNK):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _upsert(db: Session, rows: List[Dict]):
+    """Insert rollup rows, replacing any a concurrent writer inserted for the same day"""
+    dialect = {"postgresql": postgresql, "sqlite": sqlite}.get(db.get_bind().dialect.name)
+    if dialect is None:
+        db.execute(insert(AttendanceDaily), rows)
+        return
+    statement = dialect.insert(AttendanceDaily)
+    statement = statement.on_conflict_do_update(
+        index_elements=["employee_id", "work_date"],
+        set_={name: statement.excluded[name] for name in rows[0] if name not in ("employee_id", "work_date")}
+    )
+    db.execute(statement, rows)
+
+def summarize(rows, now: datetime) -> Dict[DayKey, Dict]:
+    """Rollup rows keyed by (employee_id, work_date) from attendance record rows"""
+    days: Dict[DayKey, Dict] = {}
+    for row in sorted(rows, key=lambda row: (row.employee_id, row.check_in_date, row.check_in_time)):
+        key = (row.employee_id, row.check_in_date)
+        day = days.get(key)
+        if day is None:
+            day = days[key] = {
+                "employee_id": row.employee_id,
+                "work_date": row.check_in_date,
+                "first_in": row.check_in_time,
+                "last_out": None,
+                "worked_minutes": 0,
+                "late_minutes": row.minutes_late or 0,
+                "early_minutes": 0,
+                "status": row.status,
+                "sessions": 0,
+                "open_sessions": 0,
+                "updated_at": now
+            }
+        day["sessions"] += 1
+        if row.check_out_time is None:
+            day["open_sessions"] += 1
+            continue
+        day["worked_minutes"] += row.work_duration_minutes or 0
+        if day["last_out"] is None or row.check_out_time >= day["last_out"]:
+            day["last_out"] = row.check_out_time
+            day["early_minutes"] = row.minutes_early or 0
+    return days
+
+def refresh_days(db: Session, keys: Iterable[DayKey]) -> int:
+    """
+    Recompute the rollup rows for the given (employee, work date) pairs from
+    their attendance records, within the caller's transaction.
+    """
+    keys = {key for key in keys if key[1] is not None}
+    if not keys:
+        return 0
+    db.flush()  # Sessions use autoflush=False; pending record changes must be visible
+    
+    employees = sorted({employee_id for employee_id, _ in keys})
+    dates = sorted({work_date for _, work_date in keys})
+    
+    rows, existing = [], {}
+    for chunk in _chunks(employees):
+        rows.extend(
+            row for row in db.query(*RECORD_COLUMNS).filter(
+                AttendanceRecord.employee_id.in_(chunk),
+                AttendanceRecord.check_in_date.in_(dates)
+            ) if (row.employee_id, row.check_in_date) in keys
+        )
+        for row_id, employee_id, work_date in db.query(
+            AttendanceDaily.id, AttendanceDaily.employee_id, AttendanceDaily.work_date
+        ).filter(AttendanceDaily.employee_id.in_(chunk), AttendanceDaily.work_date.in_(dates)):
+            if (employee_id, work_date) in keys:
+                existing[(employee_id, work_date)] = row_id
+    
+    days = summarize(rows, datetime.utcnow())
+    updates = [{"id": existing[key], **day} for key, day in days.items() if key in existing]
+    inserts = [day for key, day in days.items() if key not in existing]
+    removed = [row_id for key, row_id in existing.items() if key not in days]
+    
+    mark_days_dirty(db, dates)  # Report cube cells of these dates are now stale
+    if updates:
+        db.execute(update(AttendanceDaily), updates)
+    if inserts:
+        _upsert(db, inserts)
+    for chunk in _chunks(removed):
+        db.execute(delete(AttendanceDaily).where(AttendanceDaily.id.in_(chunk)))
+    return len(keys)
+
+def rebuild_range(db: Session, start_date: date, end_date: date, days_per_batch: int = 7) -> Dict[str, int]:
+    """
+    Replace the rollup rows between start_date and end_date (inclusive) with
+    ones recomputed from attendance records (hot or archived), committing each window of days
+    so a long rebuild holds no long transaction and can be resumed.
+    """
+    stats = {"days": 0, "rows": 0}
+    window_start = start_date
+    while window_start <= end_date:
+        window_end = min(window_start + timedelta(days=days_per_batch - 1), end_date)
+        rows = db.query(*RECORD_COLUMNS).filter(
+            AttendanceRecord.check_in_date >= window_start,
+            AttendanceRecord.check_in_date <= window_end
+        ).all()
+        if window_start < hot_window_start():
+            for records in attendance_archive.rows(window_start, window_end):
+                rows.extend(records)
+        days = summarize(rows, datetime.utcnow())
+        
+        db.execute(delete(AttendanceDaily).where(
+            AttendanceDaily.work_date >= window_start,
+            AttendanceDaily.work_date <= window_end
+        ))
+        if days:
+            _upsert(db, list(days.values()))
+        mark_days_dirty(db, (window_start + timedelta(days=offset) for offset in range((window_end - window_start).days + 1)))
+        db.commit()
+        
+        stats["days"] += (window_end - window_start).days + 1
+        stats["rows"] += len(days)
+        window_start = window_end + timedelta(days=1)
+    return stats
@@ -0,0 +1,43 @@
+"""
+Attendance rules shared by live punches and device sync
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Tuple
+
+LATE_GRACE_MINUTES = 5
+STATUSES = ("on_time", "late", "early_departure")  # Values of attendance_records.status
+
+def scheduled_window(work_date: date, start_time: Optional[time], end_time: Optional[time]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Scheduled start/end as datetimes; an end at or before the start belongs to the next day (overnight shift)"""
+    start = datetime.combine(work_date, start_time) if start_time else None
+    end = datetime.combine(work_date, end_time) if end_time else None
+    if start and end and end <= start:
+        end += timedelta(days=1)
+    return start, end
+
+def _timed(schedule) -> bool:
+    """Whether a schedule has working hours to be late or early against"""
+    return schedule is not None and not schedule.is_rest_day and not schedule.is_holiday
+
+def is_overnight(schedule) -> bool:
+    """Whether the schedule's shift ends on the day after it starts"""
+    return _timed(schedule) and bool(schedule.start_time and schedule.end_time) and schedule.end_time <= schedule.start_time
+
+def check_in_status(check_in_time: datetime, work_date: date, schedule) -> Tuple[str, int]:
+    """(status, minutes_late) of a check-in against the day's schedule (None if unscheduled)"""
+    if not _timed(schedule) or not schedule.start_time:
+        return "on_time", 0
+    scheduled_start, _ = scheduled_window(work_date, schedule.start_time, schedule.end_time)
+    if check_in_time <= scheduled_start:
+        return "on_time", 0
+    minutes_late = int((check_in_time - scheduled_start).total_seconds() / 60)
+    return ("late" if minutes_late > LATE_GRACE_MINUTES else "on_time"), minutes_late
+
+def departure_minutes_early(check_out_time: datetime, work_date: date, schedule) -> int:
+    """Minutes a check-out falls before the scheduled end (0 if unscheduled or not early)"""
+    if not _timed(schedule) or not schedule.end_time:
+        return 0
+    _, scheduled_end = scheduled_window(work_date, schedule.start_time, schedule.end_time)
+    if check_out_time >= scheduled_end:
+        return 0
+    return int((scheduled_end - check_out_time).total_seconds() / 60)
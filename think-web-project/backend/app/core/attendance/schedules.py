@@ -0,0 +1,128 @@
+"""
+Per-day schedule snapshot for the punch path
+
+Maps employee_id -> DaySchedule (start, end, break, rest day, holiday) for a
+work date, built with one query the first time the date is needed. An
+employee without a schedule row that day falls back to their department's
+shift template, and a schedule row without times takes them from its shift.
+Lateness, early departure and overnight resolution then read the snapshot
+instead of querying Schedule per punch.
+
+Schedule and Shift changes committed through the ORM invalidate the affected
+dates in this process; SCHEDULE_SNAPSHOT_TTL_SECONDS bounds how long another
+worker (or a bulk Core update) can serve a stale day.
+"""
+from datetime import date, time
+from typing import Dict, Iterable, NamedTuple, Optional, Set
+
+from sqlalchemy import and_, event, inspect
+from sqlalchemy.orm import Session, aliased
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.database.models import Employee, Schedule, Shift
+
+class DaySchedule(NamedTuple):
+    start_time: Optional[time]
+    end_time: Optional[time]
+    break_duration_minutes: int
+    is_rest_day: bool
+    is_holiday: bool
+
+def _from_shift(start_time, end_time, break_minutes, is_flexible) -> DaySchedule:
+    # Flexible shifts have no fixed start, so nobody is late against them
+    if is_flexible:
+        start_time = end_time = None
+    return DaySchedule(start_time, end_time, break_minutes if break_minutes is not None else 60, False, False)
+
+def build_day(db: Session, day: date) -> Dict[int, DaySchedule]:
+    """Schedule of every employee for one work date, in one query"""
+    row_shift = aliased(Shift)
+    department_shift = aliased(Shift)
+    rows = db.query(
+        Employee.id,
+        Schedule.id,
+        Schedule.start_time,
+        Schedule.end_time,
+        Schedule.break_duration_minutes,
+        Schedule.is_rest_day,
+        Schedule.is_holiday,
+        row_shift.start_time,
+        row_shift.end_time,
+        row_shift.is_flexible,
+        department_shift.id,
+        department_shift.start_time,
+        department_shift.end_time,
+        department_shift.break_duration_minutes,
+        department_shift.is_flexible
+    ).outerjoin(
+        Schedule, and_(Schedule.employee_id == Employee.id, Schedule.date == day)
+    ).outerjoin(
+        row_shift, row_shift.id == Schedule.shift_id
+    ).outerjoin(
+        department_shift, and_(department_shift.department_id == Employee.department_id, Schedule.id.is_(None))
+    ).order_by(Employee.id, department_shift.id).all()
+    
+    snapshot: Dict[int, DaySchedule] = {}
+    for (employee_id, schedule_id, start_time, end_time, break_minutes, is_rest_day, is_holiday,
+         shift_start, shift_end, shift_flexible,
+         department_shift_id, department_start, department_end, department_break, department_flexible) in rows:
+        if employee_id in snapshot:
+            continue  # Department with several shifts: the first one is its default
+        if schedule_id is not None:
+            if start_time is None and shift_start is not None and not shift_flexible:
+                start_time, end_time = shift_start, shift_end
+            snapshot[employee_id] = DaySchedule(
+                start_time, end_time,
+                break_minutes if break_minutes is not None else 60,
+                bool(is_rest_day), bool(is_holiday)
+            )
+        elif department_shift_id is not None:
+            snapshot[employee_id] = _from_shift(department_start, department_end, department_break, department_flexible)
+    return snapshot
+
+class ScheduleSnapshot:
+    """Recently used work dates' schedules, loaded on demand and invalidated on change"""
+    
+    def __init__(self, ttl_seconds: float, max_days: int = 7):
+        self._days = TTLCache(ttl_seconds, max_entries=max_days)
+    
+    def for_day(self, db: Session, day: date) -> Dict[int, DaySchedule]:
+        """All employees' schedules for a work date"""
+        return self._days.get_or_load(day, lambda: build_day(db, day))
+    
+    def get(self, db: Session, employee_id: int, day: date) -> Optional[DaySchedule]:
+        """One employee's schedule for a work date (None if unscheduled)"""
+        return self.for_day(db, day).get(employee_id)
+    
+    def invalidate(self, days: Optional[Iterable[date]] = None):
+        """Drop the given dates, or every date when None"""
+        if days is None:
+            self._days.invalidate()
+            return
+        for day in days:
+            self._days.invalidate(day)
+
+# Process-wide snapshot shared by check-in/out and device sync
+schedule_snapshot = ScheduleSnapshot(settings.SCHEDULE_SNAPSHOT_TTL_SECONDS)
+
+@event.listens_for(Session, "after_flush")
+def _collect_schedule_changes(session, flush_context):
+    dates: Set = session.info.setdefault("schedule_dates", set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, Schedule):
+            dates.add(instance.date)
+            # A moved schedule also changes the date it was moved from
+            dates.update(inspect(instance).attrs.date.history.deleted or ())
+        elif isinstance(instance, Shift):
+            dates.add(None)  # Shift templates can apply to any date
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_schedule_changes(session):
+    dates = session.info.pop("schedule_dates", None)
+    if dates:
+        schedule_snapshot.invalidate(None if None in dates else dates)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_schedule_changes(session):
+    session.info.pop("schedule_dates", None)
@@ -0,0 +1,283 @@
+"""
+Bulk ingestion of buffered device punches
+
+Kiosks that lost connectivity upload their whole punch buffer at once. Each
+punch carries a client-generated idempotency key; keys already recorded in
+device_punches are reported back as replayed and never applied twice, so a
+device can simply resend a batch after a timeout.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database.models import AttendanceRecord, Device, DevicePunch, Employee
+from app.core.attendance.archive import hot_window_start
+from app.core.attendance.geofence import geofence_index
+from app.core.attendance.presence import presence
+from app.core.attendance.rollup import refresh_days
+from app.core.attendance.rules import check_in_status, departure_minutes_early
+from app.core.attendance.schedules import schedule_snapshot
+from app.core.events import broadcaster, punch_event
+from app.core.analytics.anomaly_detection import PunchObservation, anomaly_engine
+
+EVENT_TYPES = ("check_in", "check_out")
+IN_CHUNK = 500  # Bound parameters per IN (...) lookup
+
+class Punch(NamedTuple):
+    idempotency_key: str
+    employee_id: int
+    event_type: str  # check_in, check_out
+    punched_at: datetime  # UTC, naive
+    method: str = "face"
+    confidence_score: Optional[float] = None
+    location_lat: Optional[float] = None
+    location_lng: Optional[float] = None
+    liveness_score: Optional[float] = None
+
+def _chunks(values: List, size: int = IN_CHUNK):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _recorded_punches(db: Session, keys: List[str]) -> Dict[str, DevicePunch]:
+    recorded = {}
+    for chunk in _chunks(keys):
+        for punch in db.query(
+            DevicePunch.idempotency_key, DevicePunch.status, DevicePunch.detail, DevicePunch.attendance_record_id
+        ).filter(DevicePunch.idempotency_key.in_(chunk)):
+            recorded[punch.idempotency_key] = punch
+    return recorded
+
+def _apply(db: Session, punches: List[Punch], device_id: Optional[int], now: datetime) -> Tuple[List[Dict], List[Tuple]]:
+    results: List[Optional[Dict]] = [None] * len(punches)
+    presence_events: List[Tuple] = []
+    
+    # Replays: keys seen in an earlier request, or earlier in this batch
+    recorded = _recorded_punches(db, list({punch.idempotency_key for punch in punches}))
+    first_index: Dict[str, int] = {}
+    fresh = []
+    for i, punch in enumerate(punches):
+        if punch.idempotency_key in recorded:
+            previous = recorded[punch.idempotency_key]
+            results[i] = {
+                "idempotency_key": punch.idempotency_key,
+                "status": previous.status,
+                "replayed": True,
+                "attendance_id": previous.attendance_record_id,
+                "detail": previous.detail
+            }
+        elif punch.idempotency_key in first_index:
+            results[i] = first_index[punch.idempotency_key]  # Resolved with the first occurrence below
+        else:
+            first_index[punch.idempotency_key] = i
+            fresh.append(i)
+    
+    def reject(i: int, detail: str):
+        results[i] = {"idempotency_key": punches[i].idempotency_key, "status": "rejected", "replayed": False, "attendance_id": None, "detail": detail}
+    
+    # Validate employees (and get their departments for geofencing) in one query
+    employee_ids = list({punches[i].employee_id for i in fresh})
+    known: Dict[int, Optional[int]] = {}
+    for chunk in _chunks(employee_ids):
+        known.update(db.query(Employee.id, Employee.department_id).filter(Employee.id.in_(chunk)))
+    
+    latest_allowed = now + timedelta(seconds=settings.ATTENDANCE_MAX_CLOCK_SKEW_SECONDS)
+    earliest_allowed = hot_window_start(now.date())  # Archived months are immutable
+    valid = []
+    for i in fresh:
+        punch = punches[i]
+        if punch.event_type not in EVENT_TYPES:
+            reject(i, "Unknown event type")
+        elif punch.employee_id not in known:
+            reject(i, "Employee not found")
+        elif punch.punched_at > latest_allowed:
+            reject(i, "Punch timestamp is in the future")
+        elif punch.punched_at.date() < earliest_allowed:
+            reject(i, "Punch falls in an archived month")
+        else:
+            valid.append(i)
+    
+    # Open check-ins these punches may close (or collide with), in one query;
+    # the day before the earliest punch covers overnight shifts
+    employees = list({punches[i].employee_id for i in valid})
+    open_sessions: Dict[int, List[Dict]] = defaultdict(list)
+    if valid:
+        first_day = min(punches[i].punched_at for i in valid).date() - timedelta(days=1)
+        last_day = max(punches[i].punched_at for i in valid).date()
+        for chunk in _chunks(employees):
+            for record in db.query(
+                AttendanceRecord.id, AttendanceRecord.employee_id, AttendanceRecord.check_in_time, AttendanceRecord.check_in_date
+            ).filter(
+                AttendanceRecord.employee_id.in_(chunk),
+                AttendanceRecord.check_in_date >= first_day,
+                AttendanceRecord.check_in_date <= last_day,
+                AttendanceRecord.check_out_time.is_(None)
+            ):
+                open_sessions[record.employee_id].append({
+                    "id": record.id, "check_in_time": record.check_in_time, "work_date": record.check_in_date, "row": None
+                })
+    
+    # Schedules for every work date involved, from the per-day snapshot; fences from the geofence index
+    work_dates = {punches[i].punched_at.date() for i in valid}
+    work_dates.update(session["work_date"] for sessions in open_sessions.values() for session in sessions)
+    schedules = {day: schedule_snapshot.for_day(db, day) for day in work_dates}
+    geofence_index.ensure_loaded(db)
+    
+    # Pair check-ins and check-outs per employee in device-time order
+    by_employee: Dict[int, List[int]] = defaultdict(list)
+    for i in sorted(valid, key=lambda i: punches[i].punched_at):
+        by_employee[punches[i].employee_id].append(i)
+    
+    new_records: List[Dict] = []
+    closed_records: List[Dict] = []
+    touched_days: List[Tuple[int, date]] = []
+    attendance_of: Dict[int, object] = {}  # punch index -> record id, or ("new", row) until inserted
+    
+    for employee_id, indices in by_employee.items():
+        sessions = open_sessions[employee_id]
+        sessions.sort(key=lambda session: session["check_in_time"])
+        for i in indices:
+            punch = punches[i]
+            work_date = punch.punched_at.date()
+            if punch.event_type == "check_in":
+                if any(session["work_date"] == work_date for session in sessions):
+                    reject(i, "Already checked in today")
+                    continue
+                status, minutes_late = check_in_status(punch.punched_at, work_date, schedules[work_date].get(employee_id))
+                geofence = geofence_index.check(employee_id, known[employee_id], punch.location_lat, punch.location_lng)
+                row = len(new_records)
+                new_records.append({
+                    "employee_id": employee_id,
+                    "check_in_time": punch.punched_at,
+                    "check_in_date": work_date,
+                    "check_out_time": None,
+                    "method": punch.method,
+                    "device_id": device_id,
+                    "location_lat": punch.location_lat,
+                    "location_lng": punch.location_lng,
+                    "confidence_score": punch.confidence_score,
+                    "liveness_score": punch.liveness_score,
+                    "status": status,
+                    "minutes_late": minutes_late,
+                    "minutes_early": 0,
+                    "work_duration_minutes": None,
+                    "geofence_id": geofence.geofence_id,
+                    "geofence_status": geofence.status
+                })
+                sessions.append({"id": None, "check_in_time": punch.punched_at, "work_date": work_date, "row": row})
+                attendance_of[i] = ("new", row)
+                continue
+            
+            # Check-out closes the latest session that started before it
+            candidates = [session for session in sessions if session["check_in_time"] <= punch.punched_at]
+            if not candidates:
+                reject(i, "No active check-in found")
+                continue
+            session = candidates[-1]
+            sessions.remove(session)
+            
+            closing = {
+                "check_out_time": punch.punched_at,
+                "work_duration_minutes": int((punch.punched_at - session["check_in_time"]).total_seconds() / 60),
+                "minutes_early": departure_minutes_early(
+                    punch.punched_at, session["work_date"], schedules[session["work_date"]].get(employee_id)
+                )
+            }
+            if session["row"] is not None:
+                new_records[session["row"]].update(closing)
+                attendance_of[i] = ("new", session["row"])
+            else:
+                closed_records.append({"id": session["id"], **closing})
+                touched_days.append((employee_id, session["work_date"]))
+                attendance_of[i] = session["id"]
+                presence_events.append(("check_out", employee_id, session["id"], session["work_date"]))
+    
+    # One set-based statement per table
+    new_ids = []
+    if new_records:
+        new_ids = db.execute(
+            insert(AttendanceRecord).returning(AttendanceRecord.id, sort_by_parameter_order=True),
+            new_records
+        ).scalars().all()
+    if closed_records:
+        db.execute(update(AttendanceRecord), closed_records)
+    
+    for record, record_id in zip(new_records, new_ids):
+        presence_events.append(("check_in", record["employee_id"], record_id, record["check_in_date"], record["status"] == "late"))
+        if record["check_out_time"] is not None:
+            presence_events.append(("check_out", record["employee_id"], record_id, record["check_in_date"]))
+    
+    # Daily rollup rows of every day these punches touched
+    refresh_days(db, [(record["employee_id"], record["check_in_date"]) for record in new_records] + touched_days)
+    
+    for i, reference in attendance_of.items():
+        attendance_id = new_ids[reference[1]] if isinstance(reference, tuple) else reference
+        results[i] = {"idempotency_key": punches[i].idempotency_key, "status": "accepted", "replayed": False, "attendance_id": attendance_id, "detail": None}
+    
+    punch_rows = []
+    for i in fresh:
+        punch, result = punches[i], results[i]
+        punch_rows.append({
+            "idempotency_key": punch.idempotency_key,
+            "device_id": device_id,
+            "employee_id": punch.employee_id if punch.employee_id in known else None,
+            "event_type": punch.event_type,
+            "punched_at": punch.punched_at,
+            "method": punch.method,
+            "status": result["status"],
+            "detail": result["detail"],
+            "attendance_record_id": result["attendance_id"],
+            "received_at": now
+        })
+    if punch_rows:
+        db.execute(insert(DevicePunch), punch_rows)
+    
+    if device_id is not None:
+        db.execute(update(Device).where(Device.id == device_id).values(last_seen=now, status="online"))
+    
+    # Later duplicates of a key in this batch report the first occurrence as a replay
+    for i, result in enumerate(results):
+        if isinstance(result, int):
+            results[i] = {**results[result], "replayed": True}
+    return results, presence_events
+
+def ingest_punches(db: Session, punches: List[Punch], device_id: Optional[int] = None) -> List[Dict]:
+    """
+    Apply a batch of device punches in one transaction and return one result
+    per punch, in input order. A concurrent upload of the same keys loses the
+    unique-key race, rolls back and is re-applied as a replay.
+    """
+    for attempt in range(2):
+        try:
+            results, presence_events = _apply(db, punches, device_id, datetime.utcnow())
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            if attempt:
+                raise
+            continue
+        
+        # Committed punches that fall on the current work day update live presence
+        for event, *args in presence_events:
+            if event == "check_in":
+                presence.check_in(*args)
+            else:
+                presence.check_out(*args)
+        
+        # ... and go out to live dashboards and the anomaly checks
+        for punch, result in zip(punches, results):
+            if result["status"] == "accepted" and not result["replayed"]:
+                broadcaster.publish("punch", punch_event(
+                    punch.event_type, punch.employee_id, result["attendance_id"], punch.punched_at,
+                    method=punch.method, device_id=device_id
+                ))
+                anomaly_engine.observe(PunchObservation(
+                    result["attendance_id"], punch.employee_id, punch.event_type, punch.punched_at,
+                    method=punch.method, device_id=device_id, location_lat=punch.location_lat, location_lng=punch.location_lng,
+                    confidence_score=punch.confidence_score, liveness_score=punch.liveness_score
+                ))
+        return results
@@ -0,0 +1,335 @@
+"""
+Write-behind queue for check-in bursts
+
+With ATTENDANCE_WRITE_BEHIND enabled, check-in and check-out punches that
+pass validation are acknowledged against the live presence state, appended to
+a local journal and queued; a background task commits them in groups of up to
+ATTENDANCE_WRITE_BEHIND_BATCH punches (or every
+ATTENDANCE_WRITE_BEHIND_MAX_WAIT_MS) through the idempotent device-sync
+ingestion. Instead of one transaction per punch at shift boundaries, the
+database sees a few grouped ones.
+
+The journal makes acknowledged punches crash-safe. Each worker process
+writes its own file, ATTENDANCE_JOURNAL_DIR/journal-<pid>.jsonl, and holds an
+exclusive lock on it while running; it only ever truncates its own file
+(whenever its queue has fully drained). At startup a worker replays the
+journals whose lock it can take, i.e. those left by workers that are gone
+(already committed punches come back as replays), and removes them. The
+locks are fcntl ones, so write-behind cannot be enabled on Windows.
+ATTENDANCE_JOURNAL_FSYNC is the durability knob: when on, a punch is only
+acknowledged once its journal line is fsynced (survives power loss;
+concurrent punches share one fsync); when off, the line is in the OS page
+cache (survives a process crash only).
+
+A group the database keeps refusing while it is reachable is split in halves
+until the punch at fault is isolated; that punch is appended to
+ATTENDANCE_JOURNAL_DIR/dead-letter.jsonl (journal format plus the error) and
+the rest are committed, so one bad punch cannot stall the queue.
+
+A queued punch is answered 202 before ingestion has validated it against the
+database (duplicates, archived months, clock skew, check-out without check-in).
+Its outcome is recorded in device_punches under its idempotency key, and
+GET /attendance/punches/{idempotency_key} reports it: "queued" until its group
+commits (404 from other workers meanwhile), then "accepted" or "rejected" with
+the reason, or "failed" once it has been dead-lettered.
+"""
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.database.connection import SessionLocal, engine, run_db
+from app.core.attendance.sync import Punch, ingest_punches
+
+try:
+    import fcntl
+except ImportError:  # Windows: write-behind stays unavailable
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+RETRY_SECONDS = 1.0  # Pause before retrying a group the database refused
+MAX_ATTEMPTS = 3  # Tries of a whole group before it is split to isolate a bad punch
+DEAD_LETTER_NAME = "dead-letter.jsonl"
+DEAD_LETTERS_KEPT = 10000  # Dead-lettered keys remembered for status lookups (the file keeps them all)
+
+def _encode(punch: Punch, device_id: Optional[int], **extra) -> str:
+    entry = {**punch._asdict(), "punched_at": punch.punched_at.isoformat(), "device_id": device_id, **extra}
+    return json.dumps(entry, separators=(",", ":")) + "\n"
+
+def _decode(line: str) -> Tuple[Punch, Optional[int]]:
+    entry = json.loads(line)
+    device_id = entry.pop("device_id")
+    entry["punched_at"] = datetime.fromisoformat(entry["punched_at"])
+    return Punch(**entry), device_id
+
+class PunchJournal:
+    """Append-only JSONL journal of this worker's punches not yet committed to the database"""
+    
+    def __init__(self, directory: Path, fsync: bool):
+        self.directory = Path(directory)
+        self.fsync = fsync
+        self.path: Optional[Path] = None
+        self._file = None
+        self._written = 0
+        self._synced = 0
+        self._sync_task: Optional[asyncio.Future] = None
+    
+    def open(self):
+        """Create and lock this worker's journal file"""
+        if fcntl is None:
+            raise RuntimeError("ATTENDANCE_WRITE_BEHIND needs fcntl file locks, which this platform lacks")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / f"journal-{os.getpid()}.jsonl"
+        self._file = open(self.path, "a", encoding="utf-8")
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    
+    def close(self, remove: bool = False):
+        """Release this worker's journal; remove it when nothing in it is left to replay"""
+        if self._file is not None:
+            if remove:
+                self.path.unlink()
+            self._file.close()
+            self._file = None
+    
+    def orphans(self) -> List[Path]:
+        """Journal files of other workers that are no longer running"""
+        if not self.directory.is_dir():
+            return []
+        return [path for path in sorted(self.directory.glob("journal-*.jsonl")) if path != self.path]
+    
+    @staticmethod
+    def read(path: Path) -> List[Tuple[Punch, Optional[int]]]:
+        """Journaled punches with their device id, skipping a torn last line"""
+        entries = []
+        with open(path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entries.append(_decode(line))
+                except (ValueError, KeyError, TypeError):
+                    continue
+        return entries
+    
+    def write(self, punch: Punch, device_id: Optional[int]):
+        """Append one punch; it reaches the OS before this returns"""
+        self._file.write(_encode(punch, device_id))
+        self._file.flush()
+        self._written += 1
+    
+    async def sync(self):
+        """Wait until everything written so far is fsynced (no-op when fsync is off)"""
+        if not self.fsync:
+            return
+        target = self._written
+        while self._synced < target:
+            if self._sync_task is None:
+                self._sync_task = asyncio.ensure_future(self._fsync())
+            await asyncio.shield(self._sync_task)
+    
+    async def _fsync(self):
+        # Lines written while this fsync runs wait for the next one
+        upto = self._written
+        try:
+            await run_in_threadpool(os.fsync, self._file.fileno())
+            self._synced = max(self._synced, upto)
+        finally:
+            self._sync_task = None
+    
+    def truncate(self):
+        """Drop all of this worker's entries once every one of them is committed"""
+        self._file.truncate(0)
+        self._file.flush()
+    
+    def dead_letter(self, punch: Punch, device_id: Optional[int], error: str):
+        """Set aside a punch the database refuses, for manual review"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / DEAD_LETTER_NAME, "a", encoding="utf-8") as dead_letters:
+            dead_letters.write(_encode(punch, device_id, error=error))
+            dead_letters.flush()
+            os.fsync(dead_letters.fileno())
+
+def _commit(entries: List[Tuple[Punch, Optional[int]]]):
+    """Ingest a group of punches, one transaction per device"""
+    by_device: Dict[Optional[int], List[Punch]] = {}
+    for punch, device_id in entries:
+        by_device.setdefault(device_id, []).append(punch)
+    
+    db = SessionLocal()
+    try:
+        for device_id, punches in by_device.items():
+            ingest_punches(db, punches, device_id)
+    finally:
+        db.close()
+
+def _database_available() -> bool:
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return True
+    except Exception:
+        return False
+
+class WriteBehindQueue:
+    """Bounded queue of acknowledged punches, flushed in grouped transactions"""
+    
+    def __init__(self, journal: PunchJournal, max_queue: int, batch_size: int, max_wait_ms: float):
+        self.journal = journal
+        self.max_queue = max_queue
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, Tuple[str, str]] = {}  # employee_id -> (event_type, idempotency_key)
+        self._queued_keys: Set[str] = set()
+        self._dead_lettered: "OrderedDict[str, str]" = OrderedDict()  # idempotency_key -> error
+        self.flushed_groups = 0
+        self.flushed_punches = 0
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+    
+    def replay(self) -> int:
+        """Commit punches left by workers that are gone, then remove their journals"""
+        # A previous process with this pid left its lines in the file now opened
+        replayed = self._replay_entries(self.journal.read(self.journal.path))
+        self.journal.truncate()
+        for path in self.journal.orphans():
+            with open(path, "a", encoding="utf-8") as orphan:
+                try:
+                    fcntl.flock(orphan.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # Its worker is still running
+                replayed += self._replay_entries(self.journal.read(path))
+                path.unlink()
+        return replayed
+    
+    def _replay_entries(self, entries: List[Tuple[Punch, Optional[int]]]) -> int:
+        for start in range(0, len(entries), settings.ATTENDANCE_SYNC_MAX_BATCH):
+            self._commit_isolating(entries[start:start + settings.ATTENDANCE_SYNC_MAX_BATCH])
+        return len(entries)
+    
+    def _commit_isolating(self, group: List[Tuple[Punch, Optional[int]]]):
+        """Commit a group, splitting it to dead-letter the punches the database refuses"""
+        try:
+            _commit(group)
+            return
+        except Exception as error:
+            if len(group) == 1:
+                punch, device_id = group[0]
+                logger.exception("Punch %s refused by the database; moved to the dead-letter file", punch.idempotency_key)
+                self.journal.dead_letter(punch, device_id, repr(error))
+                self._dead_lettered[punch.idempotency_key] = repr(error)
+                while len(self._dead_lettered) > DEAD_LETTERS_KEPT:
+                    self._dead_lettered.popitem(last=False)
+                return
+        middle = len(group) // 2
+        self._commit_isolating(group[:middle])
+        self._commit_isolating(group[middle:])
+    
+    def start(self) -> int:
+        """Replay the journal and start the flusher; returns the punches replayed"""
+        self.journal.open()
+        replayed = self.replay()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return replayed
+    
+    async def stop(self, timeout: float = 10.0):
+        """Flush what is queued, then stop (anything left is replayed at next start)"""
+        if self._task is None:
+            return
+        drained = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            drained = False
+        self._task.cancel()
+        self._task = None
+        self.journal.close(remove=drained)
+    
+    def pending_event(self, employee_id: int) -> Optional[str]:
+        """Event type of the employee's last queued, not yet committed punch"""
+        pending = self._pending.get(employee_id)
+        return pending[0] if pending else None
+    
+    def punch_status(self, idempotency_key: str) -> Optional[Dict[str, Optional[str]]]:
+        """Outcome of a punch this worker has not handed to device_punches: queued or dead-lettered"""
+        if idempotency_key in self._queued_keys:
+            return {"status": "queued", "detail": None}
+        if idempotency_key in self._dead_lettered:
+            return {"status": "failed", "detail": "Refused by the database; set aside for review"}
+        return None
+    
+    async def submit(self, punch: Punch, device_id: Optional[int] = None):
+        """Journal and queue one punch; returns once it is as durable as configured"""
+        if self._queue.full():
+            raise HTTPException(status_code=503, detail="Attendance queue is full, please retry")
+        self.journal.write(punch, device_id)
+        self._queue.put_nowait((punch, device_id))
+        self._pending[punch.employee_id] = (punch.event_type, punch.idempotency_key)
+        self._queued_keys.add(punch.idempotency_key)
+        await self.journal.sync()
+    
+    async def _next_group(self) -> List[Tuple[Punch, Optional[int]]]:
+        group = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(group) < self.batch_size:
+            if not self._queue.empty():
+                group.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                group.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return group
+    
+    async def _run(self):
+        while True:
+            group = await self._next_group()
+            attempts = 0
+            while True:
+                try:
+                    await run_db(_commit, group)
+                    break
+                except Exception:
+                    attempts += 1
+                    logger.exception("Write-behind flush of %d punches failed (attempt %d)", len(group), attempts)
+                # An unreachable database is waited out; a refused group is split instead
+                if attempts >= MAX_ATTEMPTS and await run_db(_database_available):
+                    await run_db(self._commit_isolating, group)
+                    break
+                await asyncio.sleep(RETRY_SECONDS)
+            
+            # Committed punches are now visible through presence and the database
+            for punch, _ in group:
+                if self._pending.get(punch.employee_id, (None, None))[1] == punch.idempotency_key:
+                    del self._pending[punch.employee_id]
+                self._queued_keys.discard(punch.idempotency_key)
+                self._queue.task_done()
+            self.flushed_groups += 1
+            self.flushed_punches += len(group)
+            
+            if self._queue.empty():
+                self.journal.truncate()
+
+# Process-wide queue shared by the attendance endpoints and app startup/shutdown
+write_behind = WriteBehindQueue(
+    PunchJournal(settings.ATTENDANCE_JOURNAL_DIR, fsync=settings.ATTENDANCE_JOURNAL_FSYNC),
+    max_queue=settings.ATTENDANCE_WRITE_BEHIND_MAX_QUEUE,
+    batch_size=settings.ATTENDANCE_WRITE_BEHIND_BATCH,
+    max_wait_ms=settings.ATTENDANCE_WRITE_BEHIND_MAX_WAIT_MS
+)
@@ -0,0 +1 @@
+# Biometric modules
@@ -0,0 +1,146 @@
+"""
+Micro-batching of concurrent face requests
+
+Probes arriving within a few milliseconds of each other (shift start at the
+kiosks) are coalesced into one worker-pool job for extraction and one
+vectorized NumPy call for similarity scoring. Each caller gets back its own
+result.
+"""
+import asyncio
+from collections import defaultdict, deque
+import time
+from typing import Deque, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.biometrics.face_recognition import analyze_faces, normalize
+from app.core.biometrics.workers import BiometricWorkerPool, biometric_pool
+
+class FaceMatchResult(NamedTuple):
+    embedding: Optional[np.ndarray]
+    is_live: bool
+    liveness_score: float
+    similarity: Optional[float]  # Best score against the candidates, None if none given
+
+class _PendingProbe(NamedTuple):
+    image_bytes: bytes
+    candidates: Optional[np.ndarray]
+    future: asyncio.Future
+    enqueued_at: float
+
+def score_batch(probes: List[Optional[np.ndarray]], candidates: List[Optional[np.ndarray]]) -> List[Optional[float]]:
+    """
+    Best cosine similarity of each probe against its own candidate rows,
+    computed for the whole batch with a single row-wise dot product.
+    """
+    owners, rows = [], []
+    for i, (probe, stored) in enumerate(zip(probes, candidates)):
+        if probe is None or stored is None or len(stored) == 0:
+            continue
+        owners.append(np.full(len(stored), i, dtype=np.int64))
+        rows.append(stored)
+    
+    scores: List[Optional[float]] = [None] * len(probes)
+    if not rows:
+        return scores
+    
+    owner = np.concatenate(owners)
+    stacked = normalize(np.concatenate(rows))
+    probe_matrix = normalize(np.stack([
+        probe if probe is not None else np.zeros(stacked.shape[1], dtype=np.float32)
+        for probe in probes
+    ]))
+    
+    similarities = np.einsum("ij,ij->i", stacked, probe_matrix[owner])
+    
+    # Rows are grouped by owner, so a segmented max gives each probe's best score
+    starts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+    best = np.maximum.reduceat(similarities, starts)
+    for i, score in zip(owner[starts].tolist(), best.tolist()):
+        scores[i] = float(score)
+    return scores
+
+class FaceBatcher:
+    """
+    Collects probes for up to max_batch_size items or max_wait_ms, whichever
+    comes first, and records per-request latency by batch size.
+    """
+    
+    def __init__(self, pool: BiometricWorkerPool, max_batch_size: int, max_wait_ms: float, history: int = 1000):
+        self.pool = pool
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending: List[_PendingProbe] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._latencies: Dict[int, Deque[float]] = defaultdict(lambda: deque(maxlen=history))
+        self._batches: Dict[int, int] = defaultdict(int)
+    
+    async def submit(self, image_bytes: bytes, candidates: Optional[np.ndarray] = None) -> FaceMatchResult:
+        """Queue one probe and wait for its share of the batched result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_PendingProbe(image_bytes, candidates, future, time.perf_counter()))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush_now)
+        
+        return await future
+    
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._run_batch(batch))
+    
+    async def _run_batch(self, batch: List[_PendingProbe]):
+        try:
+            analyses = await self.pool.run(analyze_faces, [probe.image_bytes for probe in batch])
+            scores = score_batch(
+                [analysis.embedding for analysis in analyses],
+                [probe.candidates for probe in batch]
+            )
+        except asyncio.CancelledError:
+            # Shutting down: callers still waiting are cancelled too
+            for probe in batch:
+                probe.future.cancel()
+            raise
+        except Exception as exc:
+            for probe in batch:
+                if not probe.future.done():
+                    probe.future.set_exception(exc)
+            return
+        
+        finished = time.perf_counter()
+        size = len(batch)
+        self._batches[size] += 1
+        for probe, analysis, score in zip(batch, analyses, scores):
+            self._latencies[size].append((finished - probe.enqueued_at) * 1000.0)
+            if not probe.future.done():
+                probe.future.set_result(FaceMatchResult(
+                    analysis.embedding, analysis.is_live, analysis.liveness_score, score
+                ))
+    
+    def stats(self) -> Dict:
+        """p50/p99 request latency (ms) per observed batch size"""
+        by_size = {}
+        for size in sorted(self._latencies):
+            samples = np.fromiter(self._latencies[size], dtype=np.float64)
+            by_size[size] = {
+                "batches": self._batches[size],
+                "p50_ms": round(float(np.percentile(samples, 50)), 3),
+                "p99_ms": round(float(np.percentile(samples, 99)), 3)
+            }
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "waiting": len(self._pending),
+            "by_batch_size": by_size
+        }
+
+# Process-wide batcher shared by the biometric and attendance endpoints
+face_batcher = FaceBatcher(biometric_pool, settings.FACE_BATCH_MAX_SIZE, settings.FACE_BATCH_MAX_WAIT_MS)
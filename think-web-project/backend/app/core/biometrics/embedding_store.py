@@ -0,0 +1,209 @@
+"""
+Memory-mapped on-disk store of face embeddings
+
+Every API worker maps the same files read-only, so the embedding matrix lives
+once in the OS page cache instead of once per worker, and a worker can start
+matching without decrypting every BiometricTemplate row at boot.
+
+Layout of the store directory:
+    
+    meta.json       {"format": 1, "dim": 512}
+    embeddings.f32  fixed-width rows of dim little-endian float32 (L2-normalized)
+    ids.i64         one (template_id, employee_id) int64 pair per row;
+                    employee_id = -1 marks a removed (tombstoned) row
+
+Rows are only ever appended or tombstoned in place; compaction rewrites both
+files and swaps them in atomically. The files hold plaintext embeddings, so
+the directory must sit on an encrypted volume (file-level encryption at rest).
+"""
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database.models import BiometricTemplate
+from app.core.biometrics.face_recognition import EMBEDDING_DIM, normalize
+from app.core.biometrics.templates import decrypt_embedding
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-worker development only
+    fcntl = None
+
+STORE_FORMAT = 1
+TOMBSTONE = -1
+
+class EmbeddingStore:
+    """Fixed-width embedding rows plus an id/employee map, shared via mmap"""
+    
+    def __init__(self, directory, dim: int = EMBEDDING_DIM, compact_ratio: float = 0.25):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.compact_ratio = compact_ratio
+        self.meta_path = self.directory / "meta.json"
+        self.embeddings_path = self.directory / "embeddings.f32"
+        self.ids_path = self.directory / "ids.i64"
+        self.lock_path = self.directory / ".lock"
+    
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        """Serialize writers (and compaction vs. readers) across worker processes"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a+") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _row_count(self) -> int:
+        try:
+            embeddings_size = self.embeddings_path.stat().st_size
+            ids_size = self.ids_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+        return min(embeddings_size // (self.dim * 4), ids_size // 16)
+    
+    def signature(self) -> Tuple[int, int]:
+        """(inode, row count) - changes whenever rows are appended or the files are compacted"""
+        try:
+            return self.ids_path.stat().st_ino, self._row_count()
+        except FileNotFoundError:
+            return 0, 0
+    
+    def _valid(self) -> bool:
+        try:
+            meta = json.loads(self.meta_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return False
+        return meta.get("format") == STORE_FORMAT and meta.get("dim") == self.dim
+    
+    def open(self) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
+        """Map the store read-only, returning (embeddings, ids, signature)"""
+        with self._locked(exclusive=False):
+            rows = self._row_count() if self._valid() else 0
+            signature = self.signature()
+            if rows == 0:
+                return np.empty((0, self.dim), dtype=np.float32), np.empty((0, 2), dtype=np.int64), signature
+            embeddings = np.memmap(self.embeddings_path, dtype="<f4", mode="r", shape=(rows, self.dim))
+            ids = np.memmap(self.ids_path, dtype="<i8", mode="r", shape=(rows, 2))
+            return embeddings, ids, signature
+    
+    def _append_unlocked(self, rows: List[Tuple[int, int, np.ndarray]]):
+        if not rows:
+            return
+        # Truncate any partially written tail left by a crashed writer
+        count = self._row_count()
+        for path, width in ((self.embeddings_path, self.dim * 4), (self.ids_path, 16)):
+            with open(path, "ab") as f:
+                f.truncate(count * width)
+        
+        embeddings = normalize(np.stack([embedding for _, _, embedding in rows])).astype("<f4")
+        ids = np.array([(template_id, employee_id) for template_id, employee_id, _ in rows], dtype="<i8")
+        # Embeddings first: readers size the store by the ids file
+        with open(self.embeddings_path, "ab") as f:
+            f.write(embeddings.tobytes())
+        with open(self.ids_path, "ab") as f:
+            f.write(ids.tobytes())
+    
+    def _write_all_unlocked(self, embeddings: np.ndarray, ids: np.ndarray):
+        """Rewrite the store atomically (new inodes, so stale mappings stay consistent)"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path, data in ((self.embeddings_path, embeddings.astype("<f4")), (self.ids_path, ids.astype("<i8"))):
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(np.ascontiguousarray(data).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        self.meta_path.write_text(json.dumps({"format": STORE_FORMAT, "dim": self.dim}))
+    
+    def append(self, rows: List[Tuple[int, int, np.ndarray]]):
+        """Append (template_id, employee_id, embedding) rows"""
+        with self._locked():
+            if not self._valid():
+                self._write_all_unlocked(np.empty((0, self.dim), dtype=np.float32), np.empty((0, 2), dtype=np.int64))
+            self._append_unlocked(rows)
+    
+    def _tombstone_unlocked(self, template_ids: Iterable[int]) -> int:
+        template_ids = np.fromiter(template_ids, dtype=np.int64)
+        rows = self._row_count()
+        if rows == 0 or template_ids.size == 0:
+            return 0
+        ids = np.memmap(self.ids_path, dtype="<i8", mode="r+", shape=(rows, 2))
+        hit = np.flatnonzero(np.isin(ids[:, 0], template_ids) & (ids[:, 1] != TOMBSTONE))
+        ids[hit, 1] = TOMBSTONE
+        ids.flush()
+        del ids
+        return int(hit.size)
+    
+    def tombstone(self, template_ids: Iterable[int]) -> int:
+        """Mark rows removed in place; every mapping sees the change immediately"""
+        with self._locked():
+            return self._tombstone_unlocked(template_ids)
+    
+    def _compact_unlocked(self):
+        rows = self._row_count()
+        ids = np.fromfile(self.ids_path, dtype="<i8", count=rows * 2).reshape(rows, 2)
+        embeddings = np.fromfile(self.embeddings_path, dtype="<f4", count=rows * self.dim).reshape(rows, self.dim)
+        live = ids[:, 1] != TOMBSTONE
+        self._write_all_unlocked(embeddings[live], ids[live])
+    
+    def sync(self, db: Session, batch_size: int = 500, rebuild: bool = False) -> Dict[str, int]:
+        """
+        Bring the store in line with the active face templates in the database,
+        decrypting only templates that are not in the store yet.
+        """
+        stats = {"added": 0, "removed": 0, "compacted": 0}
+        with self._locked():
+            if rebuild or not self._valid():
+                self._write_all_unlocked(np.empty((0, self.dim), dtype=np.float32), np.empty((0, 2), dtype=np.int64))
+            
+            rows = self._row_count()
+            stored = np.fromfile(self.ids_path, dtype="<i8", count=rows * 2).reshape(rows, 2)
+            stored_ids = stored[stored[:, 1] != TOMBSTONE, 0]
+            
+            active = db.query(BiometricTemplate.id).filter(
+                BiometricTemplate.template_type == "face",
+                BiometricTemplate.is_active == True
+            ).all()
+            active_ids = np.array([template_id for (template_id,) in active], dtype=np.int64)
+            
+            stats["removed"] = self._tombstone_unlocked(np.setdiff1d(stored_ids, active_ids).tolist())
+            
+            missing = np.setdiff1d(active_ids, stored_ids).tolist()
+            for start in range(0, len(missing), batch_size):
+                chunk = db.query(
+                    BiometricTemplate.id,
+                    BiometricTemplate.employee_id,
+                    BiometricTemplate.encrypted_template
+                ).filter(BiometricTemplate.id.in_(missing[start:start + batch_size])).all()
+                new_rows = []
+                for template_id, employee_id, encrypted_template in chunk:
+                    embedding = decrypt_embedding(encrypted_template)
+                    if embedding.shape[0] == self.dim:
+                        new_rows.append((template_id, employee_id, embedding))
+                self._append_unlocked(new_rows)
+                stats["added"] += len(new_rows)
+            
+            rows = self._row_count()
+            if rows:
+                ids = np.fromfile(self.ids_path, dtype="<i8", count=rows * 2).reshape(rows, 2)
+                dead = int(np.count_nonzero(ids[:, 1] == TOMBSTONE))
+                if dead > self.compact_ratio * rows:
+                    self._compact_unlocked()
+                    stats["compacted"] = dead
+        return stats
+
+def default_store() -> Optional[EmbeddingStore]:
+    """Store configured by FACE_EMBEDDING_STORE_DIR (empty disables it)"""
+    if not settings.FACE_EMBEDDING_STORE_DIR:
+        return None
+    return EmbeddingStore(settings.FACE_EMBEDDING_STORE_DIR)
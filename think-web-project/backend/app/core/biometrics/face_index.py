@@ -0,0 +1,327 @@
+"""
+Face embedding index for 1:N identification
+
+The matrix either lives in process memory or, when FACE_EMBEDDING_STORE_DIR
+is set, is a read-only memory map of the shared on-disk embedding store.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.database.models import BiometricTemplate
+from app.core.biometrics.templates import decrypt_embedding
+from app.core.biometrics.face_recognition import EMBEDDING_DIM, normalize
+from app.core.biometrics.embedding_store import EmbeddingStore, TOMBSTONE, default_store
+
+class FaceIndex:
+    """
+    Holds every active face template as rows of one contiguous float32 matrix.
+    Rows are L2-normalized so a single matrix-vector product gives the cosine
+    similarity of a probe against all enrolled templates. Removed rows in a
+    store-backed index are tombstoned (employee id -1) and masked out.
+    """
+    
+    def __init__(self, dim: int = EMBEDDING_DIM, store: Optional[EmbeddingStore] = None):
+        self.dim = dim
+        self.store = store
+        self._signature = None
+        self._lock = threading.RLock()
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._template_ids = np.empty(0, dtype=np.int64)
+        self._employee_ids = np.empty(0, dtype=np.int64)
+        self._rows: Dict[int, int] = {}  # template_id -> row
+        self._size = 0
+        self.loaded = False
+    
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._employee_ids[:self._size] != TOMBSTONE))
+    
+    def _reserve(self, capacity: int):
+        """Grow the backing arrays geometrically so appends stay amortized O(1)"""
+        if capacity <= self._matrix.shape[0]:
+            return
+        new_capacity = max(capacity, 2 * self._matrix.shape[0], 64)
+        matrix = np.empty((new_capacity, self.dim), dtype=np.float32)
+        template_ids = np.empty(new_capacity, dtype=np.int64)
+        employee_ids = np.empty(new_capacity, dtype=np.int64)
+        matrix[:self._size] = self._matrix[:self._size]
+        template_ids[:self._size] = self._template_ids[:self._size]
+        employee_ids[:self._size] = self._employee_ids[:self._size]
+        self._matrix, self._template_ids, self._employee_ids = matrix, template_ids, employee_ids
+    
+    def _map_store(self):
+        """(Re)map the shared store files; cheap, pages come from the OS page cache"""
+        embeddings, ids, signature = self.store.open()
+        self._matrix = embeddings
+        self._template_ids = ids[:, 0]
+        self._employee_ids = ids[:, 1]
+        self._size = embeddings.shape[0]
+        self._rows = dict(zip(self._template_ids.tolist(), range(self._size)))
+        self._signature = signature
+    
+    def _refresh(self):
+        """Pick up rows appended or compacted by other worker processes"""
+        if self.store is not None and self.loaded and self.store.signature() != self._signature:
+            with self._lock:
+                self._map_store()
+    
+    def load(self, db: Session):
+        """Build the index from all active face templates"""
+        if self.store is not None:
+            # Only templates missing from the shared store get decrypted
+            with self._lock:
+                self.store.sync(db)
+                self._map_store()
+                self.loaded = True
+            return
+        
+        templates = db.query(
+            BiometricTemplate.id,
+            BiometricTemplate.employee_id,
+            BiometricTemplate.encrypted_template
+        ).filter(
+            BiometricTemplate.template_type == "face",
+            BiometricTemplate.is_active == True
+        ).all()
+        
+        with self._lock:
+            self._size = 0
+            self._rows = {}
+            self._reserve(len(templates))
+            for template_id, employee_id, encrypted_template in templates:
+                embedding = decrypt_embedding(encrypted_template)
+                if embedding.shape[0] != self.dim:
+                    continue
+                self._append(template_id, employee_id, embedding)
+            self.loaded = True
+    
+    def ensure_loaded(self, db: Session):
+        """Load the index on first use"""
+        if not self.loaded:
+            with self._lock:
+                if not self.loaded:
+                    self.load(db)
+        else:
+            self._refresh()
+    
+    def _append(self, template_id: int, employee_id: int, embedding: np.ndarray):
+        self._reserve(self._size + 1)
+        row = self._size
+        self._matrix[row] = normalize(embedding)
+        self._template_ids[row] = template_id
+        self._employee_ids[row] = employee_id
+        self._rows[template_id] = row
+        self._size += 1
+    
+    def add(self, template_id: int, employee_id: int, embedding: np.ndarray):
+        """Add (or replace) a template in the index"""
+        self.add_many([(template_id, employee_id, embedding)])
+    
+    def add_many(self, rows: List[Tuple[int, int, np.ndarray]]):
+        """Add (or replace) several (template_id, employee_id, embedding) rows at once"""
+        for _, _, embedding in rows:
+            if embedding.shape[0] != self.dim:
+                raise ValueError(f"Expected a {self.dim}-dim embedding, got {embedding.shape[0]}")
+        with self._lock:
+            if self.store is not None:
+                self.store.tombstone([template_id for template_id, _, _ in rows])
+                self.store.append(rows)
+                self._map_store()
+                return
+            for template_id, employee_id, embedding in rows:
+                if template_id in self._rows:
+                    self._matrix[self._rows[template_id]] = normalize(embedding)
+                else:
+                    self._append(template_id, employee_id, embedding)
+    
+    def remove(self, template_id: int):
+        """Remove a template, moving the last row into its slot to keep the matrix dense"""
+        with self._lock:
+            row = self._rows.pop(template_id, None)
+            if self.store is not None:
+                # Another worker may have appended the row after this mapping was taken;
+                # the shared mapping sees the tombstone immediately
+                self.store.tombstone([template_id])
+                return
+            if row is None:
+                return
+            last = self._size - 1
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._template_ids[row] = self._template_ids[last]
+                self._employee_ids[row] = self._employee_ids[last]
+                self._rows[int(self._template_ids[row])] = row
+            self._size -= 1
+    
+    def remove_employee(self, employee_id: int):
+        """Remove every template belonging to an employee"""
+        self.remove_employees([employee_id])
+    
+    def remove_employees(self, employee_ids: List[int]):
+        """Remove every template belonging to any of the given employees"""
+        self._refresh()
+        with self._lock:
+            rows = np.flatnonzero(np.isin(self._employee_ids[:self._size], employee_ids))
+            template_ids = self._template_ids[rows].tolist()
+            if self.store is not None:
+                self.store.tombstone(template_ids)
+                for template_id in template_ids:
+                    self._rows.pop(template_id, None)
+                return
+            for template_id in template_ids:
+                self.remove(template_id)
+    
+    def search(self, probe: np.ndarray, k: int = 5) -> List[Tuple[int, int, float]]:
+        """
+        Score a probe against every template and return the top-k employees
+        as (employee_id, template_id, similarity), best first.
+        """
+        probe = normalize(probe)
+        self._refresh()
+        with self._lock:
+            n = self._size
+            if n == 0 or k <= 0:
+                return []
+            scores = self._matrix[:n] @ probe
+            scores[self._employee_ids[:n] == TOMBSTONE] = -np.inf
+            template_ids = self._template_ids[:n]
+            employee_ids = self._employee_ids[:n]
+            
+            # Over-fetch so employees with several templates don't crowd out others
+            fetch = min(n, k * 4)
+            if fetch < n:
+                top = np.argpartition(-scores, fetch - 1)[:fetch]
+            else:
+                top = np.arange(n)
+            top = top[np.argsort(-scores[top], kind="stable")]
+            
+            results = []
+            seen = set()
+            for row in top.tolist():
+                employee_id = int(employee_ids[row])
+                if employee_id in seen or employee_id == TOMBSTONE:
+                    continue
+                seen.add(employee_id)
+                results.append((employee_id, int(template_ids[row]), float(scores[row])))
+                if len(results) == k:
+                    break
+            return results
+    
+    def find_similar(
+        self,
+        probe: np.ndarray,
+        threshold: float,
+        exclude_employee_id: Optional[int] = None,
+        k: int = 5
+    ) -> List[Tuple[int, int, float]]:
+        """
+        Templates of other employees scoring at least threshold against the
+        probe, as (employee_id, template_id, similarity), best first.
+        """
+        probe = normalize(probe)
+        self._refresh()
+        with self._lock:
+            n = self._size
+            if n == 0:
+                return []
+            scores = self._matrix[:n] @ probe
+            mask = (scores >= threshold) & (self._employee_ids[:n] != TOMBSTONE)
+            if exclude_employee_id is not None:
+                mask &= self._employee_ids[:n] != exclude_employee_id
+            rows = np.flatnonzero(mask)
+            rows = rows[np.argsort(-scores[rows], kind="stable")][:k]
+            return [
+                (int(self._employee_ids[row]), int(self._template_ids[row]), float(scores[row]))
+                for row in rows.tolist()
+            ]
+    
+    def find_similar_batch(
+        self,
+        probes: np.ndarray,
+        employee_ids: List[int],
+        threshold: float
+    ) -> List[Optional[Tuple[int, int, float]]]:
+        """
+        Set-based duplicate check for a batch of probes: one matrix product
+        scores every probe against every indexed template. For each probe,
+        return the best (employee_id, template_id, similarity) belonging to a
+        different employee if it reaches threshold, else None.
+        """
+        probes = normalize(probes)
+        owners = np.asarray(employee_ids, dtype=np.int64)
+        results: List[Optional[Tuple[int, int, float]]] = [None] * len(owners)
+        self._refresh()
+        with self._lock:
+            n = self._size
+            if n == 0 or len(owners) == 0:
+                return results
+            scores = self._matrix[:n] @ probes.T  # (templates, probes)
+            index_employees = self._employee_ids[:n]
+            invalid = (index_employees[:, None] == owners[None, :]) | (index_employees[:, None] == TOMBSTONE)
+            scores[invalid] = -np.inf
+            best_rows = np.argmax(scores, axis=0)
+            best_scores = scores[best_rows, np.arange(len(owners))]
+            for i in np.flatnonzero(best_scores >= threshold).tolist():
+                row = int(best_rows[i])
+                results[i] = (int(index_employees[row]), int(self._template_ids[row]), float(best_scores[i]))
+            return results
+    
+    def find_duplicate_pairs(self, threshold: float, max_pairs: int = 1000, max_block_elements: int = 16 * 1024 * 1024) -> Tuple[List[Dict], bool]:
+        """
+        Audit every pair of templates belonging to different employees and
+        return the (at most max_pairs) best scoring at least threshold, plus
+        whether more pairs qualified. The Gram matrix is computed in row
+        blocks so memory stays bounded at max_block_elements scores, and only
+        the best max_pairs candidates are kept between blocks.
+        """
+        self._refresh()
+        with self._lock:
+            live = np.flatnonzero(self._employee_ids[:self._size] != TOMBSTONE)
+            matrix = self._matrix[live]
+            template_ids = self._template_ids[live]
+            employee_ids = self._employee_ids[live]
+            n = live.size
+        
+        best_a = np.empty(0, dtype=np.int64)
+        best_b = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        truncated = False
+        block = max(1, max_block_elements // max(n, 1))
+        for start in range(0, n, block):
+            stop = min(start + block, n)
+            # Only score columns to the right of each row (upper triangle)
+            scores = matrix[start:stop] @ matrix[start:].T
+            rows, cols = np.nonzero(scores >= threshold)
+            cols_abs = cols + start
+            rows_abs = rows + start
+            keep = (cols_abs > rows_abs) & (employee_ids[rows_abs] != employee_ids[cols_abs])
+            best_a = np.concatenate([best_a, rows_abs[keep]])
+            best_b = np.concatenate([best_b, cols_abs[keep]])
+            best_scores = np.concatenate([best_scores, scores[rows[keep], cols[keep]]])
+            if best_scores.size > max_pairs:
+                truncated = True
+                top = np.argpartition(-best_scores, max_pairs - 1)[:max_pairs]
+                best_a, best_b, best_scores = best_a[top], best_b[top], best_scores[top]
+        
+        order = np.argsort(-best_scores, kind="stable")
+        pairs = [
+            {
+                "employee_id": int(employee_ids[a]),
+                "template_id": int(template_ids[a]),
+                "duplicate_employee_id": int(employee_ids[b]),
+                "duplicate_template_id": int(template_ids[b]),
+                "similarity": float(score)
+            }
+            for a, b, score in zip(best_a[order].tolist(), best_b[order].tolist(), best_scores[order].tolist())
+        ]
+        return pairs, truncated
+    
+    def best_match(self, probe: np.ndarray) -> Optional[Tuple[int, int, float]]:
+        """Return the single best (employee_id, template_id, similarity) or None"""
+        results = self.search(probe, k=1)
+        return results[0] if results else None
+
+# Process-wide index shared by the biometric endpoints
+face_index = FaceIndex(store=default_store())
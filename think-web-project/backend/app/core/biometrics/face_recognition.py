@@ -0,0 +1,74 @@
+"""
+Face recognition service (detection, liveness and embedding extraction)
+
+These functions are CPU-bound and are meant to run inside the biometric
+worker pool, so they only depend on their arguments and module-level state
+that every worker process can rebuild on import.
+"""
+import hashlib
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.biometrics.imaging import decode_image
+
+EMBEDDING_DIM = 512
+
+def normalize(embedding: np.ndarray) -> np.ndarray:
+    """L2-normalize an embedding (or a matrix of embeddings row-wise)"""
+    embedding = np.asarray(embedding, dtype=np.float32)
+    norms = np.linalg.norm(embedding, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embedding / norms
+
+class FaceAnalysis(NamedTuple):
+    embedding: Optional[np.ndarray]
+    is_live: bool
+    liveness_score: float
+
+def extract_embedding(image: np.ndarray) -> Optional[np.ndarray]:
+    """Extract a face embedding from a decoded RGB image"""
+    if image is None or image.size == 0:
+        return None
+    
+    # Placeholder until a face model is wired in: a unit vector seeded from the
+    # pixels, so the same capture always yields the same embedding. It is drawn
+    # zero-mean, which puts two different captures near 0 cosine similarity,
+    # far below FACE_MATCH_THRESHOLD: the placeholder never matches one face
+    # against another
+    seed = int.from_bytes(hashlib.sha256(image.tobytes()).digest()[:8], "little")
+    return normalize(np.random.default_rng(seed).standard_normal(EMBEDDING_DIM, dtype=np.float32))
+
+def detect_liveness(image: np.ndarray) -> Tuple[bool, float]:
+    """Detect if face is live (not a photo)"""
+    # Placeholder until an anti-spoofing model is wired in: a fixed score, so
+    # liveness gates nothing yet; only an exact capture match can verify
+    liveness_score = 0.90
+    return liveness_score > settings.LIVENESS_THRESHOLD, liveness_score
+
+def analyze_image(image: Optional[np.ndarray]) -> FaceAnalysis:
+    """Run detection, liveness and embedding extraction for one decoded image"""
+    embedding = extract_embedding(image)
+    if embedding is None:
+        return FaceAnalysis(None, False, 0.0)
+    is_live, liveness_score = detect_liveness(image)
+    return FaceAnalysis(embedding, is_live, liveness_score)
+
+def analyze_face(image_bytes: bytes) -> FaceAnalysis:
+    """Decode (downscaled to the model input size) and analyze one capture"""
+    return analyze_image(decode_image(image_bytes, settings.FACE_INPUT_SIZE))
+
+def analyze_faces(images: List[bytes]) -> List[FaceAnalysis]:
+    """Analyze a batch of images in one worker call; consumes (empties) `images`"""
+    # Decode everything first and drop each encoded capture once decoded, so
+    # peak memory is the downscaled batch rather than the raw uploads. Popping
+    # from the end keeps this O(n)
+    decoded = []
+    while images:
+        decoded.append(decode_image(images.pop(), settings.FACE_INPUT_SIZE))
+    decoded.reverse()
+    
+    # The embedding model is still a per-image placeholder, so there is no batched
+    # forward pass to stack crops into; images are analyzed one by one
+    return [analyze_image(image) for image in decoded]
@@ -0,0 +1,490 @@
+"""
+Fingerprint minutiae templates and matching
+
+Scanners extract minutiae on the device and send them as (x, y, ridge angle,
+type, quality), so matching needs no vendor SDK on the server. Templates use a
+compact 6-bytes-per-minutia record in the spirit of ISO/IEC 19794-2:
+    
+    magic "TWF" | version (u8) | count (u16) | count x (x u16 | y u16 | angle u8 | type/quality u8)
+
+Matching aligns the probe to each candidate with a Hough vote over all
+minutia pairs, then counts minutiae that agree in position and direction.
+Both steps are vectorized over many candidates per NumPy call.
+"""
+from datetime import datetime
+import struct
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.database.models import BiometricTemplate
+from app.core.biometrics.templates import cipher
+
+TEMPLATE_MAGIC = b"TWF"
+TEMPLATE_VERSION = 1
+
+# Columns of a decoded minutiae array
+X, Y, ANGLE, TYPE, QUALITY = range(5)
+MINUTIA_TYPES = {"ending": 0, "bifurcation": 1}
+MAX_MINUTIAE = 255
+
+TWO_PI = 2.0 * np.pi
+DISTANCE_TOLERANCE = 15.0  # Pixels at 500 dpi (~0.75 mm)
+ANGLE_TOLERANCE = np.radians(20.0)
+ROTATION_BIN = np.radians(12.0)
+SHIFT_BIN = 24.0
+SHIFT_BINS = 64  # Translations of +-768 px are voted on
+PAIR_BUDGET = 1_000_000  # Probe x candidate minutia pairs scored per chunk
+# Quantized local-feature tolerances: nearest-neighbour distance (px) and two
+# relative angles (1/256 turn, so 18 ~ 25 degrees)
+FEATURE_TOLERANCE = (8, 18, 18)
+SHORTLIST = 64  # Candidates that 1:N identification scores exactly
+
+_header = struct.Struct("<3sBH")
+_record = np.dtype([("x", "<u2"), ("y", "<u2"), ("angle", "u1"), ("kind", "u1")])
+
+def encode_minutiae(minutiae: np.ndarray) -> bytes:
+    """Serialize an (n, 5) minutiae array (angles in radians) into the template format"""
+    minutiae = np.asarray(minutiae, dtype=np.float64).reshape(-1, 5)
+    if minutiae.shape[0] > MAX_MINUTIAE:
+        raise ValueError(f"At most {MAX_MINUTIAE} minutiae are supported")
+    
+    records = np.empty(minutiae.shape[0], dtype=_record)
+    records["x"] = np.clip(np.round(minutiae[:, X]), 0, 65535)
+    records["y"] = np.clip(np.round(minutiae[:, Y]), 0, 65535)
+    records["angle"] = np.round(np.mod(minutiae[:, ANGLE], TWO_PI) / TWO_PI * 256).astype(np.int64) % 256
+    records["kind"] = (minutiae[:, TYPE].astype(np.int64) & 1) << 7 | np.clip(np.round(minutiae[:, QUALITY]), 0, 100).astype(np.int64)
+    return _header.pack(TEMPLATE_MAGIC, TEMPLATE_VERSION, records.shape[0]) + records.tobytes()
+
+def decode_minutiae(data: bytes) -> np.ndarray:
+    """Deserialize a template into an (n, 5) float32 minutiae array"""
+    if len(data) < _header.size:
+        raise ValueError("Fingerprint template is truncated")
+    magic, version, count = _header.unpack_from(data)
+    if magic != TEMPLATE_MAGIC or version != TEMPLATE_VERSION or len(data) != _header.size + count * _record.itemsize:
+        raise ValueError("Not a fingerprint template")
+    
+    records = np.frombuffer(data, dtype=_record, count=count, offset=_header.size)
+    minutiae = np.empty((count, 5), dtype=np.float32)
+    minutiae[:, X] = records["x"]
+    minutiae[:, Y] = records["y"]
+    minutiae[:, ANGLE] = records["angle"].astype(np.float32) * (TWO_PI / 256)
+    minutiae[:, TYPE] = records["kind"] >> 7
+    minutiae[:, QUALITY] = records["kind"] & 0x7F
+    return minutiae
+
+def encrypt_minutiae(minutiae: np.ndarray) -> bytes:
+    """Encode and encrypt a minutiae set for storage"""
+    return cipher.encrypt(encode_minutiae(minutiae))
+
+def decrypt_minutiae(encrypted_template: bytes) -> np.ndarray:
+    """Decrypt and decode a stored fingerprint template"""
+    return decode_minutiae(cipher.decrypt(encrypted_template))
+
+def minutiae_from_points(points: Iterable[Dict]) -> np.ndarray:
+    """Build a minutiae array from API points (angle in degrees, type name)"""
+    rows = []
+    for point in points:
+        kind = point.get("type", "ending")
+        if kind not in MINUTIA_TYPES:
+            raise ValueError(f"Unknown minutia type: {kind}")
+        rows.append((point["x"], point["y"], np.radians(point["angle"]), MINUTIA_TYPES[kind], point.get("quality", 100)))
+    return np.array(rows, dtype=np.float32).reshape(-1, 5)
+
+def pad_minutiae(sets: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Stack variable-length minutiae sets into a (C, M, 3) array plus a (C, M) validity mask"""
+    width = max((len(minutiae) for minutiae in sets), default=0)
+    padded = np.zeros((len(sets), width, 3), dtype=np.float32)
+    mask = np.zeros((len(sets), width), dtype=bool)
+    for i, minutiae in enumerate(sets):
+        padded[i, :len(minutiae)] = minutiae[:, :3]
+        mask[i, :len(minutiae)] = True
+    return padded, mask
+
+def minutiae_features(minutiae: np.ndarray) -> np.ndarray:
+    """
+    Rotation- and translation-invariant local features per minutia, quantized
+    to uint8: distance to the nearest neighbour, direction to it relative to
+    the ridge angle, and the neighbour's ridge angle relative to this one.
+    """
+    minutiae = np.asarray(minutiae, dtype=np.float32)
+    features = np.zeros((len(minutiae), 3), dtype=np.uint8)
+    if len(minutiae) < 2:
+        return features
+    dx = minutiae[None, :, X] - minutiae[:, None, X]
+    dy = minutiae[None, :, Y] - minutiae[:, None, Y]
+    distance = np.hypot(dx, dy)
+    np.fill_diagonal(distance, np.inf)
+    nearest = distance.argmin(axis=1)
+    rows = np.arange(len(minutiae))
+    alpha = np.arctan2(dy[rows, nearest], dx[rows, nearest]) - minutiae[:, ANGLE]
+    beta = minutiae[nearest, ANGLE] - minutiae[:, ANGLE]
+    # Distances stay below 128 so the wrapping uint8 comparison cannot alias
+    features[:, 0] = np.minimum(np.round(distance[rows, nearest]), 127)
+    features[:, 1] = np.round(np.mod(alpha, TWO_PI) / TWO_PI * 256).astype(np.int64) % 256
+    features[:, 2] = np.round(np.mod(beta, TWO_PI) / TWO_PI * 256).astype(np.int64) % 256
+    return features
+
+def vote_support(
+    probe: np.ndarray,
+    probe_features: np.ndarray,
+    candidates: np.ndarray,
+    features: np.ndarray,
+    mask: np.ndarray
+) -> np.ndarray:
+    """
+    Cheap first pass for 1:N: only minutia pairs with compatible local
+    features vote on an alignment, and each candidate gets the vote count of
+    its most supported transform. Shape (C,).
+    """
+    support = np.zeros(candidates.shape[0], dtype=np.int64)
+    if probe.shape[0] == 0 or candidates.shape[0] == 0 or candidates.shape[1] == 0:
+        return support
+    
+    chunk = max(1, PAIR_BUDGET // (probe.shape[0] * candidates.shape[1]))
+    rotation_bins = int(np.ceil(TWO_PI / ROTATION_BIN))
+    bins_per_candidate = rotation_bins * SHIFT_BINS * SHIFT_BINS
+    for start in range(0, candidates.shape[0], chunk):
+        stop = min(start + chunk, candidates.shape[0])
+        # Wrapping uint8 arithmetic: |a - b| <= tol  <=>  (a - b + tol) mod 256 <= 2 tol
+        compatible = np.broadcast_to(mask[start:stop, None, :], (stop - start, probe.shape[0], mask.shape[1])).copy()
+        for k, tolerance in enumerate(FEATURE_TOLERANCE):
+            difference = features[start:stop, None, :, k] - probe_features[None, :, None, k]
+            difference += np.uint8(tolerance)
+            compatible &= difference <= 2 * tolerance
+        owner, i, j = np.nonzero(compatible)
+        if owner.size == 0:
+            continue
+        
+        candidate = candidates[start + owner, j]
+        rotation = np.mod(candidate[:, ANGLE] - probe[i, ANGLE], TWO_PI)
+        cos, sin = np.cos(rotation), np.sin(rotation)
+        tx = candidate[:, X] - (cos * probe[i, X] - sin * probe[i, Y])
+        ty = candidate[:, Y] - (sin * probe[i, X] + cos * probe[i, Y])
+        tx_bin = np.floor(tx / SHIFT_BIN).astype(np.int64) + SHIFT_BINS // 2
+        ty_bin = np.floor(ty / SHIFT_BIN).astype(np.int64) + SHIFT_BINS // 2
+        inside = (tx_bin >= 0) & (tx_bin < SHIFT_BINS) & (ty_bin >= 0) & (ty_bin < SHIFT_BINS)
+        rotation_bin = np.minimum((rotation / ROTATION_BIN).astype(np.int64), rotation_bins - 1)
+        keys = ((owner * rotation_bins + rotation_bin) * SHIFT_BINS + tx_bin) * SHIFT_BINS + ty_bin
+        
+        unique_keys, votes = np.unique(keys[inside], return_counts=True)
+        if unique_keys.size == 0:
+            continue
+        # Keys sort by candidate first, so a segmented max gives each one's best bin
+        owners = unique_keys // bins_per_candidate
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        support[start + owners[starts]] = np.maximum.reduceat(votes, starts)
+    return support
+
+def _score_chunk(probe: np.ndarray, candidates: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    count = candidates.shape[0]
+    n = probe.shape[0]
+    px, py, pa = probe[:, X], probe[:, Y], probe[:, ANGLE]
+    cx, cy, ca = candidates[..., X], candidates[..., Y], candidates[..., ANGLE]
+    
+    # Every (probe minutia, candidate minutia) pair proposes a rotation and a
+    # translation; shape (C, n, M)
+    rotation = np.mod(ca[:, None, :] - pa[None, :, None], TWO_PI)
+    cos, sin = np.cos(rotation), np.sin(rotation)
+    tx = cx[:, None, :] - (cos * px[None, :, None] - sin * py[None, :, None])
+    ty = cy[:, None, :] - (sin * px[None, :, None] + cos * py[None, :, None])
+    
+    rotation_bins = int(np.ceil(TWO_PI / ROTATION_BIN))
+    bins_per_candidate = rotation_bins * SHIFT_BINS * SHIFT_BINS
+    rotation_bin = np.minimum((rotation / ROTATION_BIN).astype(np.int64), rotation_bins - 1)
+    tx_bin = np.floor(tx / SHIFT_BIN).astype(np.int64) + SHIFT_BINS // 2
+    ty_bin = np.floor(ty / SHIFT_BIN).astype(np.int64) + SHIFT_BINS // 2
+    voting = (
+        mask[:, None, :]
+        & (tx_bin >= 0) & (tx_bin < SHIFT_BINS)
+        & (ty_bin >= 0) & (ty_bin < SHIFT_BINS)
+    )
+    keys = ((np.arange(count)[:, None, None] * rotation_bins + rotation_bin) * SHIFT_BINS + tx_bin) * SHIFT_BINS + ty_bin
+    
+    # Most voted transform per candidate: unique (key, votes), then the last
+    # entry of each candidate's group when ordered by votes
+    scores = np.zeros(count, dtype=np.float32)
+    unique_keys, votes = np.unique(keys[voting], return_counts=True)
+    if unique_keys.size == 0:
+        return scores
+    owners = unique_keys // bins_per_candidate
+    order = np.lexsort((votes, owners))
+    last = np.r_[owners[order][1:] != owners[order][:-1], True]
+    best_key = np.full(count, -1, dtype=np.int64)
+    best_key[owners[order][last]] = unique_keys[order][last]
+    
+    # Refine each candidate's transform as the mean of the pairs in its best bin
+    in_best = voting & (keys == best_key[:, None, None])
+    support = np.maximum(in_best.sum(axis=(1, 2)), 1)
+    theta = np.arctan2((sin * in_best).sum(axis=(1, 2)), (cos * in_best).sum(axis=(1, 2)))
+    shift_x = (tx * in_best).sum(axis=(1, 2)) / support
+    shift_y = (ty * in_best).sum(axis=(1, 2)) / support
+    
+    # Map the probe into each candidate's frame; shape (C, n)
+    cos_t, sin_t = np.cos(theta)[:, None], np.sin(theta)[:, None]
+    ax = cos_t * px[None, :] - sin_t * py[None, :] + shift_x[:, None]
+    ay = sin_t * px[None, :] + cos_t * py[None, :] + shift_y[:, None]
+    aa = pa[None, :] + theta[:, None]
+    
+    distance = (ax[:, :, None] - cx[:, None, :]) ** 2 + (ay[:, :, None] - cy[:, None, :]) ** 2
+    angle_diff = np.abs(np.mod(aa[:, :, None] - ca[:, None, :] + np.pi, TWO_PI) - np.pi)
+    agree = mask[:, None, :] & (distance <= DISTANCE_TOLERANCE ** 2) & (angle_diff <= ANGLE_TOLERANCE)
+    distance = np.where(agree, distance, np.inf)
+    
+    # One-to-one pairing: count mutual nearest neighbours among agreeing pairs
+    nearest_candidate = distance.argmin(axis=2)  # (C, n)
+    nearest_probe = distance.argmin(axis=1)  # (C, M)
+    rows = np.arange(count)[:, None]
+    mutual = (
+        np.take_along_axis(nearest_probe, nearest_candidate, axis=1) == np.arange(n)[None, :]
+    ) & np.isfinite(distance[rows, np.arange(n)[None, :], nearest_candidate])
+    matched = mutual.sum(axis=1).astype(np.float32)
+    
+    sizes = mask.sum(axis=1).astype(np.float32)
+    valid = sizes > 0
+    scores[valid] = matched[valid] ** 2 / (n * sizes[valid])
+    return scores
+
+def match_scores(probe: np.ndarray, candidates: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    Similarity in [0, 1] of one probe against C padded candidates at once:
+    matched minutiae squared over the product of both set sizes.
+    """
+    probe = np.asarray(probe, dtype=np.float32)[:, :3]
+    scores = np.zeros(candidates.shape[0], dtype=np.float32)
+    if probe.shape[0] == 0 or candidates.shape[0] == 0 or candidates.shape[1] == 0:
+        return scores
+    
+    chunk = max(1, PAIR_BUDGET // (probe.shape[0] * candidates.shape[1]))
+    for start in range(0, candidates.shape[0], chunk):
+        stop = start + chunk
+        scores[start:stop] = _score_chunk(probe, candidates[start:stop], mask[start:stop])
+    return scores
+
+def synthetic_minutiae(seed: int, count: int = 40, size: Tuple[int, int] = (300, 400)) -> np.ndarray:
+    """Random but plausible minutiae set, for demos and testing without scanner hardware"""
+    rng = np.random.default_rng(seed)
+    minutiae = np.empty((count, 5), dtype=np.float32)
+    minutiae[:, X] = rng.uniform(20, size[0] - 20, count)
+    minutiae[:, Y] = rng.uniform(20, size[1] - 20, count)
+    minutiae[:, ANGLE] = rng.uniform(0, TWO_PI, count)
+    minutiae[:, TYPE] = rng.integers(0, 2, count)
+    minutiae[:, QUALITY] = rng.integers(40, 101, count)
+    return minutiae
+
+def distort_minutiae(
+    minutiae: np.ndarray,
+    seed: int,
+    rotation: float = 15.0,
+    shift: float = 30.0,
+    jitter: float = 3.0,
+    drop: float = 0.2,
+    spurious: int = 5
+) -> np.ndarray:
+    """
+    Simulate another capture of the same finger: rotate (degrees), translate,
+    jitter positions, drop a fraction of minutiae and add spurious ones.
+    """
+    rng = np.random.default_rng(seed)
+    theta = np.radians(rng.uniform(-rotation, rotation))
+    cos, sin = np.cos(theta), np.sin(theta)
+    center = minutiae[:, [X, Y]].mean(axis=0)
+    
+    kept = minutiae[rng.random(len(minutiae)) >= drop].copy()
+    x, y = kept[:, X] - center[0], kept[:, Y] - center[1]
+    offset = rng.uniform(-shift, shift, 2)
+    kept[:, X] = cos * x - sin * y + center[0] + offset[0] + rng.normal(0, jitter, len(kept))
+    kept[:, Y] = sin * x + cos * y + center[1] + offset[1] + rng.normal(0, jitter, len(kept))
+    kept[:, ANGLE] = np.mod(kept[:, ANGLE] + theta + rng.normal(0, np.radians(jitter), len(kept)), TWO_PI)
+    
+    noise = synthetic_minutiae(seed + 1, spurious)
+    combined = np.concatenate([kept, noise])
+    combined[:, [X, Y]] = np.maximum(combined[:, [X, Y]], 0)
+    return combined[rng.permutation(len(combined))]
+
+class FingerprintIndex:
+    """
+    Every active fingerprint template as one padded (N, M, 3) minutiae array
+    plus its local features, for 1:N identification: a feature-filtered vote
+    ranks all templates and only a shortlist is scored exactly. Other
+    workers' enrollments are picked up through a cheap (count, max id,
+    newest created_at) signature check against the database; the timestamp
+    catches a deleted template whose id was reused by the next enrollment.
+    """
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._minutiae = np.zeros((0, 0, 3), dtype=np.float32)
+        self._features = np.zeros((0, 0, 3), dtype=np.uint8)
+        self._mask = np.zeros((0, 0), dtype=bool)
+        self._template_ids = np.empty(0, dtype=np.int64)
+        self._employee_ids = np.empty(0, dtype=np.int64)
+        self._rows: Dict[int, int] = {}  # template_id -> row
+        self._created_at: Dict[int, Optional[datetime]] = {}  # template_id -> created_at, for the signature
+        self._size = 0
+        self._signature = None
+        self.loaded = False
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def _reserve(self, capacity: int, width: int):
+        """Grow rows geometrically and widen the padding to the largest minutiae set"""
+        rows, current_width = self._mask.shape
+        if capacity <= rows and width <= current_width:
+            return
+        new_rows = max(capacity, 2 * rows, 64) if capacity > rows else rows
+        new_width = max(width, current_width)
+        minutiae = np.zeros((new_rows, new_width, 3), dtype=np.float32)
+        features = np.zeros((new_rows, new_width, 3), dtype=np.uint8)
+        mask = np.zeros((new_rows, new_width), dtype=bool)
+        template_ids = np.empty(new_rows, dtype=np.int64)
+        employee_ids = np.empty(new_rows, dtype=np.int64)
+        minutiae[:self._size, :current_width] = self._minutiae[:self._size]
+        features[:self._size, :current_width] = self._features[:self._size]
+        mask[:self._size, :current_width] = self._mask[:self._size]
+        template_ids[:self._size] = self._template_ids[:self._size]
+        employee_ids[:self._size] = self._employee_ids[:self._size]
+        self._minutiae, self._features, self._mask = minutiae, features, mask
+        self._template_ids, self._employee_ids = template_ids, employee_ids
+    
+    @staticmethod
+    def _db_signature(db: Session) -> Tuple[int, int, Optional[datetime]]:
+        count, max_id, newest = db.query(
+            func.count(BiometricTemplate.id), func.max(BiometricTemplate.id), func.max(BiometricTemplate.created_at)
+        ).filter(
+            BiometricTemplate.template_type == "fingerprint",
+            BiometricTemplate.is_active == True
+        ).one()
+        return int(count or 0), int(max_id or 0), newest
+    
+    def load(self, db: Session):
+        """Build the index from all active fingerprint templates"""
+        signature = self._db_signature(db)
+        templates = db.query(
+            BiometricTemplate.id,
+            BiometricTemplate.employee_id,
+            BiometricTemplate.encrypted_template,
+            BiometricTemplate.created_at
+        ).filter(
+            BiometricTemplate.template_type == "fingerprint",
+            BiometricTemplate.is_active == True
+        ).all()
+        
+        with self._lock:
+            self._size = 0
+            self._rows = {}
+            self._created_at = {}
+            self._mask[:] = False
+            for template_id, employee_id, encrypted_template, created_at in templates:
+                self._put(template_id, employee_id, decrypt_minutiae(encrypted_template))
+                self._created_at[template_id] = created_at
+            self._signature = signature
+            self.loaded = True
+    
+    def ensure_loaded(self, db: Session):
+        """Load on first use and reload when another worker changed the templates"""
+        if self.loaded and self._db_signature(db) == self._signature:
+            return
+        with self._lock:
+            # A concurrent caller may have reloaded while this one waited for the lock
+            if not self.loaded or self._db_signature(db) != self._signature:
+                self.load(db)
+    
+    def _track_signature(self):
+        # After a load the rows mirror the active templates, so the database
+        # signature is the row count, highest template id and newest creation held here
+        stamps = [created_at for created_at in self._created_at.values() if created_at is not None]
+        self._signature = (
+            self._size,
+            int(self._template_ids[:self._size].max()) if self._size else 0,
+            max(stamps) if stamps else None
+        )
+    
+    def _put(self, template_id: int, employee_id: int, minutiae: np.ndarray):
+        row = self._rows.get(template_id)
+        if row is None:
+            self._reserve(self._size + 1, len(minutiae))
+            row = self._size
+            self._size += 1
+        else:
+            self._reserve(self._size, len(minutiae))
+        self._minutiae[row] = 0
+        self._minutiae[row, :len(minutiae)] = minutiae[:, :3]
+        self._features[row] = 0
+        self._features[row, :len(minutiae)] = minutiae_features(minutiae)
+        self._mask[row] = False
+        self._mask[row, :len(minutiae)] = True
+        self._template_ids[row] = template_id
+        self._employee_ids[row] = employee_id
+        self._rows[template_id] = row
+    
+    def add(self, template_id: int, employee_id: int, minutiae: np.ndarray, created_at: Optional[datetime] = None):
+        """Add (or replace) a template in the index"""
+        with self._lock:
+            self._put(template_id, employee_id, minutiae)
+            self._created_at[template_id] = created_at
+            self._track_signature()
+    
+    def remove(self, template_id: int):
+        """Remove a template, moving the last row into its slot to keep the arrays dense"""
+        with self._lock:
+            row = self._rows.pop(template_id, None)
+            if row is None:
+                return
+            self._created_at.pop(template_id, None)
+            last = self._size - 1
+            if row != last:
+                self._minutiae[row] = self._minutiae[last]
+                self._features[row] = self._features[last]
+                self._mask[row] = self._mask[last]
+                self._template_ids[row] = self._template_ids[last]
+                self._employee_ids[row] = self._employee_ids[last]
+                self._rows[int(self._template_ids[row])] = row
+            self._mask[last] = False
+            self._size -= 1
+            self._track_signature()
+    
+    def search(
+        self,
+        probe: np.ndarray,
+        k: int = 5,
+        exclude_employee_id: Optional[int] = None
+    ) -> List[Tuple[int, int, float]]:
+        """
+        Score a probe against every template and return the top-k employees
+        as (employee_id, template_id, score), best first.
+        """
+        with self._lock:
+            n = self._size
+            if n == 0 or k <= 0:
+                return []
+            support = vote_support(probe, minutiae_features(probe), self._minutiae[:n], self._features[:n], self._mask[:n])
+            if exclude_employee_id is not None:
+                support[self._employee_ids[:n] == exclude_employee_id] = -1
+            
+            # Exact alignment and pairing only for the best-supported templates
+            shortlist = np.flatnonzero(support >= 0)
+            if shortlist.size > SHORTLIST:
+                shortlist = shortlist[np.argpartition(-support[shortlist], SHORTLIST - 1)[:SHORTLIST]]
+            scores = match_scores(probe, self._minutiae[shortlist], self._mask[shortlist])
+            template_ids = self._template_ids[shortlist]
+            employee_ids = self._employee_ids[shortlist]
+        
+        results = []
+        seen = set()
+        for row in np.argsort(-scores, kind="stable").tolist():
+            employee_id = int(employee_ids[row])
+            if employee_id in seen:
+                continue
+            seen.add(employee_id)
+            results.append((employee_id, int(template_ids[row]), float(scores[row])))
+            if len(results) == k:
+                break
+        return results
+
+# Process-wide index shared by the biometric endpoints
+fingerprint_index = FingerprintIndex()
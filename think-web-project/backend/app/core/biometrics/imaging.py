@@ -0,0 +1,55 @@
+"""
+Image decoding for the face model
+
+Captures are decoded straight to the model input size: JPEG draft mode lets
+Pillow decode at 1/2, 1/4 or 1/8 scale, so a 12MP phone photo never expands
+to a full-resolution bitmap in the worker.
+"""
+from io import BytesIO
+from typing import Optional
+
+import numpy as np
+
+try:
+    from PIL import Image
+    # Refuse decompression bombs well before they can exhaust worker memory
+    Image.MAX_IMAGE_PIXELS = 50_000_000
+except ImportError:  # OpenCV fallback
+    Image = None
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+def decode_image(image_bytes: bytes, max_side: int) -> Optional[np.ndarray]:
+    """Decode to an RGB uint8 array whose longest side is at most max_side, or None if unreadable"""
+    if not image_bytes:
+        return None
+    if Image is not None:
+        return _decode_pillow(image_bytes, max_side)
+    if cv2 is not None:
+        return _decode_opencv(image_bytes, max_side)
+    raise RuntimeError("Pillow or OpenCV is required to decode face images")
+
+def _decode_pillow(image_bytes: bytes, max_side: int) -> Optional[np.ndarray]:
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            image.draft("RGB", (max_side, max_side))
+            image = image.convert("RGB")
+            image.thumbnail((max_side, max_side))
+            return np.asarray(image, dtype=np.uint8)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+def _decode_opencv(image_bytes: bytes, max_side: int) -> Optional[np.ndarray]:
+    buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    del buffer
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
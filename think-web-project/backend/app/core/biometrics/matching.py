@@ -0,0 +1,40 @@
+"""
+Face and fingerprint matching against an employee's enrolled templates
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.database.models import BiometricTemplate
+from app.core.biometrics.fingerprint import decrypt_minutiae, pad_minutiae
+from app.core.biometrics.template_cache import template_cache
+
+def active_face_template_ids(db: Session, employee_id: int):
+    """Return ids of an employee's active face templates"""
+    return [
+        template_id for (template_id,) in db.query(BiometricTemplate.id).filter(
+            BiometricTemplate.employee_id == employee_id,
+            BiometricTemplate.template_type == "face",
+            BiometricTemplate.is_active == True
+        ).all()
+    ]
+
+def employee_face_templates(db: Session, employee_id: int) -> Optional[np.ndarray]:
+    """Stack the employee's active face embeddings into a matrix, or None if not enrolled"""
+    template_ids = active_face_template_ids(db, employee_id)
+    stored_embeddings = template_cache.get_many(db, template_ids)
+    if not stored_embeddings:
+        return None
+    return np.stack(list(stored_embeddings.values()))
+
+def employee_fingerprint_templates(db: Session, employee_id: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Padded minutiae and mask of the employee's active fingerprint templates, or None if not enrolled"""
+    templates = db.query(BiometricTemplate.encrypted_template).filter(
+        BiometricTemplate.employee_id == employee_id,
+        BiometricTemplate.template_type == "fingerprint",
+        BiometricTemplate.is_active == True
+    ).all()
+    if not templates:
+        return None
+    return pad_minutiae([decrypt_minutiae(encrypted_template) for (encrypted_template,) in templates])
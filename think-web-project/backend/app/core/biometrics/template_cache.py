@@ -0,0 +1,108 @@
+"""
+Bounded LRU cache of decrypted biometric templates
+"""
+from collections import OrderedDict
+import threading
+from typing import Dict, Iterable, List
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.biometrics.templates import decrypt_embedding
+from app.database.models import BiometricTemplate
+
+class TemplateCache:
+    """
+    Maps template id -> decrypted embedding, evicting least recently used
+    entries once the total size of cached arrays exceeds max_bytes.
+    """
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, template_id: int):
+        """Return the cached embedding or None, counting the hit or miss"""
+        with self._lock:
+            embedding = self._entries.get(template_id)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(template_id)
+            self.hits += 1
+            return embedding
+    
+    def put(self, template_id: int, embedding: np.ndarray):
+        """Insert an embedding, evicting old entries to stay under the memory cap"""
+        embedding = np.asarray(embedding)
+        embedding.setflags(write=False)
+        if embedding.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(template_id, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[template_id] = embedding
+            self._bytes += embedding.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+    
+    def get_many(self, db: Session, template_ids: Iterable[int]) -> Dict[int, np.ndarray]:
+        """Return embeddings for the given ids, decrypting only the cache misses"""
+        embeddings = {}
+        missing: List[int] = []
+        for template_id in template_ids:
+            embedding = self.get(template_id)
+            if embedding is None:
+                missing.append(template_id)
+            else:
+                embeddings[template_id] = embedding
+        
+        if missing:
+            rows = db.query(
+                BiometricTemplate.id,
+                BiometricTemplate.encrypted_template
+            ).filter(BiometricTemplate.id.in_(missing)).all()
+            for template_id, encrypted_template in rows:
+                embedding = decrypt_embedding(encrypted_template)
+                self.put(template_id, embedding)
+                embeddings[template_id] = embedding
+        
+        return embeddings
+    
+    def invalidate(self, *template_ids: int):
+        """Drop entries explicitly (template re-enrolled, deactivated or deleted)"""
+        with self._lock:
+            for template_id in template_ids:
+                embedding = self._entries.pop(template_id, None)
+                if embedding is not None:
+                    self._bytes -= embedding.nbytes
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+# Process-wide cache shared by the biometric endpoints
+template_cache = TemplateCache(settings.BIOMETRIC_CACHE_MAX_BYTES)
@@ -0,0 +1,137 @@
+"""
+Biometric template encoding and encryption helpers
+
+Templates are stored as a small versioned binary record inside a Fernet token:
+    
+    magic "TWT" | version (u8) | encoding (u8) | dim (u16) | [scale (f32) | zero_point (i32)] | payload
+
+The scale/zero-point pair is only present for int8 templates. Rows written
+before the format existed are a bare float32 array and still decode.
+"""
+import hashlib
+import struct
+from typing import Dict, Optional
+
+from cryptography.fernet import Fernet
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database.models import BiometricTemplate
+
+# Initialize encryption (in production, load from secure key management)
+try:
+    cipher = Fernet(settings.BIOMETRIC_ENCRYPTION_KEY.encode()[:44].ljust(44, b'0'))
+except:
+    # Generate key if not set (for development only)
+    key = Fernet.generate_key()
+    cipher = Fernet(key)
+
+TEMPLATE_MAGIC = b"TWT"
+TEMPLATE_VERSION = 1
+
+ENCODING_LEGACY = "legacy"  # Headerless float32 rows written before versioning
+ENCODINGS = {"float32": 0, "float16": 1, "int8": 2}
+ENCODING_NAMES = {code: name for name, code in ENCODINGS.items()}
+ENCODING_DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2"), "int8": np.dtype(np.int8)}
+
+_header = struct.Struct("<3sBBH")
+_quantization = struct.Struct("<fi")
+
+def encode_template(embedding: np.ndarray, encoding: Optional[str] = None) -> bytes:
+    """Serialize an embedding into the versioned template format"""
+    encoding = encoding or settings.BIOMETRIC_TEMPLATE_ENCODING
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown template encoding: {encoding}")
+    
+    embedding = np.asarray(embedding, dtype=np.float32).ravel()
+    header = _header.pack(TEMPLATE_MAGIC, TEMPLATE_VERSION, ENCODINGS[encoding], embedding.shape[0])
+    
+    if encoding != "int8":
+        return header + embedding.astype(ENCODING_DTYPES[encoding]).tobytes()
+    
+    # int8: asymmetric affine quantization over the embedding's own range
+    low, high = float(embedding.min()), float(embedding.max())
+    scale = (high - low) / 255.0 or 1.0
+    zero_point = int(round(-128 - low / scale))
+    quantized = np.clip(np.round(embedding / scale) + zero_point, -128, 127).astype(np.int8)
+    return header + _quantization.pack(scale, zero_point) + quantized.tobytes()
+
+def template_encoding(data: bytes) -> str:
+    """Return the encoding name of a serialized template"""
+    if len(data) >= _header.size:
+        magic, version, code, dim = _header.unpack_from(data)
+        if magic == TEMPLATE_MAGIC and version == TEMPLATE_VERSION and code in ENCODING_NAMES:
+            name = ENCODING_NAMES[code]
+            extra = _quantization.size if name == "int8" else 0
+            if len(data) == _header.size + extra + dim * ENCODING_DTYPES[name].itemsize:
+                return name
+    return ENCODING_LEGACY
+
+def decode_template(data: bytes) -> np.ndarray:
+    """Deserialize a template (any version, including legacy rows) to float32"""
+    encoding = template_encoding(data)
+    
+    if encoding == ENCODING_LEGACY:
+        return np.frombuffer(data, dtype=np.float32)
+    
+    offset = _header.size
+    if encoding != "int8":
+        return np.frombuffer(data, dtype=ENCODING_DTYPES[encoding], offset=offset).astype(np.float32)
+    
+    scale, zero_point = _quantization.unpack_from(data, offset)
+    quantized = np.frombuffer(data, dtype=np.int8, offset=offset + _quantization.size)
+    return ((quantized.astype(np.float32) - zero_point) * scale).astype(np.float32)
+
+def encrypt_embedding(embedding: np.ndarray, encoding: Optional[str] = None) -> bytes:
+    """Encode and encrypt a face embedding for storage"""
+    return cipher.encrypt(encode_template(embedding, encoding))
+
+def decrypt_embedding(encrypted_template: bytes) -> np.ndarray:
+    """Decrypt and decode a stored face embedding"""
+    return decode_template(cipher.decrypt(encrypted_template))
+
+def reencode_templates(
+    db: Session,
+    encoding: Optional[str] = None,
+    batch_size: int = 500,
+    template_type: str = "face"
+) -> Dict[str, int]:
+    """
+    Migrate stored templates to the given encoding in id-ordered batches,
+    committing after each batch so the job can be interrupted and resumed.
+    """
+    encoding = encoding or settings.BIOMETRIC_TEMPLATE_ENCODING
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown template encoding: {encoding}")
+    
+    stats = {"scanned": 0, "reencoded": 0, "bytes_before": 0, "bytes_after": 0}
+    last_id = 0
+    
+    while True:
+        batch = db.query(BiometricTemplate).filter(
+            BiometricTemplate.template_type == template_type,
+            BiometricTemplate.id > last_id
+        ).order_by(BiometricTemplate.id).limit(batch_size).all()
+        
+        if not batch:
+            break
+        
+        for template in batch:
+            stats["scanned"] += 1
+            stats["bytes_before"] += len(template.encrypted_template)
+            data = cipher.decrypt(template.encrypted_template)
+            
+            if template_encoding(data) != encoding:
+                template_bytes = encode_template(decode_template(data), encoding)
+                template.encrypted_template = cipher.encrypt(template_bytes)
+                template.template_hash = hashlib.sha256(template_bytes).hexdigest()
+                stats["reencoded"] += 1
+            
+            stats["bytes_after"] += len(template.encrypted_template)
+        
+        last_id = batch[-1].id
+        db.commit()
+        db.expunge_all()
+    
+    return stats
@@ -0,0 +1,92 @@
+"""
+Process pool for CPU-bound biometric work
+
+Image decoding, liveness and embedding extraction run in worker processes so
+they never block the event loop that serves auth and attendance requests.
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+
+class BiometricWorkerPool:
+    """
+    Wraps a ProcessPoolExecutor with backpressure: once max_pending jobs are
+    queued or running, new submissions are rejected with 503 instead of
+    piling up unbounded work behind the pool.
+    """
+    
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawn rather than fork: the API process is multi-threaded
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+    
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) in a worker process without blocking the event loop"""
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Biometric service is busy, please retry",
+                headers={"Retry-After": "1"}
+            )
+        
+        self._pending += 1
+        self.peak_pending = max(self.peak_pending, self._pending)
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._get_executor(), fn, *args)
+            self.completed += 1
+            return result
+        except HTTPException:
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._pending -= 1
+    
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting for a free worker"""
+        return max(0, self._pending - self.max_workers)
+    
+    def stats(self) -> Dict:
+        return {
+            "workers": self.max_workers,
+            "pending": self._pending,
+            "running": min(self._pending, self.max_workers),
+            "queue_depth": self.queue_depth,
+            "max_pending": self.max_pending,
+            "peak_pending": self.peak_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected
+        }
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Process-wide pool shared by the biometric and attendance endpoints
+biometric_pool = BiometricWorkerPool(settings.BIOMETRIC_WORKERS, settings.BIOMETRIC_MAX_PENDING)
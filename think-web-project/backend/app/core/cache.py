@@ -0,0 +1,74 @@
+"""
+Short-lived result cache
+
+TTLCache keeps computed results (dashboard counts, report aggregates) for a
+few seconds. Loads are single-flight: when an entry is missing or expired,
+one caller computes it while concurrent callers for the same key wait for
+that result instead of running the same query. invalidate() bumps a
+generation counter, so a load that was already running when the data changed
+still answers its own callers but is not stored.
+"""
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class TTLCache:
+    """Per-process cache of computed values with a TTL and single-flight loading"""
+    
+    def __init__(self, ttl_seconds: float, max_entries: int = 256):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (loaded_at, value)
+        self._loading: Dict[Hashable, threading.Lock] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+    
+    def _cached(self, key: Hashable, now: float):
+        entry = self._entries.get(key)
+        if entry and now - entry[0] < self.ttl:
+            self._entries.move_to_end(key)
+            return entry
+        return None
+    
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Cached value for key, calling loader() once on a miss"""
+        with self._lock:
+            entry = self._cached(key, time.monotonic())
+            if entry:
+                self.hits += 1
+                return entry[1]
+            flight = self._loading.setdefault(key, threading.Lock())
+        
+        with flight:
+            # Another caller may have loaded it while this one waited
+            with self._lock:
+                entry = self._cached(key, time.monotonic())
+                if entry:
+                    self.hits += 1
+                    return entry[1]
+                generation = self._generation
+            
+            loaded_at = time.monotonic()
+            value = loader()
+            with self._lock:
+                self.loads += 1
+                if generation == self._generation:
+                    self._entries[key] = (loaded_at, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                if self._loading.get(key) is flight:
+                    del self._loading[key]
+            return value
+    
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Drop one key, or every key when None"""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
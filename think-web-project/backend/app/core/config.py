@@ -35,10 +35,70 @@ class Settings(BaseSettings):
     
     # Biometric Settings
     FACE_RECOGNITION_MODEL_PATH: str = "./models/insightface"
+    FACE_EMBEDDING_STORE_DIR: str = ""  # Shared mmap store of plaintext embeddings, on an encrypted volume ("" = in-memory only)
     FINGERPRINT_SDK_PATH: str = "./sdk/fingerprint"
     BIOMETRIC_ENCRYPTION_KEY: str = "your-biometric-encryption-key-32-bytes-long!"
     FACE_MATCH_THRESHOLD: float = 0.6
     LIVENESS_THRESHOLD: float = 0.7
+    FACE_DUPLICATE_THRESHOLD: float = 0.85  # Same face enrolled under two employees
+    FACE_IDENTIFY_TOP_K: int = 5  # Candidates returned by 1:N identification
+    BIOMETRIC_TEMPLATE_ENCODING: str = "float16"  # float32, float16, int8
+    BIOMETRIC_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # Decrypted template cache (64MB)
+    BIOMETRIC_WORKERS: int = 2  # Worker processes for face analysis (0 = one per CPU)
+    BIOMETRIC_MAX_PENDING: int = 64  # Queued + running jobs before requests get 503
+    FACE_BATCH_MAX_SIZE: int = 16  # Probes coalesced into one extraction/scoring batch
+    FACE_BATCH_MAX_WAIT_MS: float = 5.0  # Max time the first probe waits for a batch to fill
+    FACE_INPUT_SIZE: int = 640  # Captures are downscaled so their longest side fits this
+    FINGERPRINT_MATCH_THRESHOLD: float = 0.25  # Minutiae match score (0-1)
+    FINGERPRINT_MIN_MINUTIAE: int = 12  # Fewer minutiae than this is too poor a capture
+    FINGERPRINT_MAX_TEMPLATES: int = 10  # Active fingerprint templates (fingers) per employee
+    FINGERPRINT_IDENTIFY_TOP_K: int = 5  # Candidates returned by 1:N fingerprint identification
+    
+    # Attendance
+    ATTENDANCE_SYNC_MAX_BATCH: int = 5000  # Punches accepted per device sync request
+    ATTENDANCE_MAX_CLOCK_SKEW_SECONDS: int = 300  # Device punches further in the future are rejected
+    PRESENCE_BACKEND: str = "memory"  # memory, redis (shared via REDIS_URL across workers)
+    SCHEDULE_SNAPSHOT_TTL_SECONDS: int = 300  # Max age of a cached day of schedules
+    GEOFENCE_ENFORCE: bool = False  # Reject check-ins outside the employee's fences (else only recorded)
+    GEOFENCE_INDEX_TTL_SECONDS: int = 300  # Max age of the in-memory fence index
+    ATTENDANCE_WRITE_BEHIND: bool = False  # Acknowledge punches from presence and commit them in groups
+    ATTENDANCE_WRITE_BEHIND_BATCH: int = 200  # Punches committed per grouped transaction
+    ATTENDANCE_WRITE_BEHIND_MAX_WAIT_MS: float = 50.0  # Max time a queued punch waits for its group
+    ATTENDANCE_WRITE_BEHIND_MAX_QUEUE: int = 10000  # Queued punches before check-ins get 503
+    ATTENDANCE_JOURNAL_DIR: Path = Path("./data/journal")  # One journal per worker, replayed after it exits; plus dead letters
+    ATTENDANCE_JOURNAL_FSYNC: bool = True  # fsync before acknowledging (False: survives process crash only)
+    ATTENDANCE_HOT_MONTHS: int = 3  # Months kept in attendance_records (current one included); older ones are archived
+    ATTENDANCE_ARCHIVE_DIR: Path = Path("./data/archive")  # Compressed per-month files of archived records
+    
+    # Analytics
+    DASHBOARD_CACHE_TTL_SECONDS: int = 10  # Max age of cached dashboard counts (writes invalidate sooner)
+    ANALYTICS_CACHE_TTL_SECONDS: int = 300  # Max age of cached report answers (cube refreshes invalidate sooner)
+    ANALYTICS_CLOSED_MONTH_TTL_SECONDS: int = 3600  # Max age of cached arrival columns of past months
+    ANALYTICS_HEATMAP_WARM_MONTHS: int = 12  # Past months kept warm for arrival heatmaps (0 disables)
+    
+    # Live events (Server-Sent Events)
+    EVENTS_CONNECTION_BUFFER: int = 256  # Messages buffered per connection before it is resynced
+    EVENTS_MAX_CONNECTIONS: int = 1000  # Open streams per worker before new ones get 503
+    EVENTS_COUNTER_DEBOUNCE_MS: float = 250.0  # Counter changes are coalesced over this window
+    EVENTS_KEEPALIVE_SECONDS: float = 15.0  # Comment line sent on idle streams
+    EVENTS_BACKEND: str = "memory"  # memory (one worker only), redis (fanned out to every worker via REDIS_URL)
+    DEVICE_OFFLINE_AFTER_SECONDS: int = 120  # Devices without a heartbeat for this long are offline
+    DEVICE_SWEEP_SECONDS: float = 30.0  # How often stale devices are marked offline
+    
+    # Anomaly detection
+    ANOMALY_DETECTION: bool = True  # Check committed punches and record findings in anomaly_detections
+    ANOMALY_WARMUP_DAYS: int = 30  # Check-ins that seed the per-employee statistics at startup
+    ANOMALY_FLUSH_SECONDS: float = 2.0  # Findings are written in one batch per interval
+    ANOMALY_BATCH_SIZE: int = 500  # ... or as soon as this many are pending
+    ANOMALY_MIN_HISTORY: int = 10  # Check-ins before an employee's usual hours are trusted
+    ANOMALY_HOURS_Z: float = 3.0  # Deviations from the usual check-in time that count as unusual
+    ANOMALY_HOURS_MIN_MINUTES: int = 90  # ... and never less than this far from it
+    ANOMALY_MAX_SPEED_KMH: float = 300.0  # Faster travel between two punches is impossible
+    ANOMALY_SITE_TRAVEL_MINUTES: int = 15  # Minimum time between punches at two different sites
+    ANOMALY_BUDDY_SECONDS: int = 20  # Two employees punching on one device this close together...
+    ANOMALY_BUDDY_DAYS: int = 3  # ... on this many days within ANOMALY_BUDDY_WINDOW_DAYS
+    ANOMALY_BUDDY_WINDOW_DAYS: int = 14
+    ANOMALY_CONFIDENCE_MARGIN: float = 0.05  # Accepted matches this close to the threshold are flagged
     
     # File Upload
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
@@ -0,0 +1,92 @@
+"""
+Device status tracking
+
+Devices report in through heartbeats (and implicitly through punch sync);
+DeviceMonitor marks devices that have been silent for
+DEVICE_OFFLINE_AFTER_SECONDS offline every DEVICE_SWEEP_SECONDS. Each status
+change is published to the live event stream.
+"""
+import asyncio
+from datetime import datetime, timedelta
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database.connection import SessionLocal
+from app.database.models import Device
+from app.core.events import broadcaster
+
+logger = logging.getLogger(__name__)
+
+def device_event(device: Device) -> Dict:
+    """Payload of a device status event"""
+    return {
+        "device_id": device.id,
+        "device_name": device.device_name,
+        "location": device.location,
+        "status": device.status,
+        "last_seen": device.last_seen
+    }
+
+def record_heartbeat(db: Session, device: Device, firmware_version: Optional[str] = None, ip_address: Optional[str] = None) -> bool:
+    """Mark a device seen now and commit; returns whether it came (back) online"""
+    came_online = device.status != "online"
+    device.last_seen = datetime.utcnow()
+    device.status = "online"
+    if firmware_version:
+        device.firmware_version = firmware_version
+    if ip_address:
+        device.ip_address = ip_address
+    db.commit()
+    if came_online:
+        broadcaster.publish("device", device_event(device))
+    return came_online
+
+def mark_stale_offline(db: Session, now: Optional[datetime] = None) -> List[Device]:
+    """Set online devices without a recent heartbeat offline, returning them"""
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=settings.DEVICE_OFFLINE_AFTER_SECONDS)
+    stale = db.query(Device).filter(
+        Device.status == "online",
+        or_(Device.last_seen.is_(None), Device.last_seen < cutoff)
+    ).all()
+    for device in stale:
+        device.status = "offline"
+    if stale:
+        events = [device_event(device) for device in stale]
+        db.commit()
+        for event in events:
+            broadcaster.publish("device", event)
+    return stale
+
+class DeviceMonitor:
+    """Background sweep that marks silent devices offline"""
+    
+    def __init__(self, interval_seconds: float):
+        self.interval = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            db = SessionLocal()
+            try:
+                mark_stale_offline(db)
+            except Exception:
+                db.rollback()
+                logger.exception("Device offline sweep failed")
+            finally:
+                db.close()
+
+# Process-wide monitor started and stopped with the app
+device_monitor = DeviceMonitor(settings.DEVICE_SWEEP_SECONDS)
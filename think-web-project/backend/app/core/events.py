@@ -0,0 +1,285 @@
+"""
+Live event stream for dashboards
+
+EventBroadcaster fans events out to every connected dashboard over
+Server-Sent Events (GET /api/v1/events/stream):
+
+- snapshot: the full dashboard counters, sent first on every connection
+- punch: a committed check-in or check-out, from the attendance endpoints
+  and device sync
+- counters: only the dashboard counters that changed, recomputed at most once
+  per EVENTS_COUNTER_DEBOUNCE_MS after attendance or leave writes, however
+  many dashboards are connected
+- device: a device going online or offline
+
+Each message is formatted once and shared by all connections. Every
+connection has a bounded buffer (EVENTS_CONNECTION_BUFFER messages); a client
+that falls that far behind has its backlog dropped and gets a fresh snapshot
+instead, so one slow browser never grows memory or delays the others.
+publish() may be called from worker threads; delivery happens on the loop.
+
+The in-process backend only reaches the dashboards connected to the worker
+that published. EVENTS_BACKEND=redis sends every event (and every "counters
+changed" signal) through a Redis pub/sub channel on REDIS_URL instead, and
+each worker delivers what it receives to its own connections, so the API can
+run several workers.
+"""
+import asyncio
+from datetime import date, datetime
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from app.core.config import settings
+from app.database.connection import SessionLocal, run_db
+from app.core.analytics.dashboard import cached_dashboard_counts, dashboard_listeners
+
+try:
+    import redis
+except ImportError:  # Only needed for EVENTS_BACKEND=redis
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+RETRY_MS = 3000  # Client reconnect delay announced to EventSource
+CLOSED = object()  # Ends a stream at shutdown
+COUNTERS_CHANGED = "counters_changed"  # Relayed signal, never sent to clients
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def format_event(event_id: Optional[int], event_type: str, data: Dict) -> str:
+    """One SSE message"""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event_type}")
+    lines.append("data: " + json.dumps(data, default=_json_value, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+def punch_event(event_type: str, employee_id: int, attendance_id: Optional[int], punched_at: datetime,
+                method: Optional[str] = None, device_id: Optional[int] = None, status: Optional[str] = None) -> Dict:
+    """Payload of a punch event"""
+    return {
+        "event_type": event_type,
+        "employee_id": employee_id,
+        "attendance_id": attendance_id,
+        "punched_at": punched_at,
+        "method": method,
+        "device_id": device_id,
+        "status": status
+    }
+
+class Subscription:
+    """One connection's bounded buffer of formatted messages"""
+    
+    def __init__(self, buffer_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.overflowed = False
+        self.dropped = 0
+    
+    def offer(self, message):
+        """Buffer a message; on overflow the backlog is replaced by a snapshot"""
+        if self.overflowed:
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.dropped += 1
+    
+    def resync(self):
+        """Discard the backlog once a snapshot is sent in its place"""
+        while not self.queue.empty():
+            if self.queue.get_nowait() is CLOSED:
+                self.queue.put_nowait(CLOSED)
+                break
+        self.overflowed = False
+
+class RedisEventRelay:
+    """Events shared by all workers through one Redis pub/sub channel"""
+    
+    def __init__(self, url: str, channel: str = "events"):
+        if redis is None:
+            raise RuntimeError("EVENTS_BACKEND=redis requires the redis package")
+        self._client = redis.Redis.from_url(url)
+        self.channel = channel
+        self._thread = None
+    
+    def start(self, receive: Callable[[str, Dict], None]):
+        """Call receive(event_type, data) from a listener thread for every relayed event"""
+        def handle(message):
+            event = json.loads(message["data"])
+            receive(event["type"], event["data"])
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: handle})
+        self._thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+    
+    def stop(self):
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread = None
+    
+    def send(self, event_type: str, data: Dict):
+        self._client.publish(self.channel, json.dumps({"type": event_type, "data": data}, default=_json_value, separators=(",", ":")))
+
+class EventBroadcaster:
+    """Fan-out of dashboard events to SSE connections"""
+    
+    def __init__(self, buffer_size: int, max_connections: int, counter_debounce_ms: float, relay: Optional[RedisEventRelay] = None):
+        self.buffer_size = buffer_size
+        self.max_connections = max_connections
+        self.counter_debounce = counter_debounce_ms / 1000.0
+        self.relay = relay
+        self._subscribers: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._next_id = 0
+        self._counters: Optional[Dict[str, int]] = None
+        self._counters_scheduled = False
+    
+    @property
+    def connections(self) -> int:
+        return len(self._subscribers)
+    
+    def start(self):
+        """Bind to the running loop; publishing is a no-op until then (e.g. in manage.py)"""
+        self._loop = asyncio.get_running_loop()
+        if self.relay is not None:
+            self.relay.start(self._received)
+    
+    def stop(self):
+        """End every open stream"""
+        if self.relay is not None:
+            self.relay.stop()
+        for subscription in list(self._subscribers):
+            subscription.resync()
+            subscription.offer(CLOSED)
+        self._loop = None
+    
+    def subscribe(self) -> Optional[Subscription]:
+        """New connection, or None when EVENTS_MAX_CONNECTIONS are open"""
+        if len(self._subscribers) >= self.max_connections:
+            return None
+        subscription = Subscription(self.buffer_size)
+        self._subscribers.add(subscription)
+        self._counters = None  # Counters were not tracked while nobody listened
+        return subscription
+    
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+    
+    def _call(self, callback, *args):
+        # Run on the loop thread, directly when already there
+        if self._loop is None:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+    
+    def publish(self, event_type: str, data: Dict):
+        """Send an event to every connection (thread-safe)"""
+        if self._loop is not None and self._relayed(event_type, data):
+            return
+        self._call(self._deliver, event_type, data)
+    
+    def _relayed(self, event_type: str, data: Dict) -> bool:
+        # Every worker, this one included, delivers the event when it comes back
+        if self.relay is None:
+            return False
+        try:
+            self.relay.send(event_type, data)
+            return True
+        except Exception:
+            logger.exception("Relaying a %s event failed; delivering it to this worker only", event_type)
+            return False
+    
+    def _received(self, event_type: str, data: Dict):
+        if event_type == COUNTERS_CHANGED:
+            self._call(self._schedule_counters)
+        else:
+            self._call(self._deliver, event_type, data)
+    
+    def _deliver(self, event_type: str, data: Dict):
+        if not self._subscribers:
+            return
+        self._next_id += 1
+        message = format_event(self._next_id, event_type, data)
+        for subscription in list(self._subscribers):
+            subscription.offer(message)
+    
+    def counters_changed(self):
+        """Attendance or leave data changed; recompute the counters shortly (thread-safe)"""
+        if self._loop is not None and self._relayed(COUNTERS_CHANGED, {}):
+            return
+        self._call(self._schedule_counters)
+    
+    def _schedule_counters(self):
+        if self._counters_scheduled or not self._subscribers:
+            return
+        self._counters_scheduled = True
+        loop = self._loop
+        loop.call_later(self.counter_debounce, lambda: loop.create_task(self._publish_counters()))
+    
+    async def _publish_counters(self):
+        self._counters_scheduled = False
+        if not self._subscribers:
+            return
+        try:
+            # The aggregate query runs off the loop where the pool allows
+            counters = await run_db(self.current_counters)
+        except Exception:
+            logger.exception("Recomputing dashboard counters for the event stream failed")
+            return
+        changed = {
+            name: value for name, value in counters.items()
+            if self._counters is None or self._counters.get(name) != value
+        }
+        self._counters = counters
+        if changed:
+            self._deliver("counters", changed)
+    
+    def current_counters(self) -> Dict[str, int]:
+        db = SessionLocal()
+        try:
+            return cached_dashboard_counts(db)
+        finally:
+            db.close()
+    
+    async def stream(self, subscription: Subscription, is_disconnected: Callable[[], Awaitable[bool]]) -> AsyncIterator[str]:
+        """SSE messages for one connection until the client leaves or the server stops"""
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            yield format_event(None, "snapshot", {"counters": await run_db(self.current_counters)})
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), settings.EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if message is CLOSED:
+                    break
+                if subscription.overflowed:
+                    # Too far behind: skip the backlog and start over from current state
+                    subscription.resync()
+                    yield format_event(None, "snapshot", {"counters": await run_db(self.current_counters), "resync": True})
+                    continue
+                yield message
+        finally:
+            self.unsubscribe(subscription)
+
+# Process-wide broadcaster shared by the events endpoint and the attendance/device write paths
+broadcaster = EventBroadcaster(
+    settings.EVENTS_CONNECTION_BUFFER,
+    max_connections=settings.EVENTS_MAX_CONNECTIONS,
+    counter_debounce_ms=settings.EVENTS_COUNTER_DEBOUNCE_MS,
+    relay=RedisEventRelay(settings.REDIS_URL) if settings.EVENTS_BACKEND == "redis" else None
+)
+dashboard_listeners.append(broadcaster.counters_changed)
@@ -0,0 +1,56 @@
+"""
+Keyset (cursor) pagination
+
+Listings ordered newest first page on a (timestamp, id) key instead of
+OFFSET: each page seeks past the last row of the previous one through a
+composite index, so page 5,000 costs the same as page 1. The cursor handed
+to clients is an opaque, URL-safe token for that last key.
+"""
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(key: Tuple[Any, int]) -> str:
+    """Opaque cursor for a (timestamp, id) key"""
+    value, row_id = key
+    raw = json.dumps([value.isoformat(), row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def decode_cursor(cursor: str, value_type: type) -> Tuple[Any, int]:
+    """Key from a cursor, raising 400 if it was not issued for this listing"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, row_id = json.loads(raw)
+        return value_type.fromisoformat(value), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_page(query: Query, order_column, id_column, cursor: Optional[str], limit: int, value_type: type = datetime) -> Tuple[List, Optional[str]]:
+    """
+    One page of query ordered by (order_column, id_column) descending, after
+    the cursor if given. Returns the rows and the cursor of the next page
+    (None on the last page).
+    """
+    if cursor:
+        query = query.filter(tuple_(order_column, id_column) < tuple_(*decode_cursor(cursor, value_type)))
+    
+    # One extra row tells whether another page follows without a COUNT
+    rows = query.order_by(order_column.desc(), id_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor((getattr(last, order_column.key), getattr(last, id_column.key)))
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    """Expose the next page's cursor without changing the list response body"""
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
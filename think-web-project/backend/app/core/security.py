@@ -55,18 +55,14 @@ def decode_token(token: str) -> Optional[Dict]:
     except JWTError:
         return None
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get current authenticated user"""
+def user_from_token(db: Session, token: str) -> User:
+    """Active user of an access token, raising 401/403 otherwise"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    token = credentials.credentials
     payload = decode_token(token)
     
     if payload is None:
@@ -90,6 +86,13 @@ async def get_current_user(
     
     return user
 
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> User:
+    """Get current authenticated user"""
+    return user_from_token(db, credentials.credentials)
+
 async def get_current_active_user(
     current_user: User = Depends(get_current_user)
 ) -> User:
@@ -0,0 +1,40 @@
+"""
+Upload ingestion
+
+Request bodies are read from the spooled upload in fixed-size chunks and
+rejected as soon as they pass MAX_UPLOAD_SIZE, so an oversized phone-camera
+capture never gets fully buffered in the API process.
+"""
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+
+from app.core.config import settings
+
+CHUNK_SIZE = 64 * 1024
+
+def _too_large(max_size: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Upload exceeds the {max_size // (1024 * 1024)}MB limit")
+
+async def read_upload(upload: UploadFile, max_size: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> bytes:
+    """Read an upload in chunks, raising 413 once it exceeds max_size"""
+    max_size = max_size or settings.MAX_UPLOAD_SIZE
+    try:
+        # Trust the declared size only to reject early, never to accept
+        if upload.size is not None and upload.size > max_size:
+            raise _too_large(max_size)
+        
+        chunks = []
+        received = 0
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            received += len(chunk)
+            if received > max_size:
+                raise _too_large(max_size)
+            chunks.append(chunk)
+        return b"".join(chunks)
+    finally:
+        # Drop the spooled temp file as soon as the bytes are in hand
+        await upload.close()
@@ -1,9 +1,10 @@
 """
 Database connection and session management
 """
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool, StaticPool
 
 from app.core.config import settings
 
@@ -23,8 +24,21 @@ else:
         echo=settings.DEBUG
     )
 
-# Create session factory
+# Long reads streamed to a client (exports) get a connection of their own;
+# the StaticPool one is shared by every request session on SQLite
+if settings.DATABASE_URL.startswith("sqlite"):
+    streaming_engine = create_engine(
+        settings.DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=NullPool,
+        echo=settings.DEBUG
+    )
+else:
+    streaming_engine = engine
+
+# Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+StreamingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=streaming_engine)
 
 def get_db() -> Session:
     """Dependency for getting database session"""
@@ -34,4 +48,10 @@ def get_db() -> Session:
     finally:
         db.close()
 
-
+async def run_db(function, *args, **kwargs):
+    """Run blocking database work off the event loop, except on SQLite"""
+    if engine.dialect.name == "sqlite":
+        # StaticPool shares one connection (and transaction) between every
+        # session, so its work must not interleave with the loop's handlers
+        return function(*args, **kwargs)
+    return await run_in_threadpool(function, *args, **kwargs)
@@ -0,0 +1,90 @@
+"""
+In-place schema upgrades for existing databases
+
+create_all() only creates missing tables, so columns added to existing
+tables are added here and backfilled in resumable batches.
+"""
+from typing import Dict
+
+from sqlalchemy import insert, inspect, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.database.models import AttendanceCubeDirtyDay, AttendanceRecord
+
+def add_check_in_date_column(engine: Engine) -> bool:
+    """Add attendance_records.check_in_date and its indexes if missing; True if the column was added"""
+    columns = {column["name"] for column in inspect(engine).get_columns(AttendanceRecord.__tablename__)}
+    added = False
+    with engine.begin() as connection:
+        if "check_in_date" not in columns:
+            connection.execute(text(f"ALTER TABLE {AttendanceRecord.__tablename__} ADD COLUMN check_in_date DATE"))
+            added = True
+        for index in AttendanceRecord.__table__.indexes:
+            if "check_in_date" in index.columns:
+                index.create(connection, checkfirst=True)
+    return added
+
+def require_check_in_date(engine: Engine) -> bool:
+    """Make check_in_date NOT NULL once every row is backfilled (PostgreSQL); True if applied"""
+    if engine.dialect.name != "postgresql":
+        return False  # SQLite cannot alter a column's nullability in place
+    with engine.begin() as connection:
+        if connection.execute(text(f"SELECT 1 FROM {AttendanceRecord.__tablename__} WHERE check_in_date IS NULL LIMIT 1")).first():
+            return False
+        connection.execute(text(f"ALTER TABLE {AttendanceRecord.__tablename__} ALTER COLUMN check_in_date SET NOT NULL"))
+    return True
+
+def add_geofence_columns(engine: Engine) -> bool:
+    """Add attendance_records.geofence_id/geofence_status if missing; True if any column was added"""
+    columns = {column["name"] for column in inspect(engine).get_columns(AttendanceRecord.__tablename__)}
+    missing = [(name, ddl) for name, ddl in (("geofence_id", "INTEGER"), ("geofence_status", "VARCHAR(20)")) if name not in columns]
+    with engine.begin() as connection:
+        for name, ddl in missing:
+            connection.execute(text(f"ALTER TABLE {AttendanceRecord.__tablename__} ADD COLUMN {name} {ddl}"))
+    return bool(missing)
+
+def dedupe_cube_dirty_days(engine: Engine) -> bool:
+    """Recreate the cube refresh queue with one row per date if it predates that; True if rebuilt"""
+    table = AttendanceCubeDirtyDay.__table__
+    columns = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    if "revision" in columns:
+        return False
+    with engine.begin() as connection:
+        # Queued dates carry over; their copies collapse into one row each
+        days = connection.execute(select(table.c.work_date).distinct()).scalars().all()
+        table.drop(connection)
+        table.create(connection)
+        if days:
+            connection.execute(insert(table), [{"work_date": day} for day in days])
+    return True
+
+def backfill_check_in_date(db: Session, batch_size: int = 5000) -> Dict[str, int]:
+    """
+    Populate check_in_date from check_in_time in id-ordered batches,
+    committing after each batch so the job can be interrupted and resumed.
+    """
+    stats = {"updated": 0, "batches": 0}
+    last_id = 0
+    
+    while True:
+        batch = db.query(AttendanceRecord.id, AttendanceRecord.check_in_time).filter(
+            AttendanceRecord.id > last_id,
+            AttendanceRecord.check_in_date.is_(None)
+        ).order_by(AttendanceRecord.id).limit(batch_size).all()
+        
+        if not batch:
+            break
+        
+        # Executemany UPDATE keyed by primary key
+        db.execute(update(AttendanceRecord), [
+            {"id": record_id, "check_in_date": check_in_time.date()}
+            for record_id, check_in_time in batch
+        ])
+        db.commit()
+        
+        last_id = batch[-1].id
+        stats["updated"] += len(batch)
+        stats["batches"] += 1
+    
+    return stats
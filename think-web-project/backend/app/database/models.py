@@ -1,9 +1,9 @@
 """
 Database Models (SQLAlchemy)
 """
-from sqlalchemy import Column, Integer, String, DateTime, Decimal, Boolean, ForeignKey, Text, LargeBinary, Date, Time, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Numeric, Boolean, ForeignKey, Text, LargeBinary, Date, Time, JSON, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 from datetime import datetime
 
 Base = declarative_base()
@@ -47,7 +47,7 @@ class Employee(Base):
     hire_date = Column(Date, nullable=False)
     employment_type = Column(String(50), default="permanent")
     status = Column(String(50), default="active")
-    salary = Column(Decimal(12, 2))
+    salary = Column(Numeric(12, 2))
     bank_account_number = Column(String(50))
     bank_name = Column(String(100))
     sss_number = Column(String(20))
@@ -107,7 +107,7 @@ class BiometricTemplate(Base):
     encrypted_template = Column(LargeBinary, nullable=False)
     template_hash = Column(String(64), nullable=False, index=True)
     device_id = Column(Integer, ForeignKey("devices.id"))
-    confidence_score = Column(Decimal(5, 2))
+    confidence_score = Column(Numeric(5, 2))
     enrolled_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -141,19 +141,31 @@ class Schedule(Base):
     is_rest_day = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+def _check_in_date_default(context):
+    """Work date for rows inserted through Core (bulk inserts) without one"""
+    return context.get_current_parameters()["check_in_time"].date()
+
 class AttendanceRecord(Base):
     __tablename__ = "attendance_records"
+    __table_args__ = (
+        # Check-in hot path and per-employee date ranges are a single index seek
+        Index("idx_attendance_employee_check_in_date", "employee_id", "check_in_date"),
+        # Keyset pagination seeks on (check_in_time, id), optionally per employee
+        Index("idx_attendance_check_in_time_id", "check_in_time", "id"),
+        Index("idx_attendance_employee_check_in_time_id", "employee_id", "check_in_time", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
     check_in_time = Column(DateTime, nullable=False, index=True)
+    check_in_date = Column(Date, nullable=False, index=True, default=_check_in_date_default)  # Work date of check_in_time
     check_out_time = Column(DateTime)
     method = Column(String(20), nullable=False)  # face, fingerprint, manual
     device_id = Column(Integer, ForeignKey("devices.id"))
-    location_lat = Column(Decimal(10, 8))
-    location_lng = Column(Decimal(11, 8))
-    confidence_score = Column(Decimal(5, 2))
-    liveness_score = Column(Decimal(5, 2))
+    location_lat = Column(Numeric(10, 8))
+    location_lng = Column(Numeric(11, 8))
+    confidence_score = Column(Numeric(5, 2))
+    liveness_score = Column(Numeric(5, 2))
     status = Column(String(20))  # on_time, late, early_departure
     minutes_late = Column(Integer, default=0)
     minutes_early = Column(Integer, default=0)
@@ -161,10 +173,126 @@ class AttendanceRecord(Base):
     is_override = Column(Boolean, default=False)
     override_reason = Column(Text)
     override_by = Column(Integer, ForeignKey("users.id"))
+    geofence_id = Column(Integer, ForeignKey("geofences.id"))  # Fence the check-in fell inside
+    geofence_status = Column(String(20))  # inside, outside, no_location, unrestricted
     created_at = Column(DateTime, default=datetime.utcnow)
     
     employee = relationship("Employee", back_populates="attendance_records")
     device = relationship("Device", back_populates="attendance_records")
+    
+    @validates("check_in_time")
+    def _sync_check_in_date(self, key, check_in_time):
+        # Keep the persisted work date in step with the timestamp
+        self.check_in_date = check_in_time.date() if check_in_time else None
+        return check_in_time
+
+class AttendanceDaily(Base):
+    __tablename__ = "attendance_daily"
+    __table_args__ = (
+        UniqueConstraint("employee_id", "work_date"),
+        Index("idx_attendance_daily_work_date", "work_date"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
+    work_date = Column(Date, nullable=False)
+    first_in = Column(DateTime, nullable=False)
+    last_out = Column(DateTime)  # Latest check-out of the day
+    worked_minutes = Column(Integer, default=0)  # Closed sessions only
+    late_minutes = Column(Integer, default=0)  # Of the day's first check-in
+    early_minutes = Column(Integer, default=0)  # Of the day's last check-out
+    status = Column(String(20))  # Of the day's first check-in: on_time, late
+    sessions = Column(Integer, default=0)
+    open_sessions = Column(Integer, default=0)  # Still clocked in
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class AttendanceCube(Base):
+    __tablename__ = "attendance_cube"
+    __table_args__ = (
+        # One cell per key; time-series reads scan a date range, optionally per department
+        UniqueConstraint("work_date", "department_id", "position_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    work_date = Column(Date, nullable=False)
+    department_id = Column(Integer, nullable=False, default=0)  # 0 = no department (derived table, no FK)
+    position_id = Column(Integer, nullable=False, default=0)  # 0 = no position
+    headcount = Column(Integer, default=0)  # Active employees
+    expected = Column(Integer, default=0)  # Scheduled to work and not on leave
+    attended = Column(Integer, default=0)  # Expected and present
+    present = Column(Integer, default=0)  # Checked in at all (rest days included)
+    late = Column(Integer, default=0)
+    late_minutes = Column(Integer, default=0)
+    worked_minutes = Column(Integer, default=0)
+    overtime_minutes = Column(Integer, default=0)  # Beyond the scheduled shift (all of it on rest days)
+    leave_days = Column(Numeric(8, 2), default=0)  # Approved leave
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class AttendanceCubeDirtyDay(Base):
+    __tablename__ = "attendance_cube_dirty_days"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    work_date = Column(Date, nullable=False, unique=True)  # Queued by the writer's transaction; drained on refresh
+    revision = Column(Integer, nullable=False, default=1)  # Bumped each time a write queues the date again
+
+class DevicePunch(Base):
+    __tablename__ = "device_punches"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    idempotency_key = Column(String(64), unique=True, nullable=False)  # Generated by the device
+    device_id = Column(Integer, ForeignKey("devices.id"))
+    employee_id = Column(Integer, ForeignKey("employees.id"))
+    event_type = Column(String(20), nullable=False)  # check_in, check_out
+    punched_at = Column(DateTime, nullable=False)  # Device clock (UTC)
+    method = Column(String(20))
+    status = Column(String(20), nullable=False)  # accepted, rejected
+    detail = Column(String(255))
+    attendance_record_id = Column(Integer, ForeignKey("attendance_records.id"))
+    received_at = Column(DateTime, default=datetime.utcnow)
+
+class AnomalyDetection(Base):
+    __tablename__ = "anomaly_detections"
+    __table_args__ = (
+        # Review queue: newest findings per status, and per employee
+        Index("idx_anomaly_status_created", "status", "created_at"),
+        Index("idx_anomaly_employee_created", "employee_id", "created_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    type = Column(String(50), nullable=False)  # buddy_punching, impossible_travel, unusual_hours, low_confidence
+    employee_id = Column(Integer, ForeignKey("employees.id"))
+    attendance_record_id = Column(Integer, ForeignKey("attendance_records.id"))  # Cleared when the record is archived
+    severity = Column(String(20))  # low, medium, high, critical
+    description = Column(Text)
+    status = Column(String(20), default="pending")  # pending, reviewed, resolved, false_positive
+    reviewed_by = Column(Integer, ForeignKey("users.id"))
+    reviewed_at = Column(DateTime)
+    resolution_notes = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class Geofence(Base):
+    __tablename__ = "geofences"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)
+    center_lat = Column(Numeric(10, 8), nullable=False)
+    center_lng = Column(Numeric(11, 8), nullable=False)
+    radius_meters = Column(Integer, nullable=False)  # Whole fence, or the circle enclosing its polygon
+    polygon = Column(JSON)  # Optional [[lat, lng], ...] outline inside the radius
+    department_id = Column(Integer, ForeignKey("departments.id"))  # Applies to the whole department
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class EmployeeGeofence(Base):
+    __tablename__ = "employee_geofences"
+    __table_args__ = (
+        UniqueConstraint("employee_id", "geofence_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    employee_id = Column(Integer, ForeignKey("employees.id", ondelete="CASCADE"), nullable=False)
+    geofence_id = Column(Integer, ForeignKey("geofences.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class LeaveType(Base):
     __tablename__ = "leave_types"
@@ -186,7 +314,7 @@ class LeaveRequest(Base):
     leave_type_id = Column(Integer, ForeignKey("leave_types.id"), nullable=False)
     start_date = Column(Date, nullable=False)
     end_date = Column(Date, nullable=False)
-    days_requested = Column(Decimal(4, 2), nullable=False)
+    days_requested = Column(Numeric(4, 2), nullable=False)
     reason = Column(Text)
     status = Column(String(20), default="pending")
     approved_by = Column(Integer, ForeignKey("users.id"))
@@ -211,24 +339,29 @@ class PayrollPeriod(Base):
 
 class PayrollRecord(Base):
     __tablename__ = "payroll_records"
+    __table_args__ = (
+        # Keyset pagination seeks on (period_start, id), optionally per employee
+        Index("idx_payroll_period_start_id", "period_start", "id"),
+        Index("idx_payroll_employee_period_start_id", "employee_id", "period_start", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
     payroll_period_id = Column(Integer, ForeignKey("payroll_periods.id"))
     period_start = Column(Date, nullable=False)
     period_end = Column(Date, nullable=False)
-    gross_pay = Column(Decimal(12, 2), nullable=False)
-    basic_salary = Column(Decimal(12, 2), nullable=False)
-    overtime_hours = Column(Decimal(5, 2), default=0)
-    overtime_pay = Column(Decimal(12, 2), default=0)
-    allowances = Column(Decimal(12, 2), default=0)
-    bonuses = Column(Decimal(12, 2), default=0)
-    tax = Column(Decimal(12, 2), default=0)
-    sss_contribution = Column(Decimal(12, 2), default=0)
-    philhealth_contribution = Column(Decimal(12, 2), default=0)
-    pagibig_contribution = Column(Decimal(12, 2), default=0)
-    other_deductions = Column(Decimal(12, 2), default=0)
-    net_pay = Column(Decimal(12, 2), nullable=False)
+    gross_pay = Column(Numeric(12, 2), nullable=False)
+    basic_salary = Column(Numeric(12, 2), nullable=False)
+    overtime_hours = Column(Numeric(5, 2), default=0)
+    overtime_pay = Column(Numeric(12, 2), default=0)
+    allowances = Column(Numeric(12, 2), default=0)
+    bonuses = Column(Numeric(12, 2), default=0)
+    tax = Column(Numeric(12, 2), default=0)
+    sss_contribution = Column(Numeric(12, 2), default=0)
+    philhealth_contribution = Column(Numeric(12, 2), default=0)
+    pagibig_contribution = Column(Numeric(12, 2), default=0)
+    other_deductions = Column(Numeric(12, 2), default=0)
+    net_pay = Column(Numeric(12, 2), nullable=False)
     status = Column(String(20), default="draft")
     generated_at = Column(DateTime, default=datetime.utcnow)
     approved_at = Column(DateTime)
@@ -6,15 +6,30 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 import uvicorn
+from datetime import date
 
 from app.core.config import settings
-from app.api.v1 import auth, employees, attendance, biometrics, payroll, leaves, schedules, analytics
-from app.database.connection import engine
+from app.api.v1 import auth, employees, attendance, biometrics, payroll, leaves, schedules, analytics, geofences, devices, events, anomalies
+from app.database.connection import engine, SessionLocal
 from app.database import models
+from app.database.migrations import add_geofence_columns, dedupe_cube_dirty_days
+from app.core.biometrics.workers import biometric_pool
+from app.core.analytics.anomaly_detection import anomaly_engine
+from app.core.analytics.heatmap import heatmap_warmer
+from app.core.attendance.presence import presence
+from app.core.attendance.rollup import rebuild_range
+from app.core.attendance.schedules import schedule_snapshot
+from app.core.attendance.write_behind import write_behind
+from app.core.devices import device_monitor
+from app.core.events import broadcaster
 
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
 
+# Schema changes since that need no backfill are applied in place
+add_geofence_columns(engine)
+dedupe_cube_dirty_days(engine)
+
 app = FastAPI(
     title="Think Web API",
     description="Employee Management & Payroll System with Biometric Attendance",
@@ -30,6 +45,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Trusted Host Middleware (for production)
@@ -48,6 +64,52 @@ app.include_router(payroll.router, prefix="/api/v1/payroll", tags=["Payroll"])
 app.include_router(leaves.router, prefix="/api/v1/leaves", tags=["Leaves"])
 app.include_router(schedules.router, prefix="/api/v1/schedules", tags=["Schedules"])
 app.include_router(analytics.router, prefix="/api/v1/analytics", tags=["Analytics"])
+app.include_router(geofences.router, prefix="/api/v1/geofences", tags=["Geofences"])
+app.include_router(devices.router, prefix="/api/v1/devices", tags=["Devices"])
+app.include_router(events.router, prefix="/api/v1/events", tags=["Events"])
+app.include_router(anomalies.router, prefix="/api/v1/anomalies", tags=["Anomalies"])
+
+@app.on_event("startup")
+async def startup():
+    # Live dashboard events and the device offline sweep run on this loop
+    broadcaster.start()
+    device_monitor.start()
+    
+    # Past months' arrival columns load in the background, not on the first heatmap request
+    heatmap_warmer.start()
+    
+    # Seed the anomaly statistics before any punch (including journal replays) is checked
+    if settings.ANOMALY_DETECTION:
+        db = SessionLocal()
+        try:
+            anomaly_engine.load(db)
+        finally:
+            db.close()
+        anomaly_engine.start()
+    
+    # Commit punches journaled before a crash, then start grouped commits
+    if settings.ATTENDANCE_WRITE_BEHIND:
+        write_behind.start()
+    
+    # Load today's presence and schedules once; later days load on rollover
+    db = SessionLocal()
+    try:
+        # The dashboard reads today's rollup; databases that predate it (or punches
+        # written before this deploy) have no attendance_daily rows for today yet
+        rebuild_range(db, date.today(), date.today())
+        presence.load(db)
+        schedule_snapshot.for_day(db, date.today())
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await write_behind.stop()
+    await anomaly_engine.stop()
+    device_monitor.stop()
+    heatmap_warmer.stop()
+    broadcaster.stop()
+    biometric_pool.shutdown()
 
 @app.get("/")
 async def root():
@@ -0,0 +1,180 @@
+"""
+Maintenance commands for the Think Web backend
+
+Usage:
+    python manage.py reencode-templates [--encoding float16] [--batch-size 500]
+    python manage.py sync-embedding-store [--rebuild]
+    python manage.py backfill-check-in-date [--batch-size 5000]
+    python manage.py revalidate-geofences [--start-date 2024-01-01] [--end-date 2024-12-31] [--batch-size 5000]
+    python manage.py rebuild-attendance-daily --start-date 2024-01-01 --end-date 2024-12-31 [--days-per-batch 7]
+    python manage.py archive-attendance [--before 2024-01-01] [--batch-size 5000]
+    python manage.py rebuild-analytics-cube --start-date 2024-01-01 --end-date 2024-12-31
+"""
+import argparse
+from datetime import date
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from sqlalchemy.orm import Session
+from app.database.connection import engine
+
+def reencode_templates(args):
+    """Re-encode stored biometric templates into the compact versioned format"""
+    from app.core.biometrics.templates import reencode_templates as run
+    
+    db = Session(engine)
+    try:
+        stats = run(db, encoding=args.encoding, batch_size=args.batch_size, template_type=args.template_type)
+        print(f"Scanned {stats['scanned']} templates, re-encoded {stats['reencoded']}")
+        print(f"Stored size: {stats['bytes_before']} -> {stats['bytes_after']} bytes")
+    except Exception as e:
+        db.rollback()
+        print(f"Error re-encoding templates: {e}")
+        raise
+    finally:
+        db.close()
+
+def sync_embedding_store(args):
+    """Bring the memory-mapped face embedding store in line with the database"""
+    from app.core.biometrics.embedding_store import default_store
+    
+    store = default_store()
+    if store is None:
+        print("FACE_EMBEDDING_STORE_DIR is not set; nothing to do")
+        return
+    
+    db = Session(engine)
+    try:
+        stats = store.sync(db, rebuild=args.rebuild)
+        print(f"Embedding store at {store.directory}: added {stats['added']}, removed {stats['removed']}, compacted {stats['compacted']}")
+    finally:
+        db.close()
+
+def backfill_check_in_date(args):
+    """Add the attendance columns added since (work date, geofence) if missing, then backfill the work date"""
+    from app.database.migrations import add_check_in_date_column, add_geofence_columns, backfill_check_in_date as run, require_check_in_date
+    
+    if add_check_in_date_column(engine):
+        print("Added attendance_records.check_in_date")
+    if add_geofence_columns(engine):
+        print("Added attendance_records geofence columns")
+    
+    db = Session(engine)
+    try:
+        stats = run(db, batch_size=args.batch_size)
+        print(f"Backfilled check_in_date for {stats['updated']} records in {stats['batches']} batches")
+    finally:
+        db.close()
+    
+    if require_check_in_date(engine):
+        print("attendance_records.check_in_date is now NOT NULL")
+
+def revalidate_geofences(args):
+    """Re-check stored check-in locations against the current geofences"""
+    from app.database.migrations import add_geofence_columns
+    from app.core.attendance.geofence import geofence_index, revalidate_records
+    
+    if add_geofence_columns(engine):
+        print("Added attendance_records geofence columns")
+    
+    db = Session(engine)
+    try:
+        stats = revalidate_records(db, geofence_index, args.start_date, args.end_date, batch_size=args.batch_size)
+        print(f"Checked {stats['checked']} records: {stats['inside']} inside, {stats['outside']} outside, "
+              f"{stats['no_location']} without location, {stats['unrestricted']} unrestricted")
+    finally:
+        db.close()
+
+def rebuild_attendance_daily(args):
+    """Recompute the daily attendance rollup for a date range from attendance records"""
+    from app.core.attendance.rollup import rebuild_range
+    
+    if args.start_date > args.end_date:
+        print("--start-date must not be after --end-date")
+        return
+    
+    db = Session(engine)
+    try:
+        stats = rebuild_range(db, args.start_date, args.end_date, days_per_batch=args.days_per_batch)
+        print(f"Rebuilt {stats['rows']} daily rows over {stats['days']} days")
+    finally:
+        db.close()
+
+def archive_attendance(args):
+    """Move closed months before the hot window out of attendance_records into the compressed archive"""
+    from app.core.attendance.archive import archive_months, attendance_archive
+    
+    db = Session(engine)
+    try:
+        stats = archive_months(db, attendance_archive, before=args.before, batch_size=args.batch_size)
+        print(f"Archived {stats['records']} records from {stats['months']} months to {attendance_archive.directory}")
+    except Exception as e:
+        db.rollback()
+        print(f"Error archiving attendance: {e}")
+        raise
+    finally:
+        db.close()
+
+def rebuild_analytics_cube(args):
+    """Recompute the department x position x day analytics cube for a date range"""
+    from app.core.analytics.cube import rebuild_cube_range
+    
+    if args.start_date > args.end_date:
+        print("--start-date must not be after --end-date")
+        return
+    
+    db = Session(engine)
+    try:
+        stats = rebuild_cube_range(db, args.start_date, args.end_date)
+        print(f"Rebuilt {stats['cells']} cube cells over {stats['days']} days")
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Think Web maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    reencode = subparsers.add_parser("reencode-templates", help=reencode_templates.__doc__)
+    reencode.add_argument("--encoding", choices=["float32", "float16", "int8"], default=None)
+    reencode.add_argument("--batch-size", type=int, default=500)
+    reencode.add_argument("--template-type", choices=["face"], default="face", help="Fingerprint templates use their own minutiae format")
+    reencode.set_defaults(func=reencode_templates)
+    
+    sync_store = subparsers.add_parser("sync-embedding-store", help=sync_embedding_store.__doc__)
+    sync_store.add_argument("--rebuild", action="store_true", help="Discard the store and rebuild it from scratch")
+    sync_store.set_defaults(func=sync_embedding_store)
+    
+    backfill_dates = subparsers.add_parser("backfill-check-in-date", help=backfill_check_in_date.__doc__)
+    backfill_dates.add_argument("--batch-size", type=int, default=5000)
+    backfill_dates.set_defaults(func=backfill_check_in_date)
+    
+    revalidate = subparsers.add_parser("revalidate-geofences", help=revalidate_geofences.__doc__)
+    revalidate.add_argument("--start-date", type=date.fromisoformat, default=None)
+    revalidate.add_argument("--end-date", type=date.fromisoformat, default=None)
+    revalidate.add_argument("--batch-size", type=int, default=5000)
+    revalidate.set_defaults(func=revalidate_geofences)
+    
+    rebuild_daily = subparsers.add_parser("rebuild-attendance-daily", help=rebuild_attendance_daily.__doc__)
+    rebuild_daily.add_argument("--start-date", type=date.fromisoformat, required=True)
+    rebuild_daily.add_argument("--end-date", type=date.fromisoformat, required=True)
+    rebuild_daily.add_argument("--days-per-batch", type=int, default=7)
+    rebuild_daily.set_defaults(func=rebuild_attendance_daily)
+    
+    archive = subparsers.add_parser("archive-attendance", help=archive_attendance.__doc__)
+    archive.add_argument("--before", type=date.fromisoformat, default=None, help="Only archive months before this date's month")
+    archive.add_argument("--batch-size", type=int, default=5000, help="Records deleted per transaction")
+    archive.set_defaults(func=archive_attendance)
+    
+    rebuild_cube = subparsers.add_parser("rebuild-analytics-cube", help=rebuild_analytics_cube.__doc__)
+    rebuild_cube.add_argument("--start-date", type=date.fromisoformat, required=True)
+    rebuild_cube.add_argument("--end-date", type=date.fromisoformat, required=True)
+    rebuild_cube.set_defaults(func=rebuild_analytics_cube)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
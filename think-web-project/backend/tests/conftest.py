@@ -0,0 +1,61 @@
+"""
+Shared test setup
+
+Settings are read when the app is imported, so the database is pointed at a
+scratch SQLite file before anything from app/ is loaded.
+"""
+from itertools import count
+import os
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+
+_scratch = tempfile.mkdtemp(prefix="thinkweb-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_scratch}/test.db")
+os.environ.setdefault("ATTENDANCE_ARCHIVE_DIR", os.path.join(_scratch, "archive"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.database.connection import SessionLocal
+from app.database.models import Employee, User
+from app.core.security import create_access_token
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def client():
+    # Entering the client runs the app's startup and shutdown handlers
+    with TestClient(app) as test_client:
+        yield test_client
+
+@pytest.fixture
+def auth_headers(db):
+    user = User(username="test-admin", email="test-admin@example.com", password_hash="x", role="super_admin")
+    db.add(user)
+    db.commit()
+    yield {"Authorization": "Bearer " + create_access_token({"sub": str(user.id), "role": user.role})}
+    db.delete(user)
+    db.commit()
+
+_employee_numbers = count(1)
+
+@pytest.fixture
+def employee(db):
+    number = next(_employee_numbers)
+    employee = Employee(
+        employee_id=f"T{number:03d}", first_name="Test", last_name="Employee",
+        email=f"t{number:03d}@example.com", hire_date=date(2020, 1, 1)
+    )
+    db.add(employee)
+    db.commit()
+    return employee
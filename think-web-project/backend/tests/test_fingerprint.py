@@ -0,0 +1,42 @@
+"""
+Minutiae matching against synthetic captures
+"""
+import numpy as np
+
+from app.core.config import settings
+from app.core.biometrics.fingerprint import (
+    decode_minutiae, decrypt_minutiae, distort_minutiae, encode_minutiae, encrypt_minutiae,
+    match_scores, pad_minutiae, synthetic_minutiae
+)
+
+def _score(probe, template):
+    return float(match_scores(probe, *pad_minutiae([template]))[0])
+
+def test_rotated_and_translated_capture_matches():
+    finger = synthetic_minutiae(7)
+    probe = distort_minutiae(finger, seed=11, rotation=20.0, shift=60.0)
+    assert _score(probe, finger) >= settings.FINGERPRINT_MATCH_THRESHOLD
+
+def test_other_finger_does_not_match():
+    finger = synthetic_minutiae(7)
+    for seed in range(100, 110):
+        impostor = distort_minutiae(synthetic_minutiae(seed), seed=seed + 1)
+        assert _score(impostor, finger) < settings.FINGERPRINT_MATCH_THRESHOLD
+
+def test_genuine_scores_above_impostors_in_one_call():
+    fingers = [synthetic_minutiae(seed) for seed in range(20)]
+    probe = distort_minutiae(fingers[13], seed=3)
+    scores = match_scores(probe, *pad_minutiae(fingers))
+    assert int(np.argmax(scores)) == 13
+
+def test_template_round_trip():
+    finger = synthetic_minutiae(5)
+    decoded = decode_minutiae(encode_minutiae(finger))
+    assert decoded.shape == finger.shape
+    # Positions are stored to the pixel, angles to 1/256 of a turn
+    assert np.abs(decoded[:, :2] - np.round(finger[:, :2])).max() == 0
+    angle_error = np.abs(np.angle(np.exp(1j * (decoded[:, 2] - finger[:, 2]))))
+    assert angle_error.max() <= np.pi / 256 + 1e-6
+    assert np.array_equal(decoded[:, 3:], np.round(finger[:, 3:]))
+    assert np.array_equal(decrypt_minutiae(encrypt_minutiae(finger)), decoded)
+    assert _score(decoded, finger) >= settings.FINGERPRINT_MATCH_THRESHOLD
@@ -0,0 +1,52 @@
+"""
+Device punch sync idempotency
+"""
+from datetime import datetime, timedelta
+
+from app.database.models import AttendanceRecord, DevicePunch
+
+def _batch(employee_id: int) -> dict:
+    now = datetime.utcnow().replace(microsecond=0)
+    return {"punches": [
+        {
+            "idempotency_key": f"kiosk-{employee_id}-in",
+            "employee_id": employee_id,
+            "event_type": "check_in",
+            "timestamp": (now - timedelta(hours=2)).isoformat(),
+            "method": "manual"
+        },
+        {
+            "idempotency_key": f"kiosk-{employee_id}-out",
+            "employee_id": employee_id,
+            "event_type": "check_out",
+            "timestamp": (now - timedelta(hours=1)).isoformat(),
+            "method": "manual"
+        }
+    ]}
+
+def test_resent_batch_is_a_no_op(client, auth_headers, employee, db):
+    batch = _batch(employee.id)
+    
+    first = client.post("/api/v1/attendance/sync", json=batch, headers=auth_headers)
+    assert first.status_code == 200
+    assert (first.json()["accepted"], first.json()["rejected"], first.json()["replayed"]) == (2, 0, 0)
+    
+    second = client.post("/api/v1/attendance/sync", json=batch, headers=auth_headers)
+    assert second.status_code == 200
+    assert (second.json()["accepted"], second.json()["rejected"], second.json()["replayed"]) == (0, 0, 2)
+    
+    # Replays answer with the original outcome and write nothing
+    assert [result["attendance_id"] for result in second.json()["results"]] == [result["attendance_id"] for result in first.json()["results"]]
+    assert all(result["status"] == "accepted" for result in second.json()["results"])
+    records = db.query(AttendanceRecord).filter(AttendanceRecord.employee_id == employee.id).all()
+    assert len(records) == 1
+    assert records[0].check_out_time is not None
+    assert db.query(DevicePunch).filter(DevicePunch.employee_id == employee.id).count() == 2
+
+def test_duplicate_key_within_a_batch_is_a_replay(client, auth_headers, employee):
+    batch = _batch(employee.id)
+    batch["punches"].append(dict(batch["punches"][0]))
+    
+    body = client.post("/api/v1/attendance/sync", json=batch, headers=auth_headers).json()
+    assert (body["accepted"], body["replayed"]) == (2, 1)
+    assert body["results"][2]["attendance_id"] == body["results"][0]["attendance_id"]